@@ -0,0 +1,372 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import multiprocessing
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from checkpoint import CheckpointReader, CheckpointWriter
+from generators import CQGenerator, SPARQLOWLGenerator, load_json
+from make_dataset import generate_records, read_rows
+from near_duplicates import NearDuplicateDetector
+from serializer import Serializer, output_formats
+from summarizer import Summarizer
+from verbalization_analyzer import Analyzer
+
+# Benchmarks of the stages of dataset generation on synthetic inputs scaled from the published ones. Every stage
+# is run `--repeat` times and once more in a forked process, under tracemalloc and with its resident set size
+# (including native allocations and worker processes) recorded to measure its peak memory; results are written to a
+# JSON file, which `--compare` checks against the results of another commit.
+
+placeholder_pattern = re.compile(r'\b(c|op|dp|dt|i)([1-9])\b')
+resource_files = ['cq_general_templates_spo.json', 'cq_general_templates_spo_equivalence.json',
+                  'cq_general_templates_subclass.json', 'cq_general_templates_equivalence.json']
+
+
+def make_synthetic_inputs(input_path: str, resources_path: str, out_folder: str, rows_factor: int = 1,
+                          synonyms_factor: int = 1, seed: int = 0) -> Tuple[str, str]:
+    ''' Write a copy of the input file with `rows_factor` times as many rows and a copy of the resources with
+    `synonyms_factor` times as many synonyms in every synonym class; return paths of both.
+
+    Rows are copied with their single digit placeholders renumbered (c1 -> c7, ...), which keeps their axiom
+    shapes. The analyzer parses every canonical shape once (placeholders are renamed in the order of their first
+    occurrence), so the copies add rows to every stage but no parsed shapes; `Inputs.distinct_shapes` is reported
+    next to the number of rows. Every synonym `word` gets the variants `word2`, `word3`, ...; note that the number
+    of expansions of a template grows with the power of the number of its synsets. '''
+    rng = random.Random(seed)
+    os.makedirs(out_folder, exist_ok=True)
+    rows_path = os.path.join(out_folder, 'verbalization2turtle.csv')
+    with open(input_path) as f:
+        rows = list(csv.reader(f))
+    with open(rows_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for copy in range(rows_factor):
+            renumbering = {kind: [None] + rng.sample(range(1, 10), 9) if copy else list(range(10))
+                           for kind in ['c', 'op', 'dp', 'dt', 'i']}
+
+            def renumber(matched) -> str:
+                return matched.group(1) + str(renumbering[matched.group(1)][int(matched.group(2))])
+            for row in rows:
+                writer.writerow([row[0], placeholder_pattern.sub(renumber, row[1]),
+                                 placeholder_pattern.sub(renumber, row[2])] + row[3:])
+
+    synthetic_resources = os.path.join(out_folder, 'resources')
+    os.makedirs(synthetic_resources, exist_ok=True)
+    for name in resource_files:
+        shutil.copy(os.path.join(resources_path, name), synthetic_resources)
+    synonyms = load_json(os.path.join(resources_path, 'synonym_classes.json'))
+    synonyms = {synset: words + [f'{word}{variant}' for variant in range(2, synonyms_factor + 1) for word in words]
+                for synset, words in synonyms.items()}
+    with open(os.path.join(synthetic_resources, 'synonym_classes.json'), 'w') as f:
+        json.dump(synonyms, f, indent=4)
+    return rows_path, synthetic_resources
+
+
+class Inputs:
+    ''' Synthetic inputs of the benchmarks; analyzed shapes and records are computed on first use. '''
+    def __init__(self, rows_path: str, resources_path: str, folder: str, workers: int = 1):
+        self.rows = list(read_rows(rows_path))
+        self.resources_path = resources_path
+        self.folder = folder
+        self.workers = workers
+        self._cq_generator = None
+        self._analyzed_shapes = None
+        self._records = None
+
+    def make_cq_generator(self) -> CQGenerator:
+        return CQGenerator(
+            spo_transformations_path=f'{self.resources_path}/cq_general_templates_spo.json',
+            spo_transformations_equivalence_path=f'{self.resources_path}/cq_general_templates_spo_equivalence.json',
+            subclass_transformations_path=f'{self.resources_path}/cq_general_templates_subclass.json',
+            equivalence_transformations_path=f'{self.resources_path}/cq_general_templates_equivalence.json',
+            synonyms_path=f'{self.resources_path}/synonym_classes.json')
+
+    @property
+    def cq_generator(self) -> CQGenerator:
+        if self._cq_generator is None:
+            self._cq_generator = self.make_cq_generator()
+        return self._cq_generator
+
+    @property
+    def distinct_shapes(self) -> int:
+        ''' Number of distinct canonical shapes of the rows, i.e. of verbalizations parsed by spaCy. '''
+        analyzer = Analyzer()
+        return len({analyzer.canonicalize(verbalization)[0] for verbalization, _ in self.rows})
+
+    @property
+    def analyzed_shapes(self) -> List[Dict[str, Any]]:
+        if self._analyzed_shapes is None:
+            self._analyzed_shapes = Analyzer().process_many([verbalization for verbalization, _ in self.rows])
+        return self._analyzed_shapes
+
+    @property
+    def records(self) -> List[Tuple[str, Dict[str, List[str]], Dict[str, Any]]]:
+        if self._records is None:
+            records = []  # cached only once all are made, so that a failure is not cached as no records
+            for (verbalization, axiom_shape), analyzed_shape in zip(self.rows, self.analyzed_shapes):
+                cqs = self.cq_generator.make_cqs(verbalization, analyzed_shape)
+                for category in cqs:
+                    cqs[category] = self.cq_generator.paraphrase_cqs(cqs[category])
+                records.append((verbalization, cqs, SPARQLOWLGenerator.make_queries(axiom_shape, analyzed_shape)))
+            self._records = records
+        return self._records
+
+
+def bench_synonyms(inputs: Inputs) -> int:
+    ''' Expansion of all CQ templates with synonyms (building a CQGenerator); items are expanded templates. '''
+    generator = inputs.make_cq_generator()
+    return sum(len(templates) for expansions in [generator.spo_expansions, generator.subclass_expansions,
+                                                 generator.spo_equivalence_expansions,
+                                                 generator.equivalence_expansions]
+               for templates in expansions.values())
+
+
+def bench_analyzer(inputs: Inputs) -> int:
+    ''' Parsing of verbalizations with a fresh Analyzer (without the persistent cache); items are rows, of which
+    only the distinct shapes are parsed. '''
+    return len(Analyzer().process_many([verbalization for verbalization, _ in inputs.rows]))
+
+
+def bench_cq_generator(inputs: Inputs) -> int:
+    ''' CQs and their paraphrases of analyzed rows; items are CQs. '''
+    generator = inputs.cq_generator
+    count = 0
+    for (verbalization, _), analyzed_shape in zip(inputs.rows, inputs.analyzed_shapes):
+        cqs = generator.make_cqs(verbalization, analyzed_shape)
+        count += sum(len(generator.paraphrase_cqs(category_cqs)) for category_cqs in cqs.values())
+    return count
+
+
+def bench_sparql_generator(inputs: Inputs) -> int:
+    ''' SPARQL-OWL queries of analyzed rows; items are rows. '''
+    for (_, axiom_shape), analyzed_shape in zip(inputs.rows, inputs.analyzed_shapes):
+        SPARQLOWLGenerator.make_queries(axiom_shape, analyzed_shape)
+    return len(inputs.rows)
+
+
+def make_bench_serializer(output_format: str) -> Callable[[Inputs], int]:
+    def bench_serializer(inputs: Inputs) -> int:
+        ''' Serialization of all records; items are records. '''
+        out_folder = tempfile.mkdtemp(dir=inputs.folder)
+        try:
+            Serializer(out_folder, output_format).serialize_result(inputs.records)
+        finally:
+            shutil.rmtree(out_folder)
+        return len(inputs.records)
+    return bench_serializer
+
+
+def bench_checkpoint(inputs: Inputs) -> int:
+    ''' Writing all records with their analyzed shapes to a checkpoint and reading them back; items are records. '''
+    path = os.path.join(inputs.folder, 'records.checkpoint')
+    try:
+        with CheckpointWriter(path) as writer:
+            for record, analyzed_shape in zip(inputs.records, inputs.analyzed_shapes):
+                writer.add(record, analyzed_shape)
+        for _ in CheckpointReader(path).items():
+            pass
+    finally:
+        os.remove(path)
+    return len(inputs.records)
+
+
+def bench_near_duplicates(inputs: Inputs) -> int:
+    ''' Clustering near-duplicates among all CQs of all records; items are CQs. '''
+    detector = NearDuplicateDetector()
+    cqs = 0
+    for _, record_cqs, _ in inputs.records:
+        for category_cqs in record_cqs.values():
+            detector.prune(category_cqs)
+            cqs += len(category_cqs)
+    return cqs
+
+
+def bench_summarizer(inputs: Inputs) -> int:
+    ''' Statistics of all records; items are records. '''
+    summarizer = Summarizer(inputs.records)
+    summarizer.average_queries_per_cq()
+    summarizer.average_cqs_per_query()
+    summarizer.calc_number_of_unique_cqs_per_category()
+    summarizer.calc_number_of_unique_queries_per_category()
+    return len(inputs.records)
+
+
+def bench_end_to_end(inputs: Inputs) -> int:
+    ''' The whole build of make_dataset.py (json output, without the persistent cache); items are rows. '''
+    out_folder = tempfile.mkdtemp(dir=inputs.folder)
+    try:
+        serializer = Serializer(out_folder)
+        summarizer = Summarizer()
+        for record in generate_records(inputs.rows, inputs.resources_path, workers=inputs.workers):
+            serializer.add(record)
+            summarizer.add(record)
+        serializer.close()
+    finally:
+        shutil.rmtree(out_folder)
+    return len(inputs.rows)
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[Inputs], int]
+    # parts of the inputs computed before the stage is measured
+    prepare: Optional[Callable[[Inputs], Any]] = None
+
+
+stages = [
+    Stage('synonyms', bench_synonyms),
+    Stage('analyzer', bench_analyzer),
+    Stage('cq_generator', bench_cq_generator, lambda inputs: (inputs.cq_generator, inputs.analyzed_shapes)),
+    Stage('sparql_generator', bench_sparql_generator, lambda inputs: inputs.analyzed_shapes),
+    *[Stage(f'serializer_{output_format}', make_bench_serializer(output_format), lambda inputs: inputs.records)
+      for output_format in output_formats],
+    Stage('checkpoint', bench_checkpoint, lambda inputs: (inputs.records, inputs.analyzed_shapes)),
+    Stage('near_duplicates', bench_near_duplicates, lambda inputs: inputs.records),
+    Stage('summarizer', bench_summarizer, lambda inputs: inputs.records),
+    Stage('end_to_end', bench_end_to_end),
+]
+
+
+def max_rss_mb(who: int) -> float:
+    ''' Peak resident set size of this process or of its waited-for children (`resource.RUSAGE_*`). '''
+    return resource.getrusage(who).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def run_traced(stage: Stage, inputs: Inputs, connection):
+    ''' Run a stage in a forked process and send its peak memory: traced Python allocations, the growth of the
+    resident set size of the process (which starts with the memory of the benchmark) and the peak resident set
+    size of its worker processes. '''
+    try:
+        start_rss = max_rss_mb(resource.RUSAGE_SELF)
+        tracemalloc.start()
+        stage.run(inputs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        connection.send({'peak_memory_mb': peak / 2 ** 20,
+                         'peak_rss_mb': max_rss_mb(resource.RUSAGE_SELF) - start_rss,
+                         'workers_peak_rss_mb': max_rss_mb(resource.RUSAGE_CHILDREN)})
+    except Exception as e:
+        connection.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        connection.close()
+
+
+def measure(stage: Stage, inputs: Inputs, repeat: int) -> Dict[str, Any]:
+    ''' Median and minimum time of `repeat` runs, throughput and peak memory (of one more run) of a stage. '''
+    if stage.prepare is not None:
+        stage.prepare(inputs)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = stage.run(inputs)
+        times.append(time.perf_counter() - start)
+    # a fresh process, as the peak resident set size of a process can not be reset
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_traced, args=(stage, inputs, sender))
+    process.start()
+    sender.close()
+    memory = receiver.recv()
+    process.join()
+    if 'error' in memory:
+        raise RuntimeError(f'{stage.name} failed while its memory was measured: {memory["error"]}')
+    median = statistics.median(times)
+    return {'items': items, 'median_seconds': median, 'min_seconds': min(times),
+            'items_per_second': items / median if median > 0 else None, **memory}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float):
+    ''' Print time and memory of every stage relative to the baseline results, flagging regressions. '''
+    print(f'Compared with {baseline["commit"]}:')
+    differing = [name for name, value in results['parameters'].items()
+                 if name != 'repeat' and baseline['parameters'].get(name) != value]
+    if differing:
+        print(f'  warning: runs differ in {", ".join(differing)}, so their times are not comparable')
+    for name, result in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if 'error' in result or previous is None or 'error' in previous:
+            continue
+        time_ratio = result['median_seconds'] / max(previous['median_seconds'], 1e-9)
+        memory_ratio = result['peak_memory_mb'] / max(previous['peak_memory_mb'], 1e-9)
+        # results of older commits have no resident set sizes
+        rss = result['peak_rss_mb'] + result['workers_peak_rss_mb']
+        previous_rss = previous.get('peak_rss_mb', 0) + previous.get('workers_peak_rss_mb', 0)
+        rss_ratio = rss / max(previous_rss, 1) if 'peak_rss_mb' in previous else 1.0
+        flag = ' REGRESSION' if max(time_ratio, memory_ratio, rss_ratio) > 1 + threshold else ''
+        print(f'  {name:20} time x{time_ratio:.2f}, peak memory x{memory_ratio:.2f}, peak RSS x{rss_ratio:.2f}{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of dataset generation.')
+    parser.add_argument('--input', default='../verbalization2turtle.csv')
+    parser.add_argument('--resources', default='./statements_to_cqs_transformations/')
+    parser.add_argument('--rows-factor', type=int, default=1, help='number of copies of the input rows')
+    parser.add_argument('--synonyms-factor', type=int, default=1,
+                        help='number of variants of every synonym (expansions grow with its power)')
+    parser.add_argument('--stages', nargs='+', choices=[stage.name for stage in stages], default=None,
+                        help='stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of every stage')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes of end_to_end')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='JSON file with the results (default: benchmark_<commit>.json)')
+    parser.add_argument('--compare', default=None, help='JSON file with results of another commit')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+               'parameters': {'rows_factor': args.rows_factor, 'synonyms_factor': args.synonyms_factor,
+                              'repeat': args.repeat, 'workers': args.workers, 'seed': args.seed},
+               'inputs': dict(), 'stages': dict()}
+    with tempfile.TemporaryDirectory() as folder:
+        rows_path, resources_path = make_synthetic_inputs(args.input, args.resources, folder, args.rows_factor,
+                                                          args.synonyms_factor, args.seed)
+        inputs = Inputs(rows_path, resources_path, folder, args.workers)
+        results['inputs'] = {'rows': len(inputs.rows), 'distinct_parsed_shapes': inputs.distinct_shapes}
+        print(f'{len(inputs.rows)} rows ({results["inputs"]["distinct_parsed_shapes"]} distinct parsed shapes), '
+              f'commit {commit}')
+        for stage in stages:
+            if args.stages is not None and stage.name not in args.stages:
+                continue
+            try:
+                result = measure(stage, inputs, args.repeat)
+            except ImportError as e:  # e.g. pyarrow is not installed
+                result = {'error': str(e)}
+                print(f'{stage.name:20} skipped: {e}')
+            else:
+                print(f'{stage.name:20} {result["median_seconds"]:9.3f} s  {result["items_per_second"] or 0:12.0f} '
+                      f'items/s  {result["peak_memory_mb"]:9.1f} MB peak  {result["peak_rss_mb"]:9.1f} MB RSS  '
+                      f'{result["workers_peak_rss_mb"]:9.1f} MB workers RSS')
+            results['stages'][stage.name] = result
+
+    output = args.output or f'benchmark_{commit}.json'
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Results written to {output}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f), args.threshold)
+
+
+if __name__ == '__main__':
+    main()
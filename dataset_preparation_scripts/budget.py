@@ -0,0 +1,45 @@
+from typing import Dict, List, Optional, Tuple
+
+# Budgets bound the number of CQs of the generated dataset. Counts of CQs every row would get (estimated by
+# `CQGenerator.count_cqs`) are split into quotas so that all rows sharing a query or a question type get an equal
+# share of its budget, and rows then sample their quotas of CQs (`CQGenerator.sample_cqs`).
+
+
+def water_fill(sizes: List[int], budget: int) -> List[int]:
+    ''' Split the budget into equal quotas of at most the given sizes; quotas of smaller sizes are filled up and the
+    rest of their share is split among the others. The quotas sum up to `min(budget, sum(sizes))`. '''
+    quotas = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=sizes.__getitem__)
+    for position, idx in enumerate(order):
+        quotas[idx] = min(sizes[idx], remaining // (len(order) - position))
+        remaining -= quotas[idx]
+    return quotas
+
+
+def plan_quotas(estimates: List[Dict[str, Tuple[int, Optional[str]]]], max_cqs_per_query: Optional[int] = None,
+                max_cqs_per_type: Optional[int] = None) -> List[Dict[str, int]]:
+    ''' Quotas of CQs of every row and question type, given the number of CQs and the query of each of them.
+    Question types whose estimated CQs all fit into the budgets get no quota and are generated fully. '''
+    caps = [{question_type: count for question_type, (count, _) in row.items()} for row in estimates]
+    groups = []
+    if max_cqs_per_query is not None:
+        by_query = dict()
+        for position, row in enumerate(estimates):
+            for question_type, (_, query) in row.items():
+                if query:  # CQs without a query are not written anyway
+                    by_query.setdefault(query, []).append((position, question_type))
+        groups += [(cells, max_cqs_per_query) for cells in by_query.values()]
+    if max_cqs_per_type is not None:
+        by_type = dict()
+        for position, row in enumerate(estimates):
+            for question_type in row:
+                by_type.setdefault(question_type, []).append((position, question_type))
+        groups += [(cells, max_cqs_per_type) for cells in by_type.values()]
+
+    for cells, budget in groups:
+        quotas = water_fill([caps[position][question_type] for position, question_type in cells], budget)
+        for (position, question_type), quota in zip(cells, quotas):
+            caps[position][question_type] = quota
+    return [{question_type: cap for question_type, cap in row_caps.items() if cap < row[question_type][0]}
+            for row, row_caps in zip(estimates, caps)]
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+from shape_cache import file_hash, package_version
+
+# modules whose code decides how a row is turned into CQs and queries
+code_files = ['make_dataset.py', 'verbalization_analyzer.py', 'shape_cache.py', 'generators.py',
+              'synonymes_generator.py', 'budget.py']
+# templates used for rows that are (True) or are not (False) equivalences
+template_files = {
+    False: ['cq_general_templates_spo.json', 'cq_general_templates_subclass.json'],
+    True: ['cq_general_templates_spo_equivalence.json', 'cq_general_templates_equivalence.json'],
+}
+
+
+def row_key(row: Tuple[str, str]) -> str:
+    ''' Identify a row by its verbalization and axiom shape (ignoring whitespace). '''
+    verbalization, axiom_shape_preprocessed = row
+    normalized = verbalization + '\n\n' + ' '.join(axiom_shape_preprocessed.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    ''' Records what the last build was made of, so that a rebuild only recomputes what changed.
+
+    For every input row the manifest keeps a hash of the row and of everything its output depends on
+    (the template files used for it, the synonyms file, the generation code and spaCy/model versions),
+    the generated record, and which queries the row contributed CQs to. It also remembers the output
+    file assigned to every query and the options the whole output depends on (e.g. budgets).
+    '''
+    def __init__(self, path: str, resources_path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            'CREATE TABLE IF NOT EXISTS rows ('
+            '    row_key TEXT PRIMARY KEY, position INTEGER NOT NULL,'
+            '    row_hash TEXT NOT NULL, record TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS row_queries (row_key TEXT NOT NULL, query TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS row_queries_row_key ON row_queries(row_key);'
+            'CREATE INDEX IF NOT EXISTS row_queries_query ON row_queries(query);'
+            'CREATE TABLE IF NOT EXISTS queries (query TEXT PRIMARY KEY, file_idx INTEGER NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS options (name TEXT PRIMARY KEY, value TEXT NOT NULL);')
+
+        code_path = os.path.dirname(os.path.abspath(__file__))
+        common = [file_hash(os.path.join(resources_path, 'synonym_classes.json')),
+                  package_version('spacy'), package_version('en_core_web_sm')]
+        common += [file_hash(os.path.join(code_path, code_file)) for code_file in code_files]
+        self.dependency_hashes = {
+            is_equivalence: hashlib.sha256('\n'.join(
+                common + [file_hash(os.path.join(resources_path, template_file)) for template_file in files]
+            ).encode('utf-8')).hexdigest()
+            for is_equivalence, files in template_files.items()
+        }
+
+    def row_hash(self, row: Tuple[str, str]) -> str:
+        # ACE materializes equivalences into 2 liners
+        is_equivalence = len(row[0].split('\n')) > 1
+        return hashlib.sha256(f'{row_key(row)}\n{self.dependency_hashes[is_equivalence]}'.encode('utf-8')).hexdigest()
+
+    def diff(self, rows: List[Tuple[str, str]]) -> Tuple[List[int], Set[str]]:
+        ''' Compare rows with the last build.
+
+        Returns:
+            positions of rows which are new or have to be regenerated and keys of rows which are gone.
+        '''
+        built = dict(self.connection.execute('SELECT row_key, row_hash FROM rows'))
+        changed = [position for position, row in enumerate(rows) if built.get(row_key(row)) != self.row_hash(row)]
+        removed = set(built) - {row_key(row) for row in rows}
+        return changed, removed
+
+    def queries_of(self, row_keys: Iterable[str]) -> Set[str]:
+        queries = set()
+        for key in row_keys:
+            queries.update(query for query, in self.connection.execute(
+                'SELECT query FROM row_queries WHERE row_key = ?', (key,)))
+        return queries
+
+    def put(self, position: int, row: Tuple[str, str], record) -> Set[str]:
+        ''' Store a generated record of a row and return queries it contributes to. '''
+        key = row_key(row)
+        _, _, queries = record
+        row_queries = {query for query in queries.values() if query}
+        self.connection.execute('INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)',
+                                (key, position, self.row_hash(row), json.dumps(record)))
+        self.connection.execute('DELETE FROM row_queries WHERE row_key = ?', (key,))
+        self.connection.executemany('INSERT INTO row_queries VALUES (?, ?)',
+                                    [(key, query) for query in row_queries])
+        return row_queries
+
+    def remove(self, row_keys: Iterable[str]):
+        for key in row_keys:
+            self.connection.execute('DELETE FROM rows WHERE row_key = ?', (key,))
+            self.connection.execute('DELETE FROM row_queries WHERE row_key = ?', (key,))
+
+    def update_positions(self, rows: List[Tuple[str, str]]):
+        self.connection.executemany('UPDATE rows SET position = ? WHERE row_key = ?',
+                                    [(position, row_key(row)) for position, row in enumerate(rows)])
+
+    def records(self) -> Iterator:
+        for record, in self.connection.execute('SELECT record FROM rows ORDER BY position'):
+            yield tuple(json.loads(record))
+
+    def records_for(self, query: str) -> Iterator:
+        ''' Records of rows contributing to the query, in input order. '''
+        for record, in self.connection.execute(
+                'SELECT rows.record FROM rows JOIN row_queries ON rows.row_key = row_queries.row_key '
+                'WHERE row_queries.query = ? ORDER BY rows.position', (query,)):
+            yield tuple(json.loads(record))
+
+    def query_files(self) -> Dict[str, int]:
+        return dict(self.connection.execute('SELECT query, file_idx FROM queries'))
+
+    def set_query_file(self, query: str, idx: int):
+        self.connection.execute('INSERT OR REPLACE INTO queries VALUES (?, ?)', (query, idx))
+
+    def drop_query(self, query: str):
+        self.connection.execute('DELETE FROM queries WHERE query = ?', (query,))
+
+    def options(self) -> Dict[str, Any]:
+        ''' Options of the last full build. '''
+        return {name: json.loads(value) for name, value in self.connection.execute('SELECT name, value FROM options')}
+
+    def set_options(self, options: Dict[str, Any]):
+        self.connection.execute('DELETE FROM options')
+        self.connection.executemany('INSERT INTO options VALUES (?, ?)',
+                                    [(name, json.dumps(value)) for name, value in options.items()])
+
+    def reset(self):
+        self.connection.executescript('DELETE FROM rows; DELETE FROM row_queries; DELETE FROM queries; '
+                                      'DELETE FROM options;')
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
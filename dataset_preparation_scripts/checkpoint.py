@@ -0,0 +1,212 @@
+import struct
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from compact_store import to_little_endian
+from shape_cache import ShapeCache
+
+# Checkpoint of generated (verbalization, cqs, queries) records, optionally with the analyzed shape of every
+# verbalization, so that records can be serialized, summarized or exported again without generating them.
+#
+# File layout (little endian): header (magic, format version, compression), then blocks of `block_size` records.
+# Every block has a header (compressed and uncompressed payload size, number of records) and a payload with:
+#   - strings seen for the first time in this block: their lengths (in characters) and their UTF-8 text,
+#   - records as integers referring to strings by their position among all strings of the file so far.
+# Blocks are compressed separately, so records are written and read one block at a time.
+magic = b'BIGCQCK\x00'
+version = 1
+header = struct.Struct('<8sHH')
+block_header = struct.Struct('<III')
+payload_header = struct.Struct('<II')
+checkpoint_compressions = ['none', 'zlib', 'zstd']
+
+Record = Tuple[str, Dict[str, List[str]], Dict[str, Any]]
+
+
+def compressor(compression: str):
+    if compression == 'none':
+        return lambda data: data
+    if compression == 'zlib':
+        return lambda data: zlib.compress(data, 1)
+    if compression == 'zstd':
+        return zstd_module().ZstdCompressor().compress
+    raise ValueError(f'Unknown compression: {compression}, use one of {checkpoint_compressions}')
+
+
+def decompressor(compression: str):
+    if compression == 'none':
+        return lambda data: data
+    if compression == 'zlib':
+        return zlib.decompress
+    return zstd_module().ZstdDecompressor().decompress
+
+
+def zstd_module():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression requires the `zstandard` package: pip install zstandard')
+    return zstandard
+
+
+def from_little_endian(data: bytes, typecode: str = 'I') -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class CheckpointWriter:
+    ''' Write records one by one, `block_size` records per compressed block. '''
+    def __init__(self, path: str, compression: str = 'zlib', block_size: int = 256):
+        self.compress = compressor(compression)
+        self.block_size = block_size
+        self.string_ids = dict()
+        self.new_strings = []
+        self.ints = array('I')
+        self.records_in_block = 0
+        self.file = open(path, 'wb')
+        self.file.write(header.pack(magic, version, checkpoint_compressions.index(compression)))
+
+    def intern(self, string: str) -> int:
+        idx = self.string_ids.get(string)
+        if idx is None:
+            idx = self.string_ids[string] = len(self.string_ids)
+            self.new_strings.append(string)
+        return idx
+
+    def add(self, record: Record, analyzed_shape: Optional[Dict[str, Any]] = None):
+        verbalization, cqs, queries = record
+        ints = self.ints
+        ints.append(self.intern(verbalization))
+        ints.append(0 if analyzed_shape is None else self.intern(ShapeCache.encode(analyzed_shape)) + 1)
+        ints.append(len(cqs))
+        for category, category_cqs in cqs.items():
+            ints.append(self.intern(category))
+            ints.append(len(category_cqs))
+            ints.extend(map(self.intern, category_cqs))
+        ints.append(len(queries))
+        for category, query in queries.items():
+            ints.append(self.intern(category))
+            ints.append(0 if query is None else self.intern(query) + 1)
+        self.records_in_block += 1
+        if self.records_in_block == self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self.records_in_block:
+            return
+        lengths = array('I', map(len, self.new_strings))
+        payload = b''.join([payload_header.pack(len(lengths), len(self.ints)), to_little_endian(lengths),
+                            to_little_endian(self.ints), ''.join(self.new_strings).encode('utf-8')])
+        compressed = self.compress(payload)
+        self.file.write(block_header.pack(len(compressed), len(payload), self.records_in_block))
+        self.file.write(compressed)
+        self.new_strings = []
+        self.ints = array('I')
+        self.records_in_block = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CheckpointReader:
+    ''' Iterate over records of a checkpoint, decompressing one block at a time. '''
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            file_magic, self.version, compression = header.unpack(f.read(header.size))
+        if file_magic != magic:
+            raise ValueError(f'{path} is not a checkpoint')
+        if self.version > version:
+            raise ValueError(f'{path} has checkpoint format version {self.version}, '
+                             f'this code reads versions up to {version}')
+        self.compression = checkpoint_compressions[compression]
+
+    def __iter__(self) -> Iterator[Record]:
+        for record, _ in self.items():
+            yield record
+
+    def items(self) -> Iterator[Tuple[Record, Optional[Dict[str, Any]]]]:
+        ''' (record, analyzed shape) pairs, the shape is None if it was not saved. '''
+        decompress = decompressor(self.compression)
+        strings = []
+        with open(self.path, 'rb') as f:
+            f.seek(header.size)
+            while True:
+                data = f.read(block_header.size)
+                if not data:
+                    return
+                if len(data) < block_header.size:
+                    raise ValueError(f'{self.path} is truncated')
+                compressed_size, size, records = block_header.unpack(data)
+                data = f.read(compressed_size)
+                if len(data) < compressed_size:
+                    raise ValueError(f'{self.path} is truncated')
+                payload = decompress(data)
+                yield from self.decode_block(payload, records, strings)
+
+    @staticmethod
+    def decode_block(payload: bytes, records: int, strings: List[str]) -> Iterator[Tuple[Record, Any]]:
+        new_strings, size = payload_header.unpack_from(payload)
+        position = payload_header.size
+        lengths = from_little_endian(payload[position:position + 4 * new_strings])
+        position += 4 * new_strings
+        ints = from_little_endian(payload[position:position + 4 * size])
+        text = payload[position + 4 * size:].decode('utf-8')
+        start = 0
+        for length in lengths:
+            strings.append(text[start:start + length])
+            start += length
+
+        i = 0
+        for _ in range(records):
+            verbalization, shape, categories = strings[ints[i]], ints[i + 1], ints[i + 2]
+            i += 3
+            cqs = dict()
+            for _ in range(categories):
+                category, count = strings[ints[i]], ints[i + 1]
+                cqs[category] = [strings[idx] for idx in ints[i + 2:i + 2 + count]]
+                i += 2 + count
+            queries = dict()
+            for _ in range(ints[i]):
+                query = ints[i + 2]
+                queries[strings[ints[i + 1]]] = strings[query - 1] if query else None
+                i += 2
+            i += 1
+            yield (verbalization, cqs, queries), ShapeCache.decode(strings[shape - 1]) if shape else None
+
+
+def write_checkpoint(path: str, records: Iterable[Record], compression: str = 'zlib'):
+    with CheckpointWriter(path, compression) as writer:
+        for record in records:
+            writer.add(record)
+
+
+def read_checkpoint(path: str) -> Iterator[Record]:
+    return iter(CheckpointReader(path))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print information about a checkpoint of generated records.')
+    parser.add_argument('path')
+    args = parser.parse_args()
+    reader = CheckpointReader(args.path)
+    records = shapes = cqs = 0
+    for (_, record_cqs, _), shape in reader.items():
+        records += 1
+        shapes += shape is not None
+        cqs += sum(map(len, record_cqs.values()))
+    print(f'format version {reader.version}, {reader.compression} compression: '
+          f'{records} records ({shapes} with analyzed shapes), {cqs} CQs')
@@ -0,0 +1,222 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# File layout (little endian):
+#   header: magic, format version, number of queries, number of CQs, number of query-CQ links
+#   offsets of the 8 sections listed in `sections`, each section is aligned to 8 bytes.
+# Query and CQ strings are stored once each, sorted by their UTF-8 bytes, so they can be found by
+# binary search. Links are stored twice, as CSR arrays: CQ ids of every query and query ids of every CQ.
+magic = b'BIGCQCS\x00'
+version = 1
+header = struct.Struct('<8sIIIQ')
+sections = ['cq_offsets', 'cq_blob', 'query_offsets', 'query_blob',
+            'forward_offsets', 'forward_ids', 'reverse_offsets', 'reverse_ids']
+section_table = struct.Struct('<' + 'Q' * len(sections))
+
+
+def to_little_endian(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def string_table(strings: List[str]) -> Tuple[array, bytes]:
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def csr(lists: List[List[int]]) -> Tuple[array, array]:
+    offsets = array('Q', [0])
+    ids = array('I')
+    for elements in lists:
+        ids.extend(elements)
+        offsets.append(len(ids))
+    return offsets, ids
+
+
+def write_sections(path: str, file_header: bytes, table: struct.Struct, contents: List[bytes]):
+    ''' Write a header, a table with offsets of all sections and the sections, each aligned to 8 bytes
+    so that arrays can be memory-mapped and cast in place. '''
+    with open(path, 'wb') as f:
+        position = len(file_header) + table.size
+        section_offsets = []
+        for content in contents:
+            position += -position % 8
+            section_offsets.append(position)
+            position += len(content)
+        f.write(file_header)
+        f.write(table.pack(*section_offsets))
+        for offset, content in zip(section_offsets, contents):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(content)
+
+
+class CompactStoreBuilder:
+    ''' Interns strings of (query, cqs) pairs as they are added and writes them as a compact store.
+    Every CQ string is stored once; repeated CQs of a query are kept once, in the order of their first occurrence. '''
+    def __init__(self):
+        self.cq_ids = dict()
+        self.query_links = dict()
+
+    def add(self, query: str, cqs: List[str]):
+        links = self.query_links.setdefault(query, dict())
+        for cq in cqs:
+            links[self.cq_ids.setdefault(cq, len(self.cq_ids))] = None
+
+    def write(self, path: str):
+        # renumber strings in sorted order, to find them by binary search
+        cqs = sorted(self.cq_ids, key=lambda cq: cq.encode('utf-8'))
+        cq_renumbering = array('I', [0] * len(cqs))
+        for new_id, cq in enumerate(cqs):
+            cq_renumbering[self.cq_ids[cq]] = new_id
+        queries = sorted(self.query_links, key=lambda query: query.encode('utf-8'))
+
+        forward = [[cq_renumbering[cq_id] for cq_id in self.query_links[query]] for query in queries]
+        reverse = [[] for _ in cqs]
+        for query_id, cq_id_list in enumerate(forward):
+            for cq_id in cq_id_list:
+                reverse[cq_id].append(query_id)
+
+        cq_offsets, cq_blob = string_table(cqs)
+        query_offsets, query_blob = string_table(queries)
+        forward_offsets, forward_ids = csr(forward)
+        reverse_offsets, reverse_ids = csr(reverse)
+        contents = [to_little_endian(cq_offsets), cq_blob, to_little_endian(query_offsets), query_blob,
+                    to_little_endian(forward_offsets), to_little_endian(forward_ids),
+                    to_little_endian(reverse_offsets), to_little_endian(reverse_ids)]
+
+        write_sections(path, header.pack(magic, version, len(queries), len(cqs), len(forward_ids)),
+                       section_table, contents)
+
+
+def write_compact_store(path: str, mappings: Iterable[Tuple[str, List[str]]]):
+    ''' Write (query, cqs) pairs as a compact store. '''
+    builder = CompactStoreBuilder()
+    for query, cqs in mappings:
+        builder.add(query, cqs)
+    builder.write(path)
+
+
+class CompactStore:
+    ''' Read-only, memory-mapped view of a store written by `write_compact_store`.
+
+    Nothing is parsed when the store is opened; strings are decoded only when they are accessed
+    and id arrays are read in place from memoryviews into the mapped file. The per-id accessors return
+    copies of them, so that nothing handed out keeps the mapping exported when the store is closed.
+    '''
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        file_magic, file_version, self.num_queries, self.num_cqs, self.num_links = \
+            header.unpack_from(self.buffer, 0)
+        if file_magic != magic or file_version != version:
+            raise ValueError(f'{path} is not a compact BigCQ store (version {version})')
+        if sys.byteorder == 'big':
+            raise ValueError('compact BigCQ stores can be memory-mapped only on little endian machines')
+
+        offsets = dict(zip(sections, section_table.unpack_from(self.buffer, header.size)))
+        self.cq_offsets = self.array(offsets['cq_offsets'], self.num_cqs + 1, 'Q')
+        self.cq_blob = self.buffer[offsets['cq_blob']:]
+        self.query_offsets = self.array(offsets['query_offsets'], self.num_queries + 1, 'Q')
+        self.query_blob = self.buffer[offsets['query_blob']:]
+        self.forward_offsets = self.array(offsets['forward_offsets'], self.num_queries + 1, 'Q')
+        self.forward_ids = self.array(offsets['forward_ids'], self.num_links, 'I')
+        self.reverse_offsets = self.array(offsets['reverse_offsets'], self.num_cqs + 1, 'Q')
+        self.reverse_ids = self.array(offsets['reverse_ids'], self.num_links, 'I')
+
+    def array(self, offset: int, length: int, typecode: str) -> memoryview:
+        return self.buffer[offset:offset + length * array(typecode).itemsize].cast(typecode)
+
+    def cq(self, cq_id: int) -> str:
+        return bytes(self.cq_blob[self.cq_offsets[cq_id]:self.cq_offsets[cq_id + 1]]).decode('utf-8')
+
+    def query(self, query_id: int) -> str:
+        return bytes(self.query_blob[self.query_offsets[query_id]:self.query_offsets[query_id + 1]]).decode('utf-8')
+
+    def _cq_ids_for_query(self, query_id: int) -> memoryview:
+        return self.forward_ids[self.forward_offsets[query_id]:self.forward_offsets[query_id + 1]]
+
+    def _query_ids_for_cq(self, cq_id: int) -> memoryview:
+        return self.reverse_ids[self.reverse_offsets[cq_id]:self.reverse_offsets[cq_id + 1]]
+
+    def cq_ids_for_query(self, query_id: int) -> array:
+        return array('I', self._cq_ids_for_query(query_id).tobytes())
+
+    def query_ids_for_cq(self, cq_id: int) -> array:
+        return array('I', self._query_ids_for_cq(cq_id).tobytes())
+
+    @staticmethod
+    def find(text: str, size: int, offsets: memoryview, blob: memoryview) -> Optional[int]:
+        key = text.encode('utf-8')
+        idx = bisect.bisect_left(_StringTable(size, offsets, blob), key)
+        if idx < size and bytes(blob[offsets[idx]:offsets[idx + 1]]) == key:
+            return idx
+        return None
+
+    def find_cq(self, cq: str) -> Optional[int]:
+        return self.find(cq, self.num_cqs, self.cq_offsets, self.cq_blob)
+
+    def find_query(self, query: str) -> Optional[int]:
+        return self.find(query, self.num_queries, self.query_offsets, self.query_blob)
+
+    def cqs_for_query(self, query: str) -> List[str]:
+        query_id = self.find_query(query)
+        return [] if query_id is None else [self.cq(cq_id) for cq_id in self._cq_ids_for_query(query_id)]
+
+    def queries_for_cq(self, cq: str) -> List[str]:
+        cq_id = self.find_cq(cq)
+        return [] if cq_id is None else [self.query(query_id) for query_id in self._query_ids_for_cq(cq_id)]
+
+    def mappings(self) -> Iterator[Tuple[str, List[str]]]:
+        for query_id in range(self.num_queries):
+            yield self.query(query_id), [self.cq(cq_id) for cq_id in self._cq_ids_for_query(query_id)]
+
+    def close(self):
+        for view in [self.cq_offsets, self.cq_blob, self.query_offsets, self.query_blob, self.forward_offsets,
+                     self.forward_ids, self.reverse_offsets, self.reverse_ids, self.buffer]:
+            view.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _StringTable:
+    ''' Sequence view over a sorted string table, used to binary search it without decoding it. '''
+    def __init__(self, size: int, offsets: memoryview, blob: memoryview):
+        self.size = size
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, idx: int) -> bytes:
+        return bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]])
+
+
+class CompactStoreWriter:
+    ''' Serializer output writer producing a single compact store file. '''
+    def __init__(self, out_folder: str):
+        self.path = os.path.join(out_folder, 'query_to_cqs.bigcq')
+        self.builder = CompactStoreBuilder()
+
+    def write(self, idx: int, query: str, cqs: List[str]):
+        self.builder.add(query, cqs)
+
+    def close(self):
+        self.builder.write(self.path)
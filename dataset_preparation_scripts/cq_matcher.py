@@ -0,0 +1,197 @@
+import argparse
+import csv
+import re
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from serializer import load_mappings
+
+word_pattern = re.compile(r'\w+')
+placeholder_pattern = re.compile(r'^(c|op|dp|i|dt)[0-9]+$')
+# words which end the span of any placeholder: templates spell question words, connectives and determiners out,
+# so a CQ matching a template has them outside of placeholders
+boundary_words = frozenset([
+    'what', 'which', 'who', 'whom', 'whose', 'where', 'when', 'why', 'how',
+    'and', 'or', 'but', 'that', 'than', 'if', 'whether', 'not',
+    'a', 'an', 'the', 'every', 'each', 'some', 'any', 'all', 'no', 'this', 'these', 'those'])
+# auxiliary verbs, which may be part of a property (op, dp) but end the span of a class, individual or datatype
+auxiliary_words = frozenset([
+    'is', 'are', 'was', 'were', 'be', 'been', 'being', 'am', 'do', 'does', 'did', 'has', 'have', 'had',
+    'can', 'could', 'may', 'might', 'must', 'shall', 'should', 'will', 'would'])
+
+
+def tokenize(text: str) -> List[str]:
+    ''' Lowercased words of a CQ, punctuation is ignored. '''
+    return word_pattern.findall(text.lower())
+
+
+class Match(NamedTuple):
+    template: str
+    bindings: Dict[str, str]  # placeholder -> matched fragment of the CQ
+    queries: List[str]
+
+
+class TrieNode:
+    __slots__ = ['children', 'slots', 'templates', 'min_rest', 'max_rest']
+
+    def __init__(self):
+        self.children = dict()  # word -> node
+        self.slots = dict()  # placeholder (c1, op1, ...) -> node
+        self.templates = []  # ids of templates ending in this node
+        # bounds of the number of CQ words needed to reach the end of some template from this node
+        self.min_rest = 0
+        self.max_rest = 0
+
+
+class CQMatcher:
+    ''' Token trie over CQ templates, in which placeholders (c1, op1, dp1, i1, dt1) are wildcard edges.
+
+    A free-text CQ matches a template if its words can be split so that every placeholder covers
+    1 to `max_span` consecutive words and repeated placeholders cover identical words. With `bounded_slots`,
+    placeholders never cover `boundary_words`, and classes, individuals and datatypes never cover
+    `auxiliary_words`, so that the words a template spells out are not absorbed by its placeholders.
+    '''
+    def __init__(self, mappings: Iterable[Tuple[str, List[str]]], max_span: int = 6, bounded_slots: bool = True):
+        self.max_span = max_span
+        self.bounded_slots = bounded_slots
+        self.slot_stop_words = dict()  # placeholder -> words its span ends at
+        self.root = TrieNode()
+        self.templates = []  # template id -> CQ template
+        self.queries = []  # template id -> SPARQL-OWL queries
+        template_ids = dict()
+
+        for query, cqs in mappings:
+            for cq in cqs:
+                if cq not in template_ids:
+                    template_ids[cq] = len(self.templates)
+                    self.templates.append(cq)
+                    self.queries.append([])
+                    self.insert(cq, template_ids[cq])
+                if query not in self.queries[template_ids[cq]]:
+                    self.queries[template_ids[cq]].append(query)
+        self.compute_bounds(self.root)
+
+    def insert(self, template: str, template_id: int):
+        node = self.root
+        for token in tokenize(template):
+            edges = node.slots if placeholder_pattern.match(token) else node.children
+            if edges is node.slots and token not in self.slot_stop_words:
+                self.slot_stop_words[token] = self.stop_words(token)
+            if token not in edges:
+                edges[token] = TrieNode()
+            node = edges[token]
+        node.templates.append(template_id)
+
+    def compute_bounds(self, root: TrieNode):
+        # iterative post-order traversal, templates may be longer than the recursion limit allows
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+                stack.extend((child, False) for child in node.slots.values())
+                continue
+            bounds = [(child.min_rest + 1, child.max_rest + 1) for child in node.children.values()]
+            bounds += [(child.min_rest + 1, child.max_rest + self.max_span) for child in node.slots.values()]
+            if node.templates:
+                bounds.append((0, 0))
+            node.min_rest = min(lower for lower, _ in bounds)
+            node.max_rest = max(upper for _, upper in bounds)
+
+    def match(self, cq: str, limit: Optional[int] = None) -> List[Match]:
+        ''' Templates matching a free-text CQ, the most specific ones (with fewest words covered by placeholders)
+        first. '''
+        tokens = tokenize(cq)
+        found = []
+        self.search(self.root, tokens, 0, dict(), 0, found)
+        found.sort(key=lambda item: (item[0], self.templates[item[1]]))
+
+        matches = []
+        for _, template_id, bindings in found[:limit]:
+            matches.append(Match(self.templates[template_id],
+                                 {name: ' '.join(span) for name, span in bindings.items()},
+                                 self.queries[template_id]))
+        return matches
+
+    def search(self, node: TrieNode, tokens: List[str], position: int,
+               bindings: Dict[str, Tuple[str, ...]], covered: int, found: list):
+        rest = len(tokens) - position
+        if rest < node.min_rest or rest > node.max_rest:
+            return
+        if rest == 0:
+            found.extend((covered, template_id, dict(bindings)) for template_id in node.templates)
+            return
+
+        child = node.children.get(tokens[position])
+        if child is not None:
+            self.search(child, tokens, position + 1, bindings, covered, found)
+
+        for name, child in node.slots.items():
+            if name in bindings:
+                span = bindings[name]
+                if tuple(tokens[position:position + len(span)]) == span:
+                    self.search(child, tokens, position + len(span), bindings, covered + len(span), found)
+                continue
+            stop_words = self.slot_stop_words[name]
+            for length in range(1, min(self.max_span, rest) + 1):
+                if tokens[position + length - 1] in stop_words:
+                    break
+                bindings[name] = tuple(tokens[position:position + length])
+                self.search(child, tokens, position + length, bindings, covered + length, found)
+            bindings.pop(name, None)
+
+    def stop_words(self, placeholder: str) -> frozenset:
+        ''' Words the span of a placeholder ends at. '''
+        if not self.bounded_slots:
+            return frozenset()
+        if placeholder_pattern.match(placeholder).group(1) in ('op', 'dp'):
+            return boundary_words
+        return boundary_words | auxiliary_words
+
+
+def evaluate(matcher: CQMatcher, cqs: List[str], report_path: Optional[str] = None):
+    ''' Print how many CQs are covered by templates; optionally write the best match of every CQ to a CSV file. '''
+    covered = 0
+    start = time.perf_counter()
+    results = []
+    for cq in cqs:
+        matches = matcher.match(cq, limit=1)
+        covered += bool(matches)
+        results.append((cq, matches[0] if matches else None))
+    elapsed = time.perf_counter() - start
+
+    print(f'Covered CQs: {covered} / {len(cqs)} ({100.0 * covered / max(1, len(cqs)):.2f}%)')
+    print(f'Average matching time: {1000.0 * elapsed / max(1, len(cqs)):.3f} ms per CQ')
+
+    if report_path:
+        with open(report_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['cq', 'template', 'bindings', 'queries'])
+            for cq, match in results:
+                if match is None:
+                    writer.writerow([cq, '', '', ''])
+                else:
+                    writer.writerow([cq, match.template,
+                                     '; '.join(f'{name}={value}' for name, value in match.bindings.items()),
+                                     ' | '.join(match.queries)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Match CQs against BigCQ templates and report coverage.')
+    parser.add_argument('cqs', help='CSV file with one CQ in the first column of every row')
+    parser.add_argument('--mappings', default='../BigCQ_dataset/query_templates_to_cq_template_mappings/',
+                        help='folder written by Serializer (any output format)')
+    parser.add_argument('--max-span', type=int, default=6, help='maximum number of words covered by a placeholder')
+    parser.add_argument('--unbounded-slots', action='store_true',
+                        help='let placeholders cover question words, connectives, determiners and auxiliaries')
+    parser.add_argument('--report', default=None, help='CSV file to write the best match of every CQ to')
+    args = parser.parse_args()
+
+    with open(args.cqs, newline='') as f:
+        cqs = [row[0] for row in csv.reader(f) if row and row[0].strip()]
+    matcher = CQMatcher(load_mappings(args.mappings), args.max_span, not args.unbounded_slots)
+    evaluate(matcher, cqs, args.report)
+
+
+if __name__ == '__main__':
+    main()
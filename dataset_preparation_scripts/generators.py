@@ -1,14 +1,47 @@
 from synonymes_generator import SynonymesGenerator
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, FrozenSet, List, Set, Tuple
 import json
+import random
 import re
+from budget import water_fill
+import profiling
+
+question_types = ['ASK', 'SELECT_CAR', 'SELECT_CAD', 'SELECT_VERB', 'SELECT_COUNT_CAR', 'SELECT_COUNT_CAD',
+                  'SELECT_COUNT_VERB']
 
 
 def load_json(path: str) -> Dict[str, Any]:
     with open(path) as json_file:
         return json.load(json_file)
 
+class CQTemplate:
+    ''' A CQ template (with synsets already expanded) split once into fixed segments and
+    {CAD}, {CAR} and {VERB} slots, so that it can be filled with a single join. '''
+    slot_pattern = re.compile(r'\{(CAD|CAR|VERB)\}')
+
+    def __init__(self, template: str, pattern: int = 0):
+        self.template = template
+        self.pattern = pattern  # index of the general template it was expanded from
+        # even positions hold fixed segments, odd positions hold slot names
+        self.parts = self.slot_pattern.split(template)
+
+    def fill(self, replacements: Dict[str, str]) -> str:
+        ''' Fill slots with given phrases; slots without a replacement are kept as they are. '''
+        parts = self.parts[:]
+        for idx in range(1, len(parts), 2):
+            slot = parts[idx]
+            parts[idx] = replacements[slot] if slot in replacements else '{' + slot + '}'
+        return ''.join(parts)
+
+
+# expanded templates, placeholders filled in them and whether the verb is attached to CAR
+CQSource = Tuple[List[CQTemplate], FrozenSet[str], bool]
+
+
 class CQGenerator:
+    paraphrased_cq_pattern = re.compile("what is (c[0-9]) that ([do]p[0-9]) (.*)")
+    #paraphrased_cq_pattern = re.compile("what is (c[0-9]) that (c[0-9]) ([do]p[0-9]) (.*)")
+
     def __init__(self, spo_transformations_path: str,
                  spo_transformations_equivalence_path: str,
                  subclass_transformations_path: str,
@@ -20,113 +53,201 @@ class CQGenerator:
         self.equivalence_transformations = load_json(equivalence_transformations_path)
         self.synonyms = load_json(synonyms_path)
 
-    def materialize_placeholders_with_phrases(self, analyzed_shape: Dict[str, Any], placeholders: Set[str],
-        cqs: List[str],
-        attach_verb_to_car: bool = False) -> List[str]:
-        ''' Transform general CQ tempalets into actual CQ templates'''
-        for placeholder in placeholders:
-            replacement = analyzed_shape[placeholder].lower()
-            if attach_verb_to_car:
-                if placeholder == 'VERB':
-                    continue
-                if placeholder == 'CAR':
-                    replacement = f'something that {analyzed_shape["VERB"]} {analyzed_shape["CAR"]}'
-            cqs = [re.sub('{'+placeholder+'}', replacement, q) for q in cqs]
-        return list(set(cqs))
-
-    def materialize_to_both_spo_subclass(self, analyzed_shape: Dict[str, Any],
-                                         placeholders: Set[str],
-                                         question_type: str,
-                                         is_equivalence: bool = False) -> List[str]:
-        placeholders_with_verb = placeholders | {'VERB'}
-        placeholders_without_verb = placeholders - {'VERB'}
-        result = []
+        # template lists never change during a run, so all synonym expansions are computed once
+        self.spo_expansions = self.expand_templates(self.spo_transformations)
+        self.subclass_expansions = self.expand_templates(self.subclass_transformations)
+        self.spo_equivalence_expansions = self.expand_templates(self.spo_transformations_equivalence)
+        self.equivalence_expansions = self.expand_templates(self.equivalence_transformations)
+        # {0}, {1} and {2} are filled with the class, the property and the rest of the paraphrased CQ
+        paraphrase_generator = SynonymesGenerator([
+            '[WHAT] {0} {1} {2}',
+            '[WHAT] [TYPES] of {0} {1} {2}',
+            '[WHAT] [KIND] of {0} {1} {2}',
+            '[WHAT] [TYPES] of are {0} which {1} {2}',
+            '[WHAT] [IS] {0} which {1} {2}',
+            '[WHAT] [IS] {0} {1} {2}',
+            '[WHAT] {0} [DOES] {1} {2}',
+            '[WHAT] {0} has {1} {2}',
+            '[WHAT] {0} have {1} {2}',
+        ], self.synonyms)
+        self.paraphrase_expansions = paraphrase_generator.get_all_expansions()
+        self.paraphrase_ranges = []
+        for compiled_pattern in paraphrase_generator.compiled_patterns:
+            start = self.paraphrase_ranges[-1][1] if self.paraphrase_ranges else 0
+            self.paraphrase_ranges.append((start, start + compiled_pattern.count()))
+        self.count_cache = dict()
+        self.ranges_cache = dict()
 
-        if analyzed_shape['is_equivalence']:
-            spo_templates = self.spo_transformations_equivalence
-            subclass_templates = self.equivalence_transformations
-        else:
-            spo_templates = self.spo_transformations
-            subclass_templates = self.subclass_transformations
+    def expand_templates(self, transformations: Dict[str, List[str]]) -> Dict[str, List[CQTemplate]]:
+        ''' Expand synsets of general CQ templates for every question type and compile the results. '''
+        expansions = dict()
+        for question_type, templates in transformations.items():
+            with profiling.stage('cq_generator.expand_templates', question_type=question_type):
+                synonymes_generator = SynonymesGenerator(templates, self.synonyms)
+                expansions[question_type] = [
+                    CQTemplate(cq, idx)
+                    for idx, compiled_pattern in enumerate(synonymes_generator.compiled_patterns)
+                    for cq in compiled_pattern]
+            if profiling.enabled():
+                for compiled_pattern in synonymes_generator.compiled_patterns:
+                    profiling.record('synonyms.expansions_per_template', compiled_pattern.count(),
+                                     template=compiled_pattern.cq_pattern)
+        return expansions
 
-        result += self.materialize_placeholders_with_phrases(
-            analyzed_shape, placeholders_with_verb,
-            SynonymesGenerator(
-                spo_templates[question_type], self.synonyms).get_all_expansions())
+    def select_expansions(self, analyzed_shape: Dict[str, Any]):
+        ''' Return expanded SPO and subclass templates suitable for the given axiom shape. '''
+        if analyzed_shape['is_equivalence']:
+            return self.spo_equivalence_expansions, self.equivalence_expansions
+        return self.spo_expansions, self.subclass_expansions
 
-        result += self.materialize_placeholders_with_phrases(
-            analyzed_shape, placeholders_without_verb,
-            SynonymesGenerator(
-                subclass_templates[question_type], self.synonyms).get_all_expansions(),
-                attach_verb_to_car=True)
-        return list(set(result))
+    def cq_sources(self, analyzed_shape: Dict[str, Any]) -> Dict[str, List[CQSource]]:
+        ''' For every question type, the expanded templates CQs are made of, with the placeholders filled
+        in them and whether the verb is attached to CAR (see `replacements`). '''
+        sources = {question_type: [] for question_type in question_types}
+        spo_expansions, subclass_expansions = self.select_expansions(analyzed_shape)
 
-    def make_cqs(self, verbalization: str, analyzed_shape: Dict[str, Any]):
-        queries = {
-            "ASK": [],
-            "SELECT_CAR": [],
-            "SELECT_CAD": [],
-            "SELECT_VERB": [],
-            "SELECT_COUNT_CAR": [],
-            "SELECT_COUNT_CAD": [],
-            "SELECT_COUNT_VERB": [],
-        }
-
-        if analyzed_shape['is_equivalence']:
-            spo_templates = self.spo_transformations_equivalence
-            subclass_templates = self.equivalence_transformations
-        else:
-            spo_templates = self.spo_transformations
-            subclass_templates = self.subclass_transformations
+        def spo_and_subclass(placeholders: Set[str], question_type: str):
+            return [(spo_expansions[question_type], frozenset(placeholders | {'VERB'}), False),
+                    (subclass_expansions[question_type], frozenset(placeholders - {'VERB'}), True)]
 
         # if main verb is different than 'is'
         if analyzed_shape['VERB'] is not None:
             # we generate ASK queries by taking possible formulations from patterns_simple_spo and replacing placeholders (CAR, VERB, CAD) with appropriate fragments extracted from verbalized axiom
-            queries['ASK'] = self.materialize_to_both_spo_subclass(analyzed_shape, {'CAR', 'VERB', 'CAD'}, 'ASK', analyzed_shape['is_equivalence'])
+            sources['ASK'] = spo_and_subclass({'CAR', 'VERB', 'CAD'}, 'ASK')
 
             if not analyzed_shape['complex_domain'] and len(analyzed_shape['domain_elems']) > 0:
                 for query_type in ['SELECT_CAD', 'SELECT_COUNT_CAD']:
-                    queries[query_type] = self.materialize_to_both_spo_subclass(analyzed_shape, {'CAR', 'VERB'}, query_type, analyzed_shape['is_equivalence'])
+                    sources[query_type] = spo_and_subclass({'CAR', 'VERB'}, query_type)
             if not analyzed_shape['complex_range'] and len(analyzed_shape['range_elems']) > 0:
                 for query_type in ['SELECT_CAR', 'SELECT_COUNT_CAR']:
-                    queries[query_type] = self.materialize_placeholders_with_phrases(analyzed_shape, {'CAD', 'VERB'}, SynonymesGenerator(spo_templates[query_type], self.synonyms).get_all_expansions())
+                    sources[query_type] = [(spo_expansions[query_type], frozenset({'CAD', 'VERB'}), False)]
 
             for query_type in ['SELECT_VERB', 'SELECT_COUNT_VERB']:
-                queries[query_type] = self.materialize_placeholders_with_phrases(analyzed_shape, {'CAD', 'CAR'}, SynonymesGenerator(spo_templates[query_type], self.synonyms).get_all_expansions())
+                sources[query_type] = [(spo_expansions[query_type], frozenset({'CAD', 'CAR'}), False)]
         else:
-            queries['ASK'] = self.materialize_placeholders_with_phrases(analyzed_shape, {'CAD', 'CAR'}, SynonymesGenerator(subclass_templates['ASK'], self.synonyms).get_all_expansions())
+            sources['ASK'] = [(subclass_expansions['ASK'], frozenset({'CAD', 'CAR'}), False)]
 
             if not analyzed_shape['complex_domain'] and len(analyzed_shape['domain_elems']) > 0:
                 for query_type in ['SELECT_CAD', 'SELECT_COUNT_CAD']:
-                    queries[query_type] = self.materialize_placeholders_with_phrases(analyzed_shape, {'CAR'}, SynonymesGenerator(subclass_templates[query_type], self.synonyms).get_all_expansions())
+                    sources[query_type] = [(subclass_expansions[query_type], frozenset({'CAR'}), False)]
 
             if not analyzed_shape['complex_range'] and len(analyzed_shape['range_elems']) > 0:
                 for query_type in ['SELECT_CAR', 'SELECT_COUNT_CAR']:
-                        queries[query_type] = self.materialize_placeholders_with_phrases(analyzed_shape, {'CAD'}, SynonymesGenerator(subclass_templates[query_type], self.synonyms).get_all_expansions())
+                    sources[query_type] = [(subclass_expansions[query_type], frozenset({'CAD'}), False)]
+        return sources
+
+    @staticmethod
+    def replacements(analyzed_shape: Dict[str, Any], placeholders: Set[str],
+                     attach_verb_to_car: bool = False) -> Dict[str, str]:
+        ''' Phrases of the verbalized axiom filling the placeholders of general CQ templates. '''
+        replacements = dict()
+        for placeholder in placeholders:
+            if attach_verb_to_car:
+                if placeholder == 'VERB':
+                    continue
+                if placeholder == 'CAR':
+                    replacements[placeholder] = f'something that {analyzed_shape["VERB"]} {analyzed_shape["CAR"]}'
+                    continue
+            replacements[placeholder] = analyzed_shape[placeholder].lower()
+        return replacements
+
+    def materialize_placeholders_with_phrases(self, analyzed_shape: Dict[str, Any], placeholders: Set[str],
+        cqs: List[CQTemplate],
+        attach_verb_to_car: bool = False) -> List[str]:
+        ''' Transform general CQ tempalets into actual CQ templates'''
+        replacements = self.replacements(analyzed_shape, placeholders, attach_verb_to_car)
+        materialized = dict()  # used as an insertion-ordered set
+        for cq in cqs:
+            materialized[cq.fill(replacements)] = None
+        return list(materialized)
+
+    def make_cqs(self, verbalization: str, analyzed_shape: Dict[str, Any]):
+        queries = dict()
+        for question_type, sources in self.cq_sources(analyzed_shape).items():
+            result = []
+            for templates, placeholders, attach_verb_to_car in sources:
+                result += self.materialize_placeholders_with_phrases(
+                    analyzed_shape, placeholders, templates, attach_verb_to_car)
+            queries[question_type] = list(dict.fromkeys(result)) if len(sources) > 1 else result
         return queries
 
     def paraphrase_cqs(self, cqs):
         cqs_paraphrased = []
         for cq in cqs:
-            matched = re.search("what is (c[0-9]) that ([do]p[0-9]) (.*)", cq)
-            #matched = re.search("what is (c[0-9]) that (c[0-9]) ([do]p[0-9]) (.*)", cq)
+            matched = self.paraphrased_cq_pattern.search(cq)
             if matched:
-                paraphrases = [
-                    f'[WHAT] {matched.groups(0)[0]} {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] [TYPES] of {matched.groups(0)[0]} {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] [KIND] of {matched.groups(0)[0]} {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] [TYPES] of are {matched.groups(0)[0]} which {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] [IS] {matched.groups(0)[0]} which {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] [IS] {matched.groups(0)[0]} {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] {matched.groups(0)[0]} [DOES] {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] {matched.groups(0)[0]} has {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                    f'[WHAT] {matched.groups(0)[0]} have {matched.groups(0)[1]} {matched.groups(0)[2]}',
-                ]
-
-                cqs_paraphrased += SynonymesGenerator(paraphrases, self.synonyms).get_all_expansions()
+                cqs_paraphrased += [paraphrase.format(*matched.groups()) for paraphrase in self.paraphrase_expansions]
             cqs_paraphrased.append(cq)
         return cqs_paraphrased
 
+    def count_filled(self, templates: List[CQTemplate], replacements: Dict[str, str]) -> Tuple[int, int]:
+        ''' Number of distinct CQs made of templates with given replacements and how many of them are paraphrased.
+        Rows often share their phrases (e.g. "c1" and "op1"), so counts are memoized. '''
+        key = (id(templates), tuple(sorted(replacements.items())))
+        if key not in self.count_cache:
+            cqs = {cq.fill(replacements) for cq in templates}
+            self.count_cache[key] = len(cqs), sum(1 for cq in cqs if self.paraphrased_cq_pattern.search(cq))
+        return self.count_cache[key]
+
+    def count_cqs(self, analyzed_shape: Dict[str, Any]) -> Dict[str, int]:
+        ''' Number of paraphrased CQs `make_cqs` and `paraphrase_cqs` make of every question type, computed without
+        generating the paraphrases. The estimate is exact unless different sources of a question type (or
+        paraphrases and the CQs themselves) share CQs, which are then counted more than once. '''
+        counts = dict()
+        for question_type, sources in self.cq_sources(analyzed_shape).items():
+            counts[question_type] = 0
+            for templates, placeholders, attach_verb_to_car in sources:
+                cqs, paraphrased = self.count_filled(
+                    templates, self.replacements(analyzed_shape, placeholders, attach_verb_to_car))
+                counts[question_type] += cqs + paraphrased * len(self.paraphrase_expansions)
+        return counts
+
+    def sample_cqs(self, analyzed_shape: Dict[str, Any], budgets: Dict[str, int],
+                   rng: random.Random) -> Dict[str, List[str]]:
+        ''' Paraphrased CQs of every question type, at most `budgets[question_type]` of those with a budget.
+
+        CQs are sampled by strata: every general template of every source and every paraphrase pattern gets an equal
+        share of the budget (strata with fewer CQs pass the rest of their share to others) and within a stratum CQs
+        are drawn uniformly, i.e. with uniformly chosen synonyms of every synset. '''
+        cqs = self.make_cqs('', analyzed_shape)
+        for question_type, sources in self.cq_sources(analyzed_shape).items():
+            if question_type not in budgets:
+                cqs[question_type] = self.paraphrase_cqs(cqs[question_type])
+                continue
+            strata = []  # (size, CQ at an index)
+            for templates, placeholders, attach_verb_to_car in sources:
+                replacements = self.replacements(analyzed_shape, placeholders, attach_verb_to_car)
+                for start, end in self.pattern_ranges(templates):
+                    strata.append((end - start, lambda idx, start=start, templates=templates, replacements=replacements:
+                                   templates[start + idx].fill(replacements)))
+            paraphrased = []  # groups of CQs which are paraphrased
+            for cq in cqs[question_type]:
+                matched = self.paraphrased_cq_pattern.search(cq)
+                if matched:
+                    paraphrased.append(matched.groups())
+            for start, end in self.paraphrase_ranges:
+                strata.append((len(paraphrased) * (end - start), lambda idx, start=start, size=end - start:
+                               self.paraphrase_expansions[start + idx % size].format(*paraphrased[idx // size])))
+
+            sample = []
+            for (size, cq_at), quota in zip(strata, water_fill([size for size, _ in strata], budgets[question_type])):
+                sample += [cq_at(idx) for idx in sorted(rng.sample(range(size), quota))]
+            cqs[question_type] = list(dict.fromkeys(sample))
+        return cqs
+
+    def pattern_ranges(self, templates: List[CQTemplate]) -> List[Tuple[int, int]]:
+        ''' Ranges of templates expanded from the same general template. '''
+        if id(templates) not in self.ranges_cache:
+            ranges = []
+            for idx, template in enumerate(templates):
+                if ranges and templates[ranges[-1][0]].pattern == template.pattern:
+                    ranges[-1][1] = idx + 1
+                else:
+                    ranges.append([idx, idx + 1])
+            self.ranges_cache[id(templates)] = [tuple(bounds) for bounds in ranges]
+        return self.ranges_cache[id(templates)]
+
+
 class SPARQLOWLGenerator:
     def __init__(self):
         pass
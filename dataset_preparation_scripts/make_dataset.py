@@ -1,54 +1,478 @@
+import argparse
+import collections
 import csv
+import itertools
+import json
+import os
+import random
+import sys
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from verbalization_analyzer import Analyzer
 from generators import CQGenerator, SPARQLOWLGenerator
 from summarizer import Summarizer
-from serializer import Serializer
-import pprint
-import pickle
+from serializer import Serializer, compressions, output_formats
+from shape_cache import ShapeCache
+from build_manifest import BuildManifest, row_key
+from budget import plan_quotas
+from checkpoint import CheckpointWriter, checkpoint_compressions, read_checkpoint, write_checkpoint
+from near_duplicates import NearDuplicatePruner, scopes
+import materializer
+import profiling
+
 
 def is_ACE_error(verbalization: str) -> bool:
     ''' Check if verbalization contains ACE error '''
     return verbalization.startswith("/* BUG:")
 
-resources_path = './statements_to_cqs_transformations/'
-pp = pprint.PrettyPrinter(indent=4)
 
-analyzer = Analyzer()
-cq_generator = CQGenerator(
-    spo_transformations_path = f'{resources_path}/cq_general_templates_spo.json',
-    spo_transformations_equivalence_path = f'{resources_path}/cq_general_templates_spo_equivalence.json',
-    subclass_transformations_path = f'{resources_path}/cq_general_templates_subclass.json',
-    equivalence_transformations_path = f'{resources_path}/cq_general_templates_equivalence.json',
-    synonyms_path = f'{resources_path}/synonym_classes.json')
-query_generator = SPARQLOWLGenerator()
+def read_rows(path: str) -> Iterator[Tuple[str, str]]:
+    ''' Stream (verbalization, preprocessed axiom shape) pairs, skipping duplicated rows
+    and verbalizations that ACE failed to produce.
+
+    The same verbalization may describe several axiom shapes, so rows are deduplicated
+    by the verbalization together with the axiom shape (ignoring whitespace). '''
+    seen_rows = set()
+    with open(path) as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for row in csv_reader:
+            verbalization = row[1]
+            axiom_shape_preprocessed = row[2]
+
+            row_key = (verbalization, ' '.join(axiom_shape_preprocessed.split()))
+            if is_ACE_error(verbalization) or row_key in seen_rows:
+                continue
+            seen_rows.add(row_key)
+            yield verbalization, axiom_shape_preprocessed
+
+
+def make_shards(rows: Iterable[Tuple[str, str]], shard_size: int) -> Iterator[List[Tuple[str, str]]]:
+    shard = []
+    for row in rows:
+        shard.append(row)
+        if len(shard) == shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+class DatasetGenerator:
+    ''' Turns rows of the input file into (verbalization, cqs, queries) records. '''
+    def __init__(self, resources_path: str, cache_path: Optional[str] = None):
+        self.analyzer = Analyzer(cache=ShapeCache(cache_path) if cache_path else None)
+        self.cq_generator = CQGenerator(
+            spo_transformations_path = f'{resources_path}/cq_general_templates_spo.json',
+            spo_transformations_equivalence_path = f'{resources_path}/cq_general_templates_spo_equivalence.json',
+            subclass_transformations_path = f'{resources_path}/cq_general_templates_subclass.json',
+            equivalence_transformations_path = f'{resources_path}/cq_general_templates_equivalence.json',
+            synonyms_path = f'{resources_path}/synonym_classes.json')
+
+    def generate(self, rows: List[Tuple[str, str]], with_shapes: bool = False,
+                 quotas: Optional[List[Dict[str, int]]] = None, seed: int = 0) -> List[Any]:
+        ''' Records of rows or, `with_shapes`, (record, analyzed shape) pairs. Question types with a quota in
+        `quotas` (one dict per row) get a sample of at most that many CQs, drawn with a seed derived from the row. '''
+        result = []
+        with profiling.stage('analyzer.process_many'):
+            analyzed_shapes = self.analyzer.process_many([verbalization for verbalization, _ in rows])
+
+        for position, (row, analyzed_shape) in enumerate(zip(rows, analyzed_shapes)):
+            verbalization, axiom_shape_preprocessed = row
+            with profiling.stage('row', verbalization=verbalization):
+                if quotas is not None and quotas[position]:
+                    with profiling.stage('cq_generator.sample_cqs'):
+                        rng = random.Random(f'{seed}:{verbalization}:{axiom_shape_preprocessed}')
+                        cqs = self.cq_generator.sample_cqs(analyzed_shape, quotas[position], rng)
+                else:
+                    with profiling.stage('cq_generator.make_cqs'):
+                        cqs = self.cq_generator.make_cqs(verbalization, analyzed_shape)
+                    with profiling.stage('cq_generator.paraphrase_cqs'):
+                        for category in cqs:
+                            cqs[category] = self.cq_generator.paraphrase_cqs(cqs[category])
+                with profiling.stage('sparql_generator.make_queries'):
+                    queries = SPARQLOWLGenerator.make_queries(axiom_shape_preprocessed, analyzed_shape)
+            if profiling.enabled():
+                profiling.record('cqs_per_row', sum(map(len, cqs.values())), verbalization=verbalization)
+                for category in cqs:
+                    profiling.count(f'cqs.{category}', len(cqs[category]))
+
+            record = (verbalization, cqs, queries)
+            result.append((record, analyzed_shape) if with_shapes else record)
+        return result
+
+    def estimate(self, rows: List[Tuple[str, str]]) -> List[Dict[str, Tuple[int, Optional[str]]]]:
+        ''' The number of CQs and the query of every question type of rows, without generating CQs. '''
+        with profiling.stage('analyzer.process_many'):
+            analyzed_shapes = self.analyzer.process_many([verbalization for verbalization, _ in rows])
+        result = []
+        for (_, axiom_shape_preprocessed), analyzed_shape in zip(rows, analyzed_shapes):
+            counts = self.cq_generator.count_cqs(analyzed_shape)
+            queries = SPARQLOWLGenerator.make_queries(axiom_shape_preprocessed, analyzed_shape)
+            result.append({category: (counts[category], queries[category]) for category in counts})
+        return result
+
+    def close(self):
+        ''' Save when cached shapes were last used (cache hits are recorded in memory only). '''
+        if self.analyzer.cache is not None:
+            self.analyzer.cache.close()
+
+
+# every worker process holds its own generator (with its own Analyzer and CQGenerator)
+worker_generator = None
+
+
+def init_worker(resources_path: str, cache_path: Optional[str], profile: bool = False):
+    global worker_generator
+    if profile:
+        profiling.enable()
+    worker_generator = DatasetGenerator(resources_path, cache_path)
+    # run when the worker exits after the pool is closed (but not when it is terminated)
+    Finalize(worker_generator, worker_generator.close, exitpriority=10)
+
+
+def generate_shard(task: Tuple[List[Tuple[str, str]], bool, Optional[List[Dict[str, int]]], int]):
+    ''' Records of a shard with profiling data collected by the worker since its previous shard. '''
+    records = worker_generator.generate(*task)
+    return records, profiling.active.collect() if profiling.enabled() else None
+
+
+def estimate_shard(rows: List[Tuple[str, str]]):
+    return worker_generator.estimate(rows), profiling.active.collect() if profiling.enabled() else None
+
+
+def generate_records(rows: Iterable[Tuple[str, str]], resources_path: str,
+                     cache_path: Optional[str] = None, workers: int = 1,
+                     shard_size: int = 256, with_shapes: bool = False,
+                     quotas: Optional[List[Dict[str, int]]] = None, seed: int = 0) -> Iterator[Any]:
+    ''' Lazily generate records (or, `with_shapes`, (record, analyzed shape) pairs) for all rows, with CQs sampled
+    to the `quotas` of rows (see `budget.plan_quotas`) if they are given. Rows are grouped into shards which are
+    parsed in batches and, with more than one worker, processed by a pool of workers.
+
+    Shards are merged in input order, so the result does not depend on the number of workers. At most two shards
+    per worker are submitted ahead of the one being merged, so that neither rows nor records pile up in memory
+    when the consumer is slower than the workers.
+    '''
+    shards = make_shards(rows, shard_size)
+    quota_shards = make_shards(quotas, shard_size) if quotas is not None else itertools.repeat(None)
+    tasks = ((shard, with_shapes, shard_quotas, seed) for shard, shard_quotas in zip(shards, quota_shards))
+    if workers <= 1:
+        generator = DatasetGenerator(resources_path, cache_path)
+        try:
+            for task in tasks:
+                yield from generator.generate(*task)
+        finally:
+            generator.close()
+        return
+
+    with Pool(workers, initializer=init_worker, initargs=(resources_path, cache_path, profiling.enabled())) as pool:
+        pending = collections.deque()
+        for task in itertools.chain(tasks, [None]):
+            if task is not None:
+                pending.append(pool.apply_async(generate_shard, (task,)))
+            while pending and (task is None or len(pending) >= 2 * workers):
+                records, profile = pending.popleft().get()
+                if profile is not None:
+                    profiling.active.merge(profile)
+                yield from records
+        # let workers exit (and close their caches) before the pool is terminated
+        pool.close()
+        pool.join()
+
+
+def estimate_rows(rows: List[Tuple[str, str]], resources_path: str, cache_path: Optional[str] = None,
+                  workers: int = 1, shard_size: int = 256) -> List[Dict[str, Tuple[int, Optional[str]]]]:
+    ''' `DatasetGenerator.estimate` of all rows, in input order. '''
+    shards = make_shards(rows, shard_size)
+    if workers <= 1:
+        generator = DatasetGenerator(resources_path, cache_path)
+        try:
+            return [estimate for shard in shards for estimate in generator.estimate(shard)]
+        finally:
+            generator.close()
+
+    estimates = []
+    with Pool(workers, initializer=init_worker, initargs=(resources_path, cache_path, profiling.enabled())) as pool:
+        for shard_estimates, profile in pool.imap(estimate_shard, shards):
+            if profile is not None:
+                profiling.active.merge(profile)
+            estimates += shard_estimates
+        pool.close()
+        pool.join()
+    return estimates
+
+
+def write_estimates(path: str, rows: List[Tuple[str, str]], estimates: List[Dict[str, Tuple[int, Optional[str]]]]):
+    ''' Write numbers of CQs per verbalization, question type and query to a JSON file and print their totals. '''
+    per_question_type = dict()
+    per_query = dict()
+    for estimate in estimates:
+        for category, (count, query) in estimate.items():
+            per_question_type[category] = per_question_type.get(category, 0) + count
+            if query:
+                per_query[query] = per_query.get(query, 0) + count
+    per_query = dict(sorted(per_query.items(), key=lambda item: item[1], reverse=True))
+    with open(path, 'w') as f:
+        json.dump({'cqs': sum(per_query.values()), 'per_question_type': per_question_type, 'per_query': per_query,
+                   'per_verbalization': [{'verbalization': verbalization,
+                                          'cqs': {category: count for category, (count, _) in estimate.items()}}
+                                         for (verbalization, _), estimate in zip(rows, estimates)]}, f, indent=4)
+    print(f"Estimated number of CQs: {sum(per_query.values())}")
+    print(f"Estimated number of CQs per question type: {per_question_type}")
+    print(f"Estimated number of queries: {len(per_query)}, "
+          f"most CQs per query: {next(iter(per_query.values()), 0)}")
+
+
+def build_options(args) -> Dict[str, Any]:
+    ''' Options which change the output of a whole build rather than of single rows (unset ones are left out). '''
+    options = dict()
+    if args.max_cqs_per_query is not None or args.max_cqs_per_type is not None:
+        options.update(max_cqs_per_query=args.max_cqs_per_query, max_cqs_per_type=args.max_cqs_per_type,
+                       seed=args.seed)
+    if args.near_duplicates:
+        options.update(near_duplicates=args.near_duplicates, near_duplicate_threshold=args.near_duplicate_threshold)
+    return options
+
+
+def build(rows: List[Tuple[str, str]], manifest: BuildManifest, args,
+          quotas: Optional[List[Dict[str, int]]] = None):
+    ''' Generate the whole dataset, recording in the manifest what every row produced. '''
+    manifest.reset()
+    manifest.set_options(build_options(args))
+    records = generate_records(rows, args.resources, None if args.no_cache else args.cache,
+                               args.workers, args.shard_size, with_shapes=True, quotas=quotas, seed=args.seed)
+
+    serializer = make_serializer(args)
+    summarizer = Summarizer(approximate=args.approximate_summary)
+    checkpoint = CheckpointWriter(args.checkpoint, args.checkpoint_compression) if args.checkpoint else None
+    # incremental rebuilds rewrite single query files, so only json builds are recorded
+    record_manifest = args.format == 'json'
+    for position, (row, (record, analyzed_shape)) in enumerate(zip(rows, records)):
+        if checkpoint is not None:
+            with profiling.stage('checkpoint.add'):
+                checkpoint.add(record, analyzed_shape)
+        with profiling.stage('serializer.add'):
+            serializer.add(record)
+        with profiling.stage('summarizer.add'):
+            summarizer.add(record)
+        if record_manifest:
+            with profiling.stage('manifest.put'):
+                manifest.put(position, row, record)
+    with profiling.stage('serializer.close'):
+        close_serializer(serializer, args)
+    if checkpoint is not None:
+        checkpoint.close()
+
+    if record_manifest:
+        for query, idx in serializer.query_ids.items():
+            manifest.set_query_file(query, idx)
+    manifest.commit()
+    summarizer.make_summary(args.summary)
+
+
+def rebuild_incrementally(rows: List[Tuple[str, str]], manifest: BuildManifest, args):
+    ''' Regenerate only rows which are new or whose templates, synonyms or code changed since the last build,
+    and rewrite only the files of queries these rows (or removed rows) contribute to. '''
+    changed, removed = manifest.diff(rows)
+    affected_queries = manifest.queries_of(removed | {row_key(rows[position]) for position in changed})
+    manifest.remove(removed)
+
+    records = generate_records([rows[position] for position in changed], args.resources,
+                               None if args.no_cache else args.cache, args.workers, args.shard_size)
+    query_files = manifest.query_files()
+    next_idx = max(query_files.values(), default=0) + 1
+    for position, record in zip(changed, records):
+        affected_queries |= manifest.put(position, rows[position], record)
+        # existing query files keep their numbers, new queries get numbers after the highest one (numbers of deleted
+        # files are not reused), so the numbering can differ from that of a full build
+        for query in record[2].values():
+            if query and query not in query_files:
+                query_files[query] = next_idx
+                manifest.set_query_file(query, next_idx)
+                next_idx += 1
+    manifest.update_positions(rows)
+
+    os.makedirs(args.output, exist_ok=True)
+    for query in affected_queries:
+        cqs = []
+        contributing_rows = 0
+        for _, record_cqs, record_queries in manifest.records_for(query):
+            contributing_rows += 1
+            for key in record_queries:
+                if record_queries[key] == query:
+                    cqs += record_cqs[key]
+
+        if contributing_rows > 0:
+            Serializer.write_query_file(args.output, query_files[query], query, cqs)
+        else:
+            os.remove(Serializer.query_file_path(args.output, query_files[query]))
+            manifest.drop_query(query)
+    manifest.commit()
+
+    print(f"Regenerated {len(changed)} rows, removed {len(removed)} rows, "
+          f"rewrote {len(affected_queries)} query files")
+    if args.checkpoint:
+        # the manifest does not keep analyzed shapes, so this checkpoint holds records only
+        write_checkpoint(args.checkpoint, manifest.records(), args.checkpoint_compression)
+    Summarizer(manifest.records(), args.approximate_summary).make_summary(args.summary)
+
+
+def make_serializer(args) -> Serializer:
+    pruner = NearDuplicatePruner(args.near_duplicates, args.near_duplicate_threshold) if args.near_duplicates else None
+    return Serializer(args.output, args.format, args.compression,
+                      args.output_shard_size * 2 ** 20 if args.output_shard_size else None, pruner)
+
+
+def close_serializer(serializer: Serializer, args):
+    ''' Write the output and report near-duplicate CQs removed from it. '''
+    serializer.close()
+    report_path = args.near_duplicates_report or os.path.join(args.output, 'near_duplicates.json')
+    if serializer.pruner is None:
+        if not args.near_duplicates_report and os.path.exists(report_path):
+            os.remove(report_path)  # left by an earlier build of the output folder
+    else:
+        serializer.pruner.write_report(report_path)
+        print(f"Removed {serializer.pruner.pruned} near-duplicate CQs of {serializer.pruner.kept} kept CQs, "
+              f"clusters are listed in {report_path}")
+
+
+def add_output_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--output', default='./BigCQ_mapping/',
+                        help='folder the query to CQs mappings are written to')
+    parser.add_argument('--format', choices=output_formats, default='json',
+                        help='json: one JSON file per query, jsonl: JSON Lines, parquet: a columnar Parquet file, '
+                             'compact: a memory-mappable store of interned strings (see compact_store.py)')
+    parser.add_argument('--compression', choices=compressions, default=None,
+                        help='compress jsonl or parquet output')
+    parser.add_argument('--output-shard-size', type=float, default=None,
+                        help='split jsonl output into shards of at most that many megabytes')
+    parser.add_argument('--near-duplicates', choices=scopes, default=None,
+                        help='remove CQs similar to other CQs of the same query or of any query (MinHash LSH)')
+    parser.add_argument('--near-duplicate-threshold', type=float, default=0.8,
+                        help='Jaccard similarity of word bigrams of near-duplicate CQs')
+    parser.add_argument('--near-duplicates-report', default=None,
+                        help='JSON file listing clusters of near-duplicates (default: near_duplicates.json in the '
+                             'output folder)')
+
+
+def add_summary_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--summary', default=None, help='JSON file to write the statistics of records to')
+    parser.add_argument('--approximate-summary', action='store_true',
+                        help='estimate numbers of distinct CQs, queries and links in constant memory (HyperLogLog)')
+
+
+def add_generate_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--input', default='../verbalization2turtle.csv',
+                        help='CSV file with verbalizations and axiom shapes')
+    parser.add_argument('--resources', default='./statements_to_cqs_transformations/',
+                        help='folder with CQ templates and synonym classes')
+    add_output_arguments(parser)
+    add_summary_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes used to generate CQs and queries')
+    parser.add_argument('--shard-size', type=int, default=256,
+                        help='number of rows parsed in one batch and sent to a worker at once')
+    parser.add_argument('--cache', default='./.analyzer_cache.sqlite',
+                        help='file with cached analyzed shapes')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the analyzed shapes cache')
+    parser.add_argument('--incremental', action='store_true',
+                        help='regenerate only what changed since the last build of the output folder')
+    parser.add_argument('--checkpoint', default=None,
+                        help='file to save generated records and analyzed shapes to, for the serialize and '
+                             'summarize commands')
+    parser.add_argument('--checkpoint-compression', choices=checkpoint_compressions, default='zlib',
+                        help='compression of the checkpoint blocks')
+    parser.add_argument('--dry-run', default=None, metavar='PATH',
+                        help='only estimate the number of CQs per verbalization, question type and query, write '
+                             'them to this JSON file and print their totals')
+    parser.add_argument('--max-cqs-per-query', type=int, default=None,
+                        help='sample CQs of rows so that every query gets at most that many CQs')
+    parser.add_argument('--max-cqs-per-type', type=int, default=None,
+                        help='sample CQs of rows so that every question type gets at most that many CQs')
+    parser.add_argument('--seed', type=int, default=0, help='seed of sampling CQs within budgets')
+    parser.add_argument('--profile', default=None,
+                        help='JSON file to write time spent in every stage and counters to, along with a Chrome '
+                             'trace (.trace.json) of all stages')
+
+
+def generate(args):
+    if args.profile:
+        profiling.enable()
+    rows = list(read_rows(args.input))
+    cache = None if args.no_cache else args.cache
+    budgeted = args.max_cqs_per_query is not None or args.max_cqs_per_type is not None
+    if args.dry_run or budgeted:
+        with profiling.stage('estimate'):
+            estimates = estimate_rows(rows, args.resources, cache, args.workers, args.shard_size)
+        if args.dry_run:
+            write_estimates(args.dry_run, rows, estimates)
+            if args.profile:
+                profiling.active.write(args.profile)
+            return
+    os.makedirs(args.output, exist_ok=True)
+    manifest = BuildManifest(os.path.join(args.output, '.build_manifest.sqlite'), args.resources)
+    if args.incremental and manifest.options() != build_options(args):
+        # e.g. budgets were split among the rows of the last build or near-duplicates were removed from all query
+        # files, regenerating some rows would not respect them
+        print(f"The last build used other options ({manifest.options()}), rebuilding everything")
+        build(rows, manifest, args)
+    elif args.incremental:
+        rebuild_incrementally(rows, manifest, args)
+    else:
+        build(rows, manifest, args, plan_quotas(estimates, args.max_cqs_per_query, args.max_cqs_per_type)
+              if budgeted else None)
+    manifest.close()
+    if args.profile:
+        profiling.active.write(args.profile)
+
+
+def serialize(args):
+    serializer = make_serializer(args)
+    for record in read_checkpoint(args.checkpoint):
+        serializer.add(record)
+    close_serializer(serializer, args)
+
+
+def summarize(args):
+    Summarizer(read_checkpoint(args.checkpoint), args.approximate_summary).make_summary(args.summary)
 
-with open('../verbalization2turtle.csv') as csv_file:
-    csv_reader = csv.reader(csv_file, delimiter=',')
-    result = []
 
-    for row in csv_reader:
-        idx = row[0]
-        verbalization = row[1]
-        axiom_shape_preprocessed = row[2]
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate the BigCQ dataset from verbalized axiom shapes and process generated records. '
+                    'Only generate parses verbalizations (with spaCy); without a command, generate is run.')
+    commands = parser.add_subparsers(dest='command')
+    generate_parser = commands.add_parser('generate', help='generate CQs and queries of verbalized axiom shapes')
+    add_generate_arguments(generate_parser)
+    generate_parser.set_defaults(run=generate)
 
-        if is_ACE_error(verbalization) or verbalization in result:
-            continue
+    serialize_parser = commands.add_parser('serialize', help='write checkpointed records in another output format')
+    serialize_parser.add_argument('checkpoint', help='file saved with generate --checkpoint')
+    add_output_arguments(serialize_parser)
+    serialize_parser.set_defaults(run=serialize)
 
-        analyzed_shape = analyzer.process(verbalization)
+    summarize_parser = commands.add_parser('summarize', help='print statistics of checkpointed records')
+    summarize_parser.add_argument('checkpoint', help='file saved with generate --checkpoint')
+    add_summary_arguments(summarize_parser)
+    summarize_parser.set_defaults(run=summarize)
 
-        cqs = cq_generator.make_cqs(verbalization, analyzed_shape)
-        for category in cqs:
-            cqs[category] = cq_generator.paraphrase_cqs(cqs[category])
-        queries = SPARQLOWLGenerator.make_queries(axiom_shape_preprocessed, analyzed_shape)
+    materialize_parser = commands.add_parser('materialize', help='materialize the templates against an ontology')
+    materializer.add_arguments(materialize_parser)
+    materialize_parser.set_defaults(run=materializer.run)
 
-        result.append((verbalization, cqs, queries))
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in commands.choices and argv[0] not in ['-h', '--help']:
+        argv = ['generate'] + argv  # generating was the only command, its options are still accepted alone
+    args = parser.parse_args(argv)
+    if args.command == 'generate' and args.incremental and args.format != 'json':
+        generate_parser.error('--incremental rewrites single query files, so it requires --format json')
+    if args.command == 'generate' and args.incremental and (args.max_cqs_per_query is not None or
+                                                            args.max_cqs_per_type is not None):
+        generate_parser.error('budgets are split among all rows, so they cannot be used with --incremental')
+    if args.command == 'generate' and args.incremental and args.near_duplicates:
+        generate_parser.error('near-duplicates are removed while writing all query files, use a full build')
+    args.run(args)
 
-    serializer = Serializer(result)
-    serializer.serialize_result()
-    #outfile = open('result','wb')
-    #pickle.dump(result, outfile)
-    #outfile.close()
 
-    #Summarizer(result).print_queries()
-    Summarizer(result).make_summary()
-    #Summarizer(result).print_cqs()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import bisect
+import functools
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+from serializer import load_mappings
+
+
+class MappingIndex:
+    ''' Forward (query -> CQs) and reverse (CQ -> queries) indexes over BigCQ mappings,
+    with sorted lists for prefix search and an inverted index of words for keyword search. '''
+    word_pattern = re.compile(r'\w+')
+
+    def __init__(self, mappings: Iterable[Tuple[str, List[str]]]):
+        self.cqs_per_query = dict()
+        self.queries_per_cq = dict()
+        for query, cqs in mappings:
+            query_cqs = self.cqs_per_query.setdefault(query, dict())
+            for cq in cqs:
+                query_cqs[cq] = None
+                self.queries_per_cq.setdefault(cq, dict())[query] = None
+        self.cqs_per_query = {query: list(cqs) for query, cqs in self.cqs_per_query.items()}
+        self.queries_per_cq = {cq: list(queries) for cq, queries in self.queries_per_cq.items()}
+
+        self.sorted_queries = sorted(self.cqs_per_query)
+        self.sorted_cqs = sorted(self.queries_per_cq)
+        self.query_words = self.index_words(self.sorted_queries)
+        self.cq_words = self.index_words(self.sorted_cqs)
+
+    @classmethod
+    def words(cls, text: str) -> List[str]:
+        return cls.word_pattern.findall(text.lower())
+
+    @classmethod
+    def index_words(cls, texts: List[str]) -> Dict[str, Set[int]]:
+        ''' Map every word to positions of texts (in a sorted list) containing it. '''
+        index = dict()
+        for position, text in enumerate(texts):
+            for word in cls.words(text):
+                index.setdefault(word, set()).add(position)
+        return index
+
+    @classmethod
+    def search(cls, texts: List[str], words_index: Dict[str, Set[int]],
+               prefix: str = '', keywords: Iterable[str] = ()) -> List[str]:
+        ''' Texts starting with `prefix` and containing all keywords, in sorted order. '''
+        start = bisect.bisect_left(texts, prefix)
+        end = bisect.bisect_left(texts, prefix + '\U0010ffff') if prefix else len(texts)
+
+        words = [word for keyword in keywords for word in cls.words(keyword)]
+        if not words:
+            return texts[start:end]
+        postings = sorted((words_index.get(word, set()) for word in words), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return [texts[position] for position in sorted(candidates) if start <= position < end]
+
+    def search_queries(self, prefix: str = '', keywords: Iterable[str] = ()) -> List[str]:
+        return self.search(self.sorted_queries, self.query_words, prefix, keywords)
+
+    def search_cqs(self, prefix: str = '', keywords: Iterable[str] = ()) -> List[str]:
+        return self.search(self.sorted_cqs, self.cq_words, prefix, keywords)
+
+
+class MappingService:
+    ''' Serves lookups over a `MappingIndex` through a minimal HTTP/1.1 (keep-alive) interface.
+
+    Endpoints (GET, JSON responses; every list is paged with `offset` and `limit`):
+        /cqs?query=Q                  CQs mapped to the SPARQL-OWL query Q
+        /queries?cq=CQ                SPARQL-OWL queries mapped to CQ
+        /search/cqs?prefix=P&keyword=K&keyword=...
+        /search/queries?prefix=P&keyword=K&keyword=...
+        /stats
+    Responses are kept in an LRU cache of `cache_size` entries.
+    '''
+    def __init__(self, index: MappingIndex, cache_size: int = 4096, max_limit: int = 1000):
+        self.index = index
+        self.max_limit = max_limit
+        self.respond = functools.lru_cache(maxsize=cache_size)(self.make_response)
+
+    def make_response(self, target: str) -> Tuple[int, bytes]:
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+
+        def param(name: str, default: Optional[str] = None) -> Optional[str]:
+            return params.get(name, [default])[0]
+
+        try:
+            offset = max(0, int(param('offset', '0')))
+            limit = min(self.max_limit, max(0, int(param('limit', '100'))))
+        except ValueError:
+            return 400, self.dump({'error': 'offset and limit must be integers'})
+
+        if url.path == '/cqs' and param('query') is not None:
+            results = self.index.cqs_per_query.get(param('query'), [])
+        elif url.path == '/queries' and param('cq') is not None:
+            results = self.index.queries_per_cq.get(param('cq'), [])
+        elif url.path == '/search/cqs':
+            results = self.index.search_cqs(param('prefix', ''), params.get('keyword', []))
+        elif url.path == '/search/queries':
+            results = self.index.search_queries(param('prefix', ''), params.get('keyword', []))
+        elif url.path == '/stats':
+            return 200, self.dump({'queries': len(self.index.cqs_per_query),
+                                   'cqs': len(self.index.queries_per_cq)})
+        else:
+            return 404, self.dump({'error': f'unknown endpoint or missing parameter: {url.path}'})
+
+        return 200, self.dump({'total': len(results), 'offset': offset,
+                               'results': results[offset:offset + limit]})
+
+    @staticmethod
+    def dump(response) -> bytes:
+        return json.dumps(response).encode('utf-8')
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3 or parts[0] != 'GET':
+                    status, body = 405, self.dump({'error': 'only GET requests are supported'})
+                else:
+                    status, body = self.respond(parts[1])
+                keep_alive = headers.get('connection', '').lower() != 'close' and parts[-1:] == ['HTTP/1.1']
+
+                writer.write(f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080, unix_socket: Optional[str] = None):
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve lookups over BigCQ query to CQ mappings.')
+    parser.add_argument('--mappings', default='../BigCQ_dataset/query_templates_to_cq_template_mappings/',
+                        help='folder written by Serializer (any output format)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', default=None, help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--cache-size', type=int, default=4096, help='number of cached responses')
+    args = parser.parse_args()
+
+    index = MappingIndex(load_mappings(args.mappings))
+    print(f'Loaded {len(index.cqs_per_query)} queries and {len(index.queries_per_cq)} CQs')
+    asyncio.run(MappingService(index, args.cache_size).serve(args.host, args.port, args.unix_socket))
+
+
+if __name__ == '__main__':
+    main()
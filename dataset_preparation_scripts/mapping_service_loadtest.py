@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+
+async def open_connection(host: str, port: int, unix_socket: Optional[str]):
+    if unix_socket:
+        return await asyncio.open_unix_connection(unix_socket)
+    return await asyncio.open_connection(host, port)
+
+
+async def get(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, target: str) -> Tuple[int, bytes]:
+    ''' Send a keep-alive GET request and read the whole response. '''
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: bigcq\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def make_targets(args) -> List[str]:
+    ''' Build a mix of lookups, prefix and keyword searches from a sample of the served data. '''
+    reader, writer = await open_connection(args.host, args.port, args.unix_socket)
+    _, body = await get(reader, writer, '/search/queries?limit=1000')
+    queries = json.loads(body)['results']
+    _, body = await get(reader, writer, '/search/cqs?limit=1000')
+    cqs = json.loads(body)['results']
+    writer.close()
+
+    rng = random.Random(args.seed)
+    targets = []
+    for _ in range(args.requests):
+        kind = rng.random()
+        if kind < 0.4:
+            targets.append(f'/cqs?query={quote(rng.choice(queries))}&limit=50')
+        elif kind < 0.8:
+            targets.append(f'/queries?cq={quote(rng.choice(cqs))}')
+        elif kind < 0.9:
+            targets.append(f'/search/cqs?prefix={quote(rng.choice(cqs)[:rng.randint(1, 12)])}&limit=20')
+        else:
+            words = rng.choice(cqs).split()
+            targets.append(f'/search/cqs?keyword={quote(rng.choice(words))}&offset={rng.randint(0, 50)}&limit=20')
+    return targets
+
+
+async def client(args, targets: List[str], latencies: List[float]):
+    reader, writer = await open_connection(args.host, args.port, args.unix_socket)
+    while targets:
+        target = targets.pop()
+        start = time.perf_counter()
+        status, _ = await get(reader, writer, target)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            print(f'{status}: {target}')
+    writer.close()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(args):
+    targets = await make_targets(args)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(args, targets, latencies) for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f'{len(latencies)} requests, {args.concurrency} concurrent clients, {elapsed:.2f} s')
+    print(f'throughput: {len(latencies) / elapsed:.0f} requests/s')
+    print(f'p50: {percentile(latencies, 0.50) * 1000:.3f} ms, p99: {percentile(latencies, 0.99) * 1000:.3f} ms, '
+          f'max: {latencies[-1] * 1000:.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure latency of mapping_service.py under concurrent load.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--concurrency', type=int, default=64, help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=20000, help='total number of requests')
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
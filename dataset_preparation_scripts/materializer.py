@@ -0,0 +1,693 @@
+import argparse
+import datetime
+import functools
+import glob
+import json
+import os
+import re
+import time
+from array import array
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from serializer import compression_suffix, compressions, load_mappings, open_compressed
+from sparql_canonicalizer import BNode, Collection, Group, Iri, Literal, Term, Triple, Var, \
+    default_prefixes, parse_query, placeholder_pattern, render_iri
+from triple_index import TripleIndex, build_triple_index, label_predicates, literal_term, parse_literal
+
+# Materializes SPARQL-OWL query templates and their CQ templates against an ontology: placeholders of a query
+# (<c1>, <op1>, <dp1>, <i1>, <dt1>) are unified with axioms of the ontology, so every materialized query has
+# an answer, and the same entities (their labels) fill in the CQs mapped to the query.
+
+rdf = default_prefixes['rdf']
+rdfs = default_prefixes['rdfs']
+owl = default_prefixes['owl']
+xsd = default_prefixes['xsd']
+vocabularies = tuple(default_prefixes.values())
+# predicates stating axioms, as opposed to predicates describing class expressions
+axiom_predicates = {rdfs + 'subClassOf', owl + 'equivalentClass', owl + 'disjointWith', rdfs + 'domain',
+                    rdfs + 'range', rdfs + 'subPropertyOf', owl + 'inverseOf', rdf + 'type'}
+query_slot_pattern = re.compile(r'<((?:c|op|dp|i|dt)[0-9]+)>')
+cq_slot_pattern = re.compile(r'\b((?:c|op|dp|i|dt)[0-9]+)\b')
+
+
+def is_entity(term: Term) -> bool:
+    ''' Named entities and data values, which may fill placeholders (as opposed to OWL/RDF vocabulary). '''
+    return isinstance(term, Literal) or isinstance(term, Iri) and not term.value.startswith(vocabularies)
+
+
+def signature(term: Term) -> str:
+    ''' Structure of a term without its entities, axioms and query patterns with the same signature may unify. '''
+    if isinstance(term, Var) or is_entity(term) or isinstance(term, Iri) and placeholder_pattern.match(term.value):
+        return '*'
+    if isinstance(term, Iri):
+        return render_iri(term.value)
+    if isinstance(term, BNode):
+        return '[ ' + ' ; '.join(sorted(signature(p) + ' ' + signature(o) for p, o in term.properties)) + ' ]'
+    if isinstance(term, Collection):
+        return '( ' + ' '.join(sorted(signature(item) for item in term.items)) + ' )'
+    raise ValueError(f'{type(term).__name__} terms can not be materialized')
+
+
+def triple_signature(triple: Triple) -> str:
+    return ' '.join(signature(term) for term in triple)
+
+
+class OntologyIndex:
+    ''' Axioms of an ontology held in memory, as (subject, class expression tree) pairs grouped by the signature of
+    their triples, with a label and a placeholder kind (c, op, dp, i or dt) of every entity.
+
+    Terms are passed to the matcher as handles: here the terms themselves, in `MappedOntologyIndex` term ids, which
+    are decoded only for bindings (`term`, `label`). '''
+    def __init__(self):
+        self.labels = dict()  # IRI -> label
+        self.kinds = dict()  # IRI -> placeholder kind
+        self.axioms = dict()  # signature -> (subject, object) pairs
+        self.axioms_by_subject = dict()  # (signature, subject IRI) -> (subject, object) pairs
+
+    def add_entity(self, iri: str, kind: str, label: Optional[str] = None):
+        self.kinds[iri] = kind
+        self.labels[iri] = label or re.split(r'[#/]', iri)[-1]
+
+    def add_axiom(self, subject: Term, predicate: str, object: Term):
+        key = triple_signature(Triple(subject, Iri(predicate), object))
+        self.axioms.setdefault(key, []).append((subject, object))
+        if isinstance(subject, Iri):
+            self.axioms_by_subject.setdefault((key, subject.value), []).append((subject, object))
+
+    def candidates(self, pattern: Triple, signature: str, bindings: Dict[str, Any]) -> Iterable[Tuple[Any, Any]]:
+        ''' (subject, object) handles of axioms which may match a pattern triple (with an axiom predicate) of the
+        given signature under the bindings. '''
+        subject = handle_of(pattern.subject, bindings, self)
+        if isinstance(subject, Iri):
+            return self.axioms_by_subject.get((signature, subject.value), [])
+        return self.axioms.get(signature, [])
+
+    def count(self, pattern: Triple, signature: str, bindings: Dict[str, Any]) -> int:
+        ''' Number of `candidates` (or an estimate of it). '''
+        return len(self.candidates(pattern, signature, bindings))
+
+    def resolve(self, term: Term):
+        ''' Handle of an IRI or a literal of a pattern (None if the ontology does not mention it). '''
+        return term
+
+    def is_entity(self, handle) -> bool:
+        return is_entity(handle)
+
+    def kind(self, handle) -> Optional[str]:
+        if isinstance(handle, Literal):
+            return 'dt'
+        return self.kinds.get(handle.value) if isinstance(handle, Iri) else None
+
+    def properties(self, handle) -> Optional[tuple]:
+        ''' (predicate, object) handles of a class expression given as a blank node, None for other terms. '''
+        return handle.properties if isinstance(handle, BNode) else None
+
+    def items(self, handle) -> Optional[tuple]:
+        ''' Handles of the items of a collection, None for other terms. '''
+        return handle.items if isinstance(handle, Collection) else None
+
+    def term(self, handle) -> Term:
+        return handle
+
+    def label(self, handle) -> str:
+        if isinstance(handle, Literal):
+            return handle.value
+        return self.labels.get(handle.value, handle.value)
+
+    def __len__(self) -> int:
+        return sum(len(axioms) for axioms in self.axioms.values())
+
+
+def load_owlready_index(path: str) -> OntologyIndex:
+    ''' Index an ontology (with its imports) loaded with owlready2. '''
+    try:
+        import owlready2
+    except ImportError:
+        raise ImportError('loading ontologies requires the `owlready2` package: pip install owlready2')
+
+    datatypes = {int: xsd + 'integer', float: xsd + 'decimal', bool: xsd + 'boolean', str: xsd + 'string',
+                 owlready2.normstr: xsd + 'normalizedString', datetime.datetime: xsd + 'dateTime',
+                 datetime.date: xsd + 'date', datetime.time: xsd + 'time'}
+    qualified_cardinalities = {owlready2.EXACTLY: 'qualifiedCardinality', owlready2.MIN: 'minQualifiedCardinality',
+                               owlready2.MAX: 'maxQualifiedCardinality'}
+    cardinalities = {owlready2.EXACTLY: 'cardinality', owlready2.MIN: 'minCardinality',
+                     owlready2.MAX: 'maxCardinality'}
+    ignored = [owlready2.Thing, owlready2.ObjectProperty, owlready2.DataProperty, owlready2.AnnotationProperty]
+    restriction = (Iri(rdf + 'type'), Iri(owl + 'Restriction'))
+
+    def label(entity) -> str:
+        if hasattr(entity, 'prefLabel') and entity.prefLabel.first() is not None:
+            return str(entity.prefLabel.first())
+        if entity.label.first() is not None:
+            return str(entity.label.first())
+        return entity.name
+
+    def value(data) -> Term:
+        if isinstance(data, owlready2.locstr):
+            return Literal(str(data), None, data.lang)
+        if isinstance(data, bool):
+            return Literal('true' if data else 'false', xsd + 'boolean')
+        if type(data) in datatypes:
+            return Literal(data.isoformat() if hasattr(data, 'isoformat') else str(data), datatypes[type(data)])
+        return expression(data)
+
+    def expression(construct) -> Term:
+        if isinstance(construct, (owlready2.ThingClass, owlready2.PropertyClass, owlready2.Thing)):
+            return Iri(construct.iri)
+        if isinstance(construct, type) and construct in datatypes:
+            return Iri(datatypes[construct])
+        if isinstance(construct, owlready2.Inverse):
+            return BNode(((Iri(owl + 'inverseOf'), expression(construct.property)),))
+        if isinstance(construct, owlready2.Restriction):
+            on_property = (Iri(owl + 'onProperty'), expression(construct.property))
+            if construct.type == owlready2.SOME:
+                return BNode((restriction, on_property, (Iri(owl + 'someValuesFrom'), expression(construct.value))))
+            if construct.type == owlready2.ONLY:
+                return BNode((restriction, on_property, (Iri(owl + 'allValuesFrom'), expression(construct.value))))
+            if construct.type == owlready2.VALUE:
+                return BNode((restriction, on_property, (Iri(owl + 'hasValue'), value(construct.value))))
+            if construct.type == owlready2.HAS_SELF:
+                return BNode((restriction, on_property, (Iri(owl + 'hasSelf'), Literal('true', xsd + 'boolean'))))
+            count = Literal(str(construct.cardinality), xsd + 'nonNegativeInteger')
+            if construct.value is None or construct.value is owlready2.Thing:
+                return BNode((restriction, on_property, (Iri(owl + cardinalities[construct.type]), count)))
+            return BNode((restriction, on_property, (Iri(owl + 'onClass'), expression(construct.value)),
+                          (Iri(owl + qualified_cardinalities[construct.type]), count)))
+        if isinstance(construct, owlready2.And):
+            return BNode(((Iri(owl + 'intersectionOf'), Collection(tuple(map(expression, construct.Classes)))),))
+        if isinstance(construct, owlready2.Or):
+            return BNode(((Iri(owl + 'unionOf'), Collection(tuple(map(expression, construct.Classes)))),))
+        if isinstance(construct, owlready2.Not):
+            return BNode(((Iri(owl + 'complementOf'), expression(construct.Class)),))
+        if isinstance(construct, owlready2.OneOf):
+            return BNode(((Iri(owl + 'oneOf'), Collection(tuple(map(value, construct.instances)))),))
+        raise ValueError(f'unsupported class expression: {construct!r}')
+
+    def add_axioms(subject, predicate: str, constructs):
+        for construct in constructs:
+            if any(construct is entity for entity in ignored):
+                continue
+            try:
+                index.add_axiom(expression(subject), predicate, expression(construct))
+            except ValueError:
+                pass  # constructs the templates can not refer to, e.g. constrained datatypes
+
+    ontology = owlready2.get_ontology('file://' + os.path.abspath(path)).load()
+    index = OntologyIndex()
+    for datatype in datatypes.values():
+        index.add_entity(datatype, 'dt')
+
+    for onto in dict.fromkeys([ontology, *ontology.indirectly_imported_ontologies()]):
+        for owl_class in onto.classes():
+            index.add_entity(owl_class.iri, 'c', label(owl_class))
+            add_axioms(owl_class, rdfs + 'subClassOf', owl_class.is_a)
+            add_axioms(owl_class, owl + 'equivalentClass', owl_class.equivalent_to)
+        for kind, properties in [('op', onto.object_properties()), ('dp', onto.data_properties())]:
+            for owl_property in properties:
+                index.add_entity(owl_property.iri, kind, label(owl_property))
+                add_axioms(owl_property, rdfs + 'subPropertyOf', owl_property.is_a)
+                add_axioms(owl_property, rdfs + 'domain', owl_property.domain)
+                add_axioms(owl_property, rdfs + 'range', owl_property.range)
+                if kind == 'op' and owl_property.inverse_property is not None:
+                    add_axioms(owl_property, owl + 'inverseOf', [owl_property.inverse_property])
+        for individual in onto.individuals():
+            index.add_entity(individual.iri, 'i', label(individual))
+            add_axioms(individual, rdf + 'type', individual.is_a)
+        for disjoint in onto.disjoint_classes():
+            if len(disjoint.entities) == 2:
+                add_axioms(disjoint.entities[0], owl + 'disjointWith', disjoint.entities[1:])
+        for axiom in onto.general_class_axioms():
+            add_axioms(axiom.left_side, rdfs + 'subClassOf', axiom.is_a)
+    return index
+
+
+class MappedOntologyIndex(OntologyIndex):
+    ''' Axioms of an ontology looked up by term id in a memory-mapped triple index written by
+    `triple_index.build_triple_index`. Class expressions are followed through their blank nodes while they are
+    unified with patterns, and only terms of bindings are decoded, so the ontology is never loaded into memory;
+    only the kinds of entities met and the ids of axioms grouped by signature are kept. '''
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.store = TripleIndex(path)
+        self.kinds = dict()  # term id -> placeholder kind
+        self.signatures = dict()  # predicate id -> axioms grouped by signature (see `axioms_of`)
+        # the same terms and blank nodes are met again and again while templates are matched
+        self.term_id = functools.lru_cache(maxsize=1 << 16)(self.find_term_id)
+        self.text = functools.lru_cache(maxsize=1 << 16)(self.store.term)
+        self.node_properties = functools.lru_cache(maxsize=1 << 16)(self.find_properties)
+        self.type_id, self.subclass_id = self.resolve(Iri(rdf + 'type')), self.resolve(Iri(rdfs + 'subClassOf'))
+        self.first, self.nil = self.resolve(Iri(rdf + 'first')), self.resolve(Iri(rdf + 'nil'))
+        self.rest, self.owl_class = self.resolve(Iri(rdf + 'rest')), self.resolve(Iri(owl + 'Class'))
+        declarations = {owl + 'Class': 'c', rdfs + 'Class': 'c', owl + 'ObjectProperty': 'op',
+                        owl + 'DatatypeProperty': 'dp', owl + 'NamedIndividual': 'i'}
+        self.declarations = {self.resolve(Iri(iri)): kind for iri, kind in declarations.items()}
+        self.datatypes = {self.resolve(Iri(xsd + datatype)) for datatype in
+                          ['integer', 'decimal', 'boolean', 'string', 'normalizedString', 'dateTime', 'date', 'time']}
+        self.label_ids = [self.resolve(Iri(predicate)) for predicate in label_predicates]
+
+    def __reduce__(self):
+        # worker processes map the index file themselves instead of receiving a copy of it
+        return MappedOntologyIndex, (self.path,)
+
+    def candidates(self, pattern: Triple, signature: str, bindings: Dict[str, Any]) -> Iterable[Tuple[int, int]]:
+        ''' Axioms are looked up by the bound subject or object of the pattern, otherwise by their signature. '''
+        predicate, subject, object = self.lookup(pattern, bindings)
+        if predicate is None:
+            return ()
+        if subject is None and object is None:
+            axioms = self.axioms_of(predicate).get(signature, array('I'))
+            return zip(axioms[0::2], axioms[1::2])
+        return ((subject, object) for subject, _, object in self.store.triples(subject, predicate, object)
+                if self.is_axiom(subject, predicate, object))
+
+    def count(self, pattern: Triple, signature: str, bindings: Dict[str, Any]) -> int:
+        predicate, subject, object = self.lookup(pattern, bindings)
+        if predicate is None:
+            return 0
+        if subject is None and object is None:
+            return len(self.axioms_of(predicate).get(signature, ())) // 2
+        return self.store.count(subject, predicate, object)
+
+    def lookup(self, pattern: Triple, bindings: Dict[str, Any]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        ''' Ids of the predicate and of the bound subject and object of a pattern, no predicate if the pattern can
+        not match any axiom. '''
+        predicate = self.resolve(pattern.predicate)
+        subject, object = handle_of(pattern.subject, bindings, self), handle_of(pattern.object, bindings, self)
+        if is_fixed(pattern.subject) and subject is None or is_fixed(pattern.object) and object is None:
+            return None, None, None
+        return predicate, subject, object
+
+    def is_axiom(self, subject: int, predicate: int, object: int) -> bool:
+        ''' Whether a triple states an axiom, as opposed to axioms about OWL vocabulary and declarations (e.g.
+        subclasses of owl:Thing) and types of other terms than individuals. '''
+        if self.text(subject).startswith('"') or self.is_vocabulary(object):
+            return False
+        return predicate != self.type_id or self.kind(subject) == 'i'
+
+    def axioms_of(self, predicate: int) -> Dict[str, array]:
+        ''' Axioms with the predicate grouped by signature, as arrays of alternating subject and object ids;
+        they are grouped when the predicate is first looked up. '''
+        if predicate not in self.signatures:
+            groups = dict()
+            for subject, _, object in self.store.triples(None, predicate):
+                if not self.is_axiom(subject, predicate, object):
+                    continue
+                try:
+                    key = ' '.join(self.signature(term_id) for term_id in (subject, predicate, object))
+                except ValueError:
+                    continue
+                groups.setdefault(key, array('I')).extend((subject, object))
+            self.signatures[predicate] = groups
+        return self.signatures[predicate]
+
+    def signature(self, term_id: int, depth: int = 0) -> str:
+        ''' `signature` of the term with the id. '''
+        if self.is_entity(term_id):
+            return '*'
+        if not self.text(term_id).startswith('_:') and term_id != self.nil:
+            return render_iri(self.text(term_id)[1:-1])
+        if depth > 64:
+            raise ValueError('class expression nested too deeply')
+        items = self.items(term_id)
+        if items is not None:
+            return '( ' + ' '.join(sorted(self.signature(item, depth + 1) for item in items)) + ' )'
+        return '[ ' + ' ; '.join(sorted(self.signature(predicate, depth + 1) + ' ' +
+                                        self.signature(object, depth + 1)
+                                        for predicate, object in self.properties(term_id))) + ' ]'
+
+    def resolve(self, term: Term) -> Optional[int]:
+        return self.term_id(term)
+
+    def find_term_id(self, term: Term) -> Optional[int]:
+        return self.store.find_term('<' + term.value + '>' if isinstance(term, Iri) else literal_term(*term))
+
+    def is_vocabulary(self, term_id: int) -> bool:
+        text = self.text(term_id)
+        return text.startswith('<') and text[1:].startswith(vocabularies)
+
+    def is_entity(self, term_id: int) -> bool:
+        text = self.text(term_id)
+        return text.startswith('"') or text.startswith('<') and not text[1:].startswith(vocabularies)
+
+    def kind(self, term_id: int) -> Optional[str]:
+        if term_id not in self.kinds:
+            self.kinds[term_id] = None  # while it is being found, for cycles of rdf:type
+            self.kinds[term_id] = self.find_kind(term_id)
+        return self.kinds[term_id]
+
+    def find_kind(self, term_id: int) -> Optional[str]:
+        ''' Declared kind of an entity, dt for datatypes and literals, and otherwise c for classes in subclass axioms
+        and i for instances of classes. '''
+        text = self.text(term_id)
+        if text.startswith('"'):
+            return 'dt'
+        if not text.startswith('<'):
+            return None
+        types = [] if self.type_id is None else [object for _, _, object in self.store.triples(term_id, self.type_id)]
+        for object in types:
+            if object in self.declarations:
+                return self.declarations[object]
+        if term_id in self.datatypes:
+            return 'dt'
+        if not text[1:].startswith(vocabularies) and self.subclass_id is not None and \
+                (self.store.count(term_id, self.subclass_id) or self.store.count(None, self.subclass_id, term_id)):
+            return 'c'
+        if any(self.kind(object) == 'c' for object in types):
+            return 'i'
+        return None
+
+    def properties(self, term_id: int) -> Optional[tuple]:
+        return self.node_properties(term_id)
+
+    def find_properties(self, term_id: int) -> Optional[tuple]:
+        if not self.text(term_id).startswith('_:'):
+            return None
+        properties = [(predicate, object) for _, predicate, object in self.store.triples(term_id)]
+        if any(predicate == self.first for predicate, _ in properties):
+            return None  # a collection
+        return tuple(pair for pair in properties if pair != (self.type_id, self.owl_class))
+
+    def items(self, term_id: int) -> Optional[tuple]:
+        if term_id == self.nil:
+            return ()
+        if None in (self.first, self.rest) or not self.text(term_id).startswith('_:') or \
+                not self.store.count(term_id, self.first):
+            return None
+        items = []
+        while term_id != self.nil and len(items) <= 10000:
+            items += [object for _, _, object in self.store.triples(term_id, self.first)]
+            term_id = next((object for _, _, object in self.store.triples(term_id, self.rest)), self.nil)
+        return tuple(items)
+
+    def term(self, term_id: int) -> Term:
+        text = self.text(term_id)
+        return Literal(*parse_literal(text)) if text.startswith('"') else Iri(text[1:-1])
+
+    def label(self, term_id: int) -> str:
+        ''' Preferred label first, then English or untagged labels, and otherwise the end of the IRI. '''
+        term = self.term(term_id)
+        if isinstance(term, Literal):
+            return term.value
+        best = None
+        for rank, predicate in enumerate(self.label_ids):
+            for _, _, object in self.store.triples(term_id, predicate) if predicate is not None else ():
+                text = self.text(object)
+                if text.startswith('"'):
+                    lexical, _, language = parse_literal(text)
+                    key = (rank, language not in (None, 'en'))
+                    if best is None or key < best[0]:
+                        best = (key, lexical)
+        return best[1] if best is not None else re.split(r'[#/]', term.value)[-1]
+
+    def __len__(self) -> int:
+        ''' Number of triples with axiom predicates (including declarations). '''
+        predicates = filter(None, (self.resolve(Iri(predicate)) for predicate in axiom_predicates))
+        return sum(self.store.count(None, predicate) for predicate in predicates)
+
+    def close(self):
+        self.store.close()
+
+
+def load_triple_index(path: str) -> MappedOntologyIndex:
+    ''' Look axioms of an ontology up in a triple index written by `triple_index.build_triple_index`. '''
+    return MappedOntologyIndex(path)
+
+
+def load_index(ontology: str, loader: str = 'stream', index_folder: str = '.') -> OntologyIndex:
+    ''' Index an ontology with owlready2 or from its triple index (`.bigcqti`), which is built in `index_folder`
+    unless given directly and rebuilt when the ontology changes. '''
+    if loader == 'owlready':
+        return load_owlready_index(ontology)
+    index_path = ontology
+    if not ontology.endswith('.bigcqti'):
+        os.makedirs(index_folder, exist_ok=True)
+        index_path = os.path.join(index_folder, os.path.basename(ontology) + '.bigcqti')
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(ontology):
+            build_triple_index(ontology, index_path)
+    return load_triple_index(index_path)
+
+
+def pattern_triples(group: Group) -> List[Triple]:
+    ''' Triples of a query pattern; blank nodes in subject position are split into a class expression
+    and the axioms stated about it, as in axioms of `OntologyIndex`. '''
+    if group.filters or group.optionals or group.unions:
+        raise ValueError('only basic graph patterns can be materialized')
+
+    def normalize(term: Term) -> Term:
+        if term == Iri(rdf + 'nil'):
+            return Collection(())
+        if isinstance(term, BNode):
+            return BNode(tuple((normalize(p), normalize(o)) for p, o in term.properties))
+        if isinstance(term, Collection):
+            return Collection(tuple(map(normalize, term.items)))
+        return term
+
+    triples = [Triple(*map(normalize, triple)) for triple in group.triples]
+    for node in group.nodes:
+        node = normalize(node)
+        subject = BNode(tuple((p, o) for p, o in node.properties if p.value not in axiom_predicates))
+        triples += [Triple(subject, p, o) for p, o in node.properties if p.value in axiom_predicates]
+    return triples
+
+
+def is_fixed(term: Term) -> bool:
+    ''' Whether a pattern term is an IRI or a literal, rather than a placeholder, a variable or a class expression. '''
+    return isinstance(term, Literal) or isinstance(term, Iri) and not placeholder_pattern.match(term.value)
+
+
+def handle_of(term: Term, bindings: Dict[str, Any], index: OntologyIndex):
+    ''' Handle of the entity a pattern term stands for: its binding or the resolved IRI or literal; None for unbound
+    placeholders and variables and for class expressions. '''
+    if isinstance(term, Var):
+        return bindings.get('?' + term.name)
+    if isinstance(term, Iri) and placeholder_pattern.match(term.value):
+        return bindings.get(term.value)
+    return index.resolve(term) if isinstance(term, (Iri, Literal)) else None
+
+
+def unify(pattern: Term, handle, bindings: Dict[str, Any], index: OntologyIndex) -> Iterator[Dict[str, Any]]:
+    ''' All extensions of `bindings` (placeholder or ?variable -> handle of an entity) under which `pattern` matches
+    the term of `handle`. Properties of blank nodes and items of collections may match in any order. '''
+    if isinstance(pattern, Var) or isinstance(pattern, Iri) and placeholder_pattern.match(pattern.value):
+        key = '?' + pattern.name if isinstance(pattern, Var) else pattern.value
+        if key in bindings:
+            if bindings[key] == handle:
+                yield bindings
+        elif index.is_entity(handle):
+            if isinstance(pattern, Iri):
+                # placeholders are filled with entities of their kind, different placeholders with different entities
+                if index.kind(handle) != placeholder_pattern.match(pattern.value).group(1).lower() or \
+                        handle in bindings.values():
+                    return
+            yield {**bindings, key: handle}
+    elif isinstance(pattern, (Iri, Literal)):
+        if index.resolve(pattern) == handle:
+            yield bindings
+    elif isinstance(pattern, BNode):
+        properties = index.properties(handle)
+        if properties is not None:
+            yield from unify_unordered(pattern.properties, properties, bindings, index, unify_property)
+    elif isinstance(pattern, Collection):
+        items = index.items(handle)
+        if items is not None and len(pattern.items) == len(items):
+            yield from unify_unordered(pattern.items, items, bindings, index, unify)
+
+
+def unify_property(pattern: Tuple[Term, Term], handles: Tuple[Any, Any], bindings: Dict[str, Any],
+                   index: OntologyIndex) -> Iterator[Dict[str, Any]]:
+    for extended in unify(pattern[0], handles[0], bindings, index):
+        yield from unify(pattern[1], handles[1], extended, index)
+
+
+def unify_unordered(patterns: tuple, handles: tuple, bindings: Dict[str, Any], index: OntologyIndex,
+                    unify_one) -> Iterator[Dict[str, Any]]:
+    ''' Match every pattern with a different term with `unify_one`, in any order. '''
+    if not patterns:
+        yield bindings
+        return
+    for position, handle in enumerate(handles):
+        for extended in unify_one(patterns[0], handle, bindings, index):
+            yield from unify_unordered(patterns[1:], handles[:position] + handles[position + 1:], extended, index,
+                                       unify_one)
+
+
+def match_triples(patterns: List[Triple], signatures: List[str], index: OntologyIndex,
+                  bindings: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    ''' Bindings (to handles of entities, see `OntologyIndex`) under which all pattern triples match axioms of the
+    index. The pattern with the fewest candidate axioms is matched first; axioms are looked up by the entities
+    already bound in a pattern. '''
+    if not patterns:
+        yield bindings
+        return
+
+    def count(position: int) -> int:
+        predicate = patterns[position].predicate
+        if not isinstance(predicate, Iri) or predicate.value not in axiom_predicates:
+            return 0
+        return index.count(patterns[position], signatures[position], bindings)
+
+    position = min(range(len(patterns)), key=count)
+    if count(position) == 0:
+        return
+    pattern = patterns[position]
+    rest = patterns[:position] + patterns[position + 1:]
+    rest_signatures = signatures[:position] + signatures[position + 1:]
+    for subject, object in index.candidates(pattern, signatures[position], bindings):
+        for with_subject in unify(pattern.subject, subject, bindings, index):
+            for extended in unify(pattern.object, object, with_subject, index):
+                yield from match_triples(rest, rest_signatures, index, extended)
+
+
+def split_template(pattern, template: str) -> List[str]:
+    ''' Fixed segments (even positions) and placeholder names (odd positions) of a template. '''
+    return pattern.split(template)
+
+
+def fill(parts: List[str], replacements: Dict[str, str]) -> str:
+    parts = parts[:]
+    for idx in range(1, len(parts), 2):
+        parts[idx] = replacements.get(parts[idx], parts[idx])
+    return ''.join(parts)
+
+
+def query_term(term: Term) -> str:
+    if isinstance(term, Literal):
+        if term.datatype is not None:
+            return f'"{term.value}"^^<{term.datatype}>'
+        return f'"{term.value}"' + (f'@{term.language}' if term.language else '')
+    return f'<{term.value}>'
+
+
+class TemplatePlan:
+    ''' A query template and its CQ templates compiled for materialization: the query pattern as triples with
+    their signatures, and both kinds of templates split at their placeholders. '''
+    def __init__(self, query: str, cqs: List[str]):
+        self.query = query
+        self.patterns = pattern_triples(parse_query(query).where)
+        self.signatures = [triple_signature(triple) for triple in self.patterns]
+        self.placeholders = sorted(set(query_slot_pattern.findall(query)))
+        self.query_parts = split_template(query_slot_pattern, query)
+        self.cq_parts = [split_template(cq_slot_pattern, cq) for cq in cqs]
+
+    def bindings(self, index: OntologyIndex) -> Iterator[Dict[str, Any]]:
+        ''' Distinct fillings of the placeholders (handles of entities) under which the query has an answer. '''
+        seen = set()
+        for bindings in match_triples(self.patterns, self.signatures, index, dict()):
+            key = tuple(bindings[placeholder] for placeholder in self.placeholders)
+            if key not in seen:
+                seen.add(key)
+                yield {placeholder: bindings[placeholder] for placeholder in self.placeholders}
+
+    def materialize(self, index: OntologyIndex, max_cqs: Optional[int] = None) -> Iterator[dict]:
+        ''' Materialized query with its CQs for every binding. With `max_cqs`, every binding takes the next
+        `max_cqs` CQ templates (cyclically), so that all paraphrases are used across bindings. '''
+        for number, handles in enumerate(self.bindings(index)):
+            bindings = {placeholder: index.term(handle) for placeholder, handle in handles.items()}
+            labels = {placeholder: index.label(handle) for placeholder, handle in handles.items()}
+            if max_cqs is None or max_cqs >= len(self.cq_parts):
+                cq_parts = self.cq_parts
+            else:
+                start = number * max_cqs % len(self.cq_parts)
+                cq_parts = (self.cq_parts + self.cq_parts)[start:start + max_cqs]
+            yield {'query': fill(self.query_parts, {p: query_term(term) for p, term in bindings.items()}),
+                   'cqs': [fill(parts, labels) for parts in cq_parts],
+                   'bindings': {placeholder: term.value for placeholder, term in bindings.items()}}
+
+
+# every worker process holds the ontology index (a mapped index is passed as its path and mapped again)
+worker_index = None
+
+
+def init_worker(index: OntologyIndex):
+    global worker_index
+    worker_index = index
+
+
+def materialize_template(task) -> Tuple[int, int, int, Optional[str]]:
+    ''' Write materializations of a single template to its own file; return the template number,
+    the numbers of bindings and (CQ, query) pairs and an error message for unsupported templates. '''
+    idx, query, cqs, out_folder, compression, max_cqs = task
+    try:
+        plan = TemplatePlan(query, cqs)
+    except ValueError as e:
+        return idx, 0, 0, str(e)
+
+    path = os.path.join(out_folder, f'materialized_{idx}.jsonl' + compression_suffix(compression))
+    bindings = pairs = 0
+    f = None
+    try:
+        for materialized in plan.materialize(worker_index, max_cqs):
+            if f is None:
+                f = open_compressed(path, 'w', compression)
+            f.write(json.dumps(materialized, separators=(',', ':')) + '\n')
+            bindings += 1
+            pairs += len(materialized['cqs'])
+    finally:
+        if f is not None:
+            f.close()
+    return idx, bindings, pairs, None
+
+
+def materialize(index: OntologyIndex, mappings: Iterable[Tuple[str, List[str]]], out_folder: str,
+                workers: int = 1, compression: Optional[str] = None, max_cqs: Optional[int] = None) \
+        -> Iterator[Tuple[int, int, int, Optional[str]]]:
+    ''' Materialize all templates into `out_folder/materialized_<template number>.jsonl`, one JSON object
+    (query, cqs, bindings) per line. Templates are spread over a pool of workers sharing the index;
+    results of `materialize_template` are yielded as templates are finished. '''
+    os.makedirs(out_folder, exist_ok=True)
+    # files left by a previous run would mix with the new ones (templates without bindings get no file)
+    for path in glob.glob(os.path.join(out_folder, 'materialized_*.jsonl*')):
+        os.remove(path)
+    tasks = ((idx, query, cqs, out_folder, compression, max_cqs)
+             for idx, (query, cqs) in enumerate(mappings, start=1))
+    if workers <= 1:
+        init_worker(index)
+        yield from map(materialize_template, tasks)
+        return
+    with Pool(workers, initializer=init_worker, initargs=(index,)) as pool:
+        yield from pool.imap_unordered(materialize_template, tasks)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('ontology', help='Turtle (.ttl), N-Triples (.nt) or RDF/XML (.rdf, .owl, .xml) ontology, '
+                                         'a triple index (.bigcqti) or, with --loader owlready, any owlready2 format')
+    parser.add_argument('--mappings', default='../BigCQ_dataset/query_templates_to_cq_template_mappings/',
+                        help='folder written by Serializer (any output format)')
+    parser.add_argument('--output', default='./materialized/')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--compression', choices=compressions, default=None)
+    parser.add_argument('--max-cqs-per-binding', type=int, default=None,
+                        help='number of CQ templates filled for every binding (default: all)')
+    parser.add_argument('--loader', choices=['stream', 'owlready'], default='stream',
+                        help='stream the ontology into a triple index (kept in the output folder) or load it '
+                             'with owlready2')
+
+
+def run(args):
+    start = time.perf_counter()
+    index = load_index(args.ontology, args.loader, args.output)
+    print(f'Indexed {len(index)} axioms in {time.perf_counter() - start:.1f} s')
+
+    templates = bindings = pairs = 0
+    for idx, template_bindings, template_pairs, error in materialize(
+            index, load_mappings(args.mappings), args.output, args.workers, args.compression,
+            args.max_cqs_per_binding):
+        if error is not None:
+            print(f'Skipped template {idx}: {error}')
+            continue
+        templates += 1
+        bindings += template_bindings
+        pairs += template_pairs
+    print(f'Materialized {templates} templates: {bindings} queries and {pairs} (CQ, query) pairs '
+          f'in {time.perf_counter() - start:.1f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialize BigCQ templates against an ontology.')
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
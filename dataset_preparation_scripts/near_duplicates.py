@@ -0,0 +1,192 @@
+import hashlib
+import json
+import random
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Near-duplicate CQs (e.g. differing by a synonym) are found without comparing all pairs: every CQ is split into
+# overlapping word shingles and summarized by a MinHash signature, whose bands are hashed into buckets (LSH), so
+# only CQs sharing a bucket are compared. CQs are made of a small vocabulary, so the `num_perm` hashes of every
+# shingle are computed once and a signature is the element-wise minimum of the hashes of its shingles.
+#
+# CQs are clustered around leaders: a CQ joins the first earlier leader whose shingles have at least `threshold`
+# Jaccard similarity with its own, or becomes a leader itself. Pruning keeps leaders only. Across queries, only CQs
+# of the same question form (see `partition`) are compared, as e.g. an ASK and a SELECT CQ can differ in a few words.
+
+scopes = ['query', 'global']
+prime = 2 ** 61 - 1
+
+
+def hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def shingles(cq: str, size: int = 2) -> Set[str]:
+    ''' Sequences of `size` consecutive words of a lowercased CQ (or the whole CQ if it is shorter). '''
+    words = cq.lower().rstrip('?').split()
+    return {' '.join(words[idx:idx + size]) for idx in range(max(1, len(words) - size + 1))}
+
+
+def partition(query: str, cq: str) -> Tuple[str, Tuple[str, ...]]:
+    ''' Question form of a CQ: the form of its query (ASK, SELECT or SELECT COUNT) and the numbers in the CQ
+    (cardinalities, as in "at least 2"). '''
+    words = query.split(None, 2)
+    form = 'ASK' if words[0].upper() == 'ASK' else 'SELECT COUNT' if words[1].upper().startswith('(COUNT') \
+        else 'SELECT'
+    return form, tuple(re.findall(r'\b\d+\b', cq))
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def candidate_probability(similarity: float, bands: int, rows: int) -> float:
+    ''' Probability that CQs of the given Jaccard similarity share a band (and are compared). '''
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def lsh_bands(num_perm: int, threshold: float, probability: float = 0.99) -> Tuple[int, int]:
+    ''' Number of bands and rows per band: the most rows (so the fewest dissimilar candidates) for which CQs of
+    `threshold` similarity are still compared with at least the given probability. '''
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows == 0 and candidate_probability(threshold, num_perm // rows, rows) >= probability:
+            best = (num_perm // rows, rows)
+    return best
+
+
+class NearDuplicateDetector:
+    ''' Cluster CQs added one by one with `add`. '''
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 2, num_perm: int = 64):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        # hash functions (a * x + b) mod prime, the same in every run
+        rng = random.Random(0)
+        self.permutations = [(rng.randrange(1, prime), rng.randrange(prime)) for _ in range(num_perm)]
+        self.shingle_hashes = dict()
+        self.reset()
+
+    def reset(self):
+        ''' Forget all CQs (but not hashes of shingles). '''
+        self.buckets = dict()  # (band, hash of its values) -> leaders
+        self.leaders = dict()  # leader -> its shingles
+        self.leader_of = dict()  # near-duplicate CQ -> its leader
+        self.clusters = dict()  # leader -> near-duplicates
+
+    def signature(self, cq_shingles: Set[str]) -> List[int]:
+        vectors = []
+        for shingle in cq_shingles:
+            if shingle not in self.shingle_hashes:
+                value = hash64(shingle)
+                self.shingle_hashes[shingle] = tuple((a * value + b) % prime for a, b in self.permutations)
+            vectors.append(self.shingle_hashes[shingle])
+        return list(map(min, *vectors)) if len(vectors) > 1 else list(vectors[0])
+
+    def add(self, cq: str) -> Optional[str]:
+        ''' Add a CQ, returning the leader of its cluster, or None if it is a leader. '''
+        if cq in self.leaders:
+            return None
+        if cq in self.leader_of:
+            return self.leader_of[cq]
+        cq_shingles = shingles(cq, self.shingle_size)
+        signature = self.signature(cq_shingles)
+        keys = [(band, hash(tuple(signature[band * self.rows:(band + 1) * self.rows])))
+                for band in range(self.bands)]
+        compared = set()
+        for key in keys:
+            for leader in self.buckets.get(key, ()):
+                if leader in compared:
+                    continue
+                compared.add(leader)
+                if jaccard(cq_shingles, self.leaders[leader]) >= self.threshold:
+                    self.leader_of[cq] = leader
+                    self.clusters[leader].append(cq)
+                    return leader
+        self.leaders[cq] = cq_shingles
+        self.clusters[cq] = []
+        for key in keys:
+            self.buckets.setdefault(key, []).append(cq)
+        return None
+
+    def prune(self, cqs: Iterable[str]) -> List[str]:
+        ''' CQs which are not near-duplicates of earlier CQs. '''
+        return [cq for cq in cqs if self.add(cq) is None]
+
+    def found_clusters(self) -> List[Tuple[str, List[str]]]:
+        ''' (leader, near-duplicates) of clusters with near-duplicates, largest first. '''
+        return sorted(((leader, duplicates) for leader, duplicates in self.clusters.items() if duplicates),
+                      key=lambda cluster: len(cluster[1]), reverse=True)
+
+
+class NearDuplicatePruner:
+    ''' Removes near-duplicate CQs from the CQs of every query (scope `query`) or from all CQs of the mapping with
+    the same question form (scope `global`; CQs are then first indexed with `index`), keeping at least one CQ of
+    every query. '''
+    def __init__(self, scope: str = 'query', threshold: float = 0.8, shingle_size: int = 2, num_perm: int = 64):
+        if scope not in scopes:
+            raise ValueError(f'Unknown scope: {scope}, use one of {scopes}')
+        self.scope = scope
+        self.parameters = {'threshold': threshold, 'shingle_size': shingle_size, 'num_perm': num_perm}
+        self.detector = NearDuplicateDetector(**self.parameters)
+        self.detectors: Dict[Tuple, NearDuplicateDetector] = dict()  # question form -> its detector (scope global)
+        self.report = []  # clusters of every query or the global clusters
+        self.kept = self.pruned = 0
+
+    def detector_of(self, query: str, cq: str) -> NearDuplicateDetector:
+        key = partition(query, cq)
+        if key not in self.detectors:
+            self.detectors[key] = NearDuplicateDetector(**self.parameters)
+            # all detectors use the same hash functions, so they can share hashes of shingles
+            self.detectors[key].shingle_hashes = self.detector.shingle_hashes
+        return self.detectors[key]
+
+    def index(self, query: str, cqs: Iterable[str]):
+        for cq in cqs:
+            self.detector_of(query, cq).add(cq)
+
+    def prune(self, query: str, cqs: List[str]) -> List[str]:
+        if self.scope == 'query':
+            self.detector.reset()
+            kept = self.detector.prune(cqs)
+            self.report += [{'query': query, 'leader': leader, 'near_duplicates': duplicates}
+                            for leader, duplicates in self.detector.found_clusters()]
+        else:
+            kept = [cq for cq in cqs if cq not in self.detector_of(query, cq).leader_of] or cqs[:1]
+        self.kept += len(kept)
+        self.pruned += len(cqs) - len(kept)
+        return kept
+
+    def write_report(self, path: str):
+        if self.scope == 'global':
+            self.report = sorted(({'question_form': ' '.join((form,) + numbers), 'leader': leader,
+                                   'near_duplicates': duplicates}
+                                  for (form, numbers), detector in self.detectors.items()
+                                  for leader, duplicates in detector.found_clusters()),
+                                 key=lambda cluster: len(cluster['near_duplicates']), reverse=True)
+        with open(path, 'w') as f:
+            json.dump({'scope': self.scope, **self.parameters, 'kept_cqs': self.kept, 'pruned_cqs': self.pruned,
+                       'clusters': self.report}, f, indent=4)
+
+
+if __name__ == '__main__':
+    import argparse
+    from serializer import load_mappings
+
+    parser = argparse.ArgumentParser(description='Report clusters of near-duplicate CQs of a query to CQs mapping.')
+    parser.add_argument('mappings', help='folder written by make_dataset.py')
+    parser.add_argument('--scope', choices=scopes, default='query')
+    parser.add_argument('--threshold', type=float, default=0.8, help='Jaccard similarity of word shingles')
+    parser.add_argument('--shingle-size', type=int, default=2, help='number of words in a shingle')
+    parser.add_argument('--report', default='near_duplicates.json', help='JSON file to write the clusters to')
+    args = parser.parse_args()
+    pruner = NearDuplicatePruner(args.scope, args.threshold, args.shingle_size)
+    if args.scope == 'global':
+        for query, cqs in load_mappings(args.mappings):
+            pruner.index(query, cqs)
+    for query, cqs in load_mappings(args.mappings):
+        pruner.prune(query, cqs)
+    pruner.write_report(args.report)
+    print(f'{pruner.pruned} of {pruner.kept + pruner.pruned} CQs are near-duplicates, '
+          f'{len(pruner.report)} clusters written to {args.report}')
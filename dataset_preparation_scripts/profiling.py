@@ -0,0 +1,134 @@
+import contextlib
+import heapq
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+# Instrumentation of dataset generation. Components call `stage` and `count` unconditionally; both return
+# immediately unless profiling was enabled with `enable`, e.g. by `make_dataset.py --profile`.
+
+null_stage = contextlib.nullcontext()
+
+
+class Profiler:
+    ''' Wall and CPU time of named stages, counters and the largest values of recorded items (e.g. the slowest
+    rows), collected in one process. Every stage also becomes an event of a Chrome trace. '''
+    def __init__(self, max_events: int = 1000000, max_top: int = 20):
+        self.max_events = max_events
+        self.max_top = max_top
+        self.stages = dict()  # name -> [calls, wall seconds, CPU seconds]
+        self.counters = dict()  # name -> sum of counted values
+        self.top = dict()  # name -> heap of (value, sequence number, item arguments)
+        self.events = []  # Chrome trace events
+        self.sequence = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str, args: Optional[Dict[str, Any]] = None):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_time, cpu_time = time.perf_counter() - wall, time.process_time() - cpu
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += wall_time
+            totals[2] += cpu_time
+            if len(self.events) < self.max_events:
+                event = {'name': name, 'ph': 'X', 'ts': wall * 1e6, 'dur': wall_time * 1e6, 'pid': os.getpid(),
+                         'tid': os.getpid()}
+                if args:
+                    event['args'] = args
+                self.events.append(event)
+            else:
+                self.count('profiler.dropped_events')
+            if args:
+                self.push(name, wall_time, args)
+
+    def count(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, value: float, args: Dict[str, Any]):
+        ''' Count a value of an item and keep it if it is one of the largest values recorded under `name`. '''
+        self.count(name, value)
+        self.push(name, value, args)
+
+    def push(self, name: str, value: float, args: Dict[str, Any]):
+        heap = self.top.setdefault(name, [])
+        self.sequence += 1
+        if len(heap) < self.max_top:
+            heapq.heappush(heap, (value, self.sequence, args))
+        elif value > heap[0][0]:
+            heapq.heapreplace(heap, (value, self.sequence, args))
+
+    def collect(self) -> Dict[str, Any]:
+        ''' Data collected since the last call, e.g. to send it from a worker to the main process. '''
+        data = {'stages': self.stages, 'counters': self.counters, 'top': self.top, 'events': self.events}
+        self.stages, self.counters, self.top, self.events = dict(), dict(), dict(), []
+        return data
+
+    def merge(self, data: Dict[str, Any]):
+        for name, (calls, wall_time, cpu_time) in data['stages'].items():
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += wall_time
+            totals[2] += cpu_time
+        for name, value in data['counters'].items():
+            self.count(name, value)
+        for name, heap in data['top'].items():
+            for value, _, args in heap:
+                self.push(name, value, args)
+        self.events += data['events'][:max(0, self.max_events - len(self.events))]
+
+    def summary(self) -> Dict[str, Any]:
+        return {'stages': {name: {'calls': calls, 'wall_seconds': wall_time, 'cpu_seconds': cpu_time}
+                           for name, (calls, wall_time, cpu_time) in sorted(self.stages.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'top': {name: [{'value': value, **args} for value, _, args in sorted(heap, reverse=True)]
+                        for name, heap in sorted(self.top.items())}}
+
+    def write(self, path: str):
+        ''' Write the summary to `path` and the Chrome trace (for chrome://tracing or Perfetto) next to it,
+        with a `.trace.json` suffix. '''
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+        processes = sorted({event['pid'] for event in self.events})
+        names = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': pid,
+                  'args': {'name': 'main' if pid == os.getpid() else f'worker {pid}'}} for pid in processes]
+        with open(os.path.splitext(path)[0] + '.trace.json', 'w') as f:
+            json.dump({'traceEvents': names + self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+active = None  # the profiler of this process, if profiling is enabled
+
+
+def enable(**kwargs) -> Profiler:
+    global active
+    active = Profiler(**kwargs)
+    return active
+
+
+def disable():
+    global active
+    active = None
+
+
+def enabled() -> bool:
+    return active is not None
+
+
+def stage(name: str, **args):
+    ''' Context manager timing a stage; keyword arguments describe the processed item (e.g. a row). '''
+    if active is None:
+        return null_stage
+    return active.stage(name, args)
+
+
+def count(name: str, value: float = 1):
+    if active is not None:
+        active.count(name, value)
+
+
+def record(name: str, value: float, **args):
+    if active is not None:
+        active.record(name, value, args)
@@ -0,0 +1,316 @@
+import argparse
+import functools
+import glob
+import json
+import os
+import re
+import time
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from serializer import open_compressed
+from sparql_canonicalizer import BNode, Collection, Count, Group, Iri, Path, Term, Triple, Var, parse_query, render, \
+    variable_names
+from materializer import OntologyIndex, is_entity, load_index, match_triples, pattern_triples, query_term, \
+    triple_signature, vocabularies
+
+# Runs batches of SPARQL-OWL queries (e.g. written by materializer.py) against an ontology. Queries generated for
+# the same axiom shape differ only in their form (ASK, SELECT, COUNT) and in the entities they mention, so queries
+# are grouped by their graph pattern with entities replaced by variables; the pattern of every group is evaluated
+# once over the axioms of the ontology and answers of all queries of the group are derived from its solutions.
+# Like the materializer, queries are answered over asserted axioms, without reasoning.
+
+Answer = Union[bool, List[list]]
+# IRIs (second group), skipping prefix declarations, literals with their datatypes and comments (first group)
+shape_pattern = re.compile(r'''
+    ( (?i:PREFIX)\s+[^\s<]*\s*<[^>]*>
+    | (?:"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')(?:\^\^<[^>]*>)?
+    | \#[^\n]* )
+  | <([^<>"{}|^`\\\s]*)>
+''', re.VERBOSE)
+
+
+class PreparedQuery(NamedTuple):
+    ''' A query with its variables renamed to the canonical names of its group pattern. '''
+    key: str  # canonical text of the group pattern
+    pattern: Group  # graph pattern with canonical variable names, entities replaced by variables
+    constants: Dict[str, Term]  # canonical variable -> entity of the query
+    form: str
+    distinct: bool
+    projection: List[Union[Var, Count]]
+    shareable: bool  # whether evaluating the pattern without constants is cheap enough to be shared
+
+
+def map_terms(node, replace):
+    ''' Copy of a graph pattern (or its part) with every IRI, literal and variable replaced by `replace(term)`. '''
+    if isinstance(node, Group):
+        return Group([map_terms(triple, replace) for triple in node.triples],
+                     [map_terms(bnode, replace) for bnode in node.nodes],
+                     [(negated, map_terms(group, replace)) for negated, group in node.filters],
+                     [map_terms(group, replace) for group in node.optionals],
+                     [[map_terms(group, replace) for group in alternatives] for alternatives in node.unions])
+    if isinstance(node, Triple):
+        return Triple(*(map_terms(term, replace) for term in node))
+    if isinstance(node, BNode):
+        return BNode(tuple((map_terms(p, replace), map_terms(o, replace)) for p, o in node.properties))
+    if isinstance(node, Collection):
+        return Collection(tuple(map_terms(item, replace) for item in node.items))
+    if isinstance(node, Path):
+        return Path(node.operator, tuple(map_terms(argument, replace) for argument in node.arguments))
+    return replace(node)
+
+
+def query_shape(query: str) -> Tuple[str, List[str]]:
+    ''' Text of a query with IRIs of entities replaced by variables ?__entity1, ?__entity2, ... (the same IRI by
+    the same variable), and these IRIs. Queries generated from the same template have the same shape. '''
+    if '__entity' in query:
+        return query, []
+    iris = dict()
+
+    def replace(matched) -> str:
+        if matched.group(2) is None or matched.group(2).startswith(vocabularies):
+            return matched.group()
+        return f'?__entity{iris.setdefault(matched.group(2), len(iris) + 1)}'
+    return shape_pattern.sub(replace, query), list(iris)
+
+
+@functools.lru_cache(maxsize=65536)
+def compile_shape(shape: str) -> PreparedQuery:
+    ''' Parse a query shape and lift its entities to variables (named `@1`, `@2`, ..., which SPARQL variables
+    can not be); the canonical text of the lifted pattern is the same for all queries sharing it. Constants are
+    entities, or numbers of IRIs of the shape for ?__entity variables. '''
+    parsed = parse_query(shape)
+    lifted = dict()  # entity or ?__entity variable name -> variable
+
+    def lift(term: Term) -> Term:
+        if isinstance(term, Var) and term.name.startswith('__entity'):
+            key = term.name
+        elif is_entity(term):
+            key = term
+        else:
+            return term
+        if key not in lifted:
+            lifted[key] = Var(f'@{len(lifted) + 1}')
+        return lifted[key]
+
+    pattern = map_terms(parsed.where, lift)
+    names = variable_names(pattern)
+    canonical = map_terms(pattern, lambda term: Var(names[term.name]) if isinstance(term, Var) else term)
+    constants = {names[var.name]: int(key[len('__entity'):]) - 1 if isinstance(key, str) else key
+                 for key, var in lifted.items()}
+
+    if parsed.projection is None:
+        projection = [Var(names[name]) for name in names if not name.startswith('@')]
+    else:
+        projection = []
+        for item in parsed.projection:
+            if isinstance(item, Var) and item.name not in names or \
+                    isinstance(item, Count) and item.var is not None and item.var.name not in names:
+                raise ValueError(f'projected variable does not occur in the pattern: {shape}')
+            if isinstance(item, Var):
+                projection.append(Var(names[item.name]))
+            else:
+                projection.append(item._replace(var=item.var and Var(names[item.var.name])))
+        if len({type(item) for item in projection}) > 1:
+            raise ValueError('variables can not be projected along with COUNT without GROUP BY')
+
+    # entities are lifted only in single triple patterns (as generated by BigCQ): in larger patterns lifting may
+    # disconnect triples, whose solutions would then be joined by a cartesian product
+    shareable = len(parsed.where.triples) + len(parsed.where.nodes) == 1
+    return PreparedQuery(render(pattern, names), canonical, constants, parsed.form, parsed.distinct, projection,
+                         shareable)
+
+
+def prepare_query(query: str) -> PreparedQuery:
+    ''' Prepared query, compiled once for all queries of the same shape. '''
+    shape, iris = query_shape(query)
+    try:
+        prepared = compile_shape(shape)
+    except ValueError:
+        if not iris:
+            raise
+        iris = []  # e.g. an IRI in a position where variables are not allowed
+        prepared = compile_shape(query)
+    return prepared._replace(constants={name: Iri(iris[value]) if isinstance(value, int) else value
+                                        for name, value in prepared.constants.items()})
+
+
+class PatternPlan(NamedTuple):
+    ''' A graph pattern compiled for evaluation: its triples with their signatures. '''
+    triples: List[Triple]
+    signatures: List[str]
+
+
+class QueryRunner:
+    ''' Evaluates groups of prepared queries over an ontology index, keeping compiled plans of their patterns. '''
+    def __init__(self, index: OntologyIndex, cache_size: int = 4096):
+        self.index = index
+        self.cache_size = cache_size
+        self.plans = dict()  # (pattern key, constants) -> plan, in the order of use
+
+    def plan(self, key: str, pattern: Group, constants: Dict[str, Term]) -> PatternPlan:
+        ''' Compiled plan of a pattern with `constants` substituted for their variables. '''
+        cache_key = (key, tuple(sorted(constants.items())))
+        if cache_key in self.plans:
+            self.plans[cache_key] = self.plans.pop(cache_key)
+            return self.plans[cache_key]
+        if constants:
+            pattern = map_terms(pattern, lambda term: constants.get(term.name, term) if isinstance(term, Var) else term)
+        triples = pattern_triples(pattern)
+        if len(self.plans) >= self.cache_size:
+            del self.plans[next(iter(self.plans))]
+        self.plans[cache_key] = PatternPlan(triples, [triple_signature(triple) for triple in triples])
+        return self.plans[cache_key]
+
+    def solutions(self, plan: PatternPlan) -> List[Dict[str, Term]]:
+        ''' Distinct solutions of a pattern (canonical variable -> entity). '''
+        solutions = dict()
+        for bindings in match_triples(plan.triples, plan.signatures, self.index, dict()):
+            solution = {name[1:]: self.index.term(handle) for name, handle in bindings.items()}
+            solutions.setdefault(tuple(sorted(solution.items())), solution)
+        return list(solutions.values())
+
+    def answer_group(self, queries: List[PreparedQuery]) -> List[Tuple[Optional[Answer], Optional[str]]]:
+        ''' (answer, error message) of every query of a group sharing a pattern. A shared pattern is evaluated
+        once, without constants, and its solutions are filtered by the constants of every query; otherwise the
+        pattern is evaluated once for every distinct set of constants, which lets them select axioms by subject. '''
+        shared = len(queries) > 1 and queries[0].shareable
+        evaluated = dict()  # constants -> solutions of the pattern with these constants
+        by_constants = dict()  # names of constants -> their values -> solutions of the shared pattern
+        answers = []
+        for query in queries:
+            constants = dict() if shared else query.constants
+            try:
+                key = tuple(sorted(constants.items()))
+                if key not in evaluated:
+                    evaluated[key] = self.solutions(self.plan(query.key, query.pattern, constants))
+            except ValueError as e:
+                answers.append((None, str(e)))
+                continue
+            matching = evaluated[key]
+            if shared:
+                names = tuple(sorted(query.constants))
+                if names not in by_constants:
+                    by_constants[names] = dict()
+                    for solution in matching:
+                        by_constants[names].setdefault(tuple(solution[name] for name in names), []).append(solution)
+                matching = by_constants[names].get(tuple(query.constants[name] for name in names), [])
+            answers.append((derive_answer(query, matching), None))
+        return answers
+
+
+def derive_answer(query: PreparedQuery, solutions: List[Dict[str, Term]]) -> Answer:
+    ''' Answer of a query from the solutions of its pattern: a boolean for ASK, rows of values for SELECT
+    and a single row of counts for COUNT. '''
+    if query.form == 'ASK':
+        return bool(solutions)
+    if all(isinstance(item, Count) for item in query.projection):
+        row = []
+        for count in query.projection:
+            if count.var is None:
+                row.append(len(solutions))
+                continue
+            values = [solution[count.var.name] for solution in solutions if count.var.name in solution]
+            row.append(len(set(values)) if count.distinct else len(values))
+        return [row]
+    rows = [[query_term(solution[var.name]) for var in query.projection] for solution in solutions]
+    if query.distinct:
+        rows = [list(row) for row in dict.fromkeys(map(tuple, rows))]
+    return sorted(rows)
+
+
+# every worker process holds a runner with the ontology index
+worker_runner = None
+
+
+def init_worker(index: OntologyIndex):
+    global worker_runner
+    worker_runner = QueryRunner(index)
+
+
+def answer_group(task: Tuple[List[int], List[PreparedQuery]]) -> List[Tuple[int, Optional[Answer], Optional[str]]]:
+    query_ids, queries = task
+    return [(query_id, answer, error)
+            for query_id, (answer, error) in zip(query_ids, worker_runner.answer_group(queries))]
+
+
+def run_queries(index: OntologyIndex, queries: Iterable[str], workers: int = 1) \
+        -> Iterator[Tuple[int, Optional[Answer], Optional[str]]]:
+    ''' (query number, answer, error message) of every query, in the order in which groups are finished.
+    Groups of queries sharing a pattern are spread over a pool of workers sharing the index. '''
+    groups = dict()  # key -> (query numbers, prepared queries)
+    for number, query in enumerate(queries):
+        try:
+            prepared = prepare_query(query)
+        except ValueError as e:
+            yield number, None, str(e)
+            continue
+        key = prepared.key if prepared.shareable else (prepared.key, tuple(sorted(prepared.constants.items())))
+        query_ids, group = groups.setdefault(key, ([], []))
+        query_ids.append(number)
+        group.append(prepared)
+
+    # the largest groups first, so that they do not finish last
+    tasks = sorted(groups.values(), key=lambda task: -len(task[0]))
+    if workers <= 1:
+        init_worker(index)
+        for task in tasks:
+            yield from answer_group(task)
+        return
+    with Pool(workers, initializer=init_worker, initargs=(index,)) as pool:
+        for answers in pool.imap_unordered(answer_group, tasks, chunksize=max(1, len(tasks) // (16 * workers))):
+            yield from answers
+
+
+def read_queries(paths: List[str]) -> Iterator[dict]:
+    ''' Records with a `query` field: lines of `materialized_*.jsonl` files written by materializer.py (also in
+    folders given in `paths`, optionally compressed) or lines of text files with one query per line. '''
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, 'materialized_*.jsonl*')),
+                           key=lambda p: int(os.path.basename(p).split('_')[1].split('.')[0]))
+        for file_path in files:
+            compression = {'.gz': 'gzip', '.zst': 'zstd'}.get(os.path.splitext(file_path)[1])
+            with open_compressed(file_path, 'r', compression) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    yield json.loads(line) if '.jsonl' in file_path else {'query': line.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer SPARQL-OWL queries against an ontology.')
+    parser.add_argument('ontology', help='ontology, as accepted by materializer.py')
+    parser.add_argument('queries', nargs='+', help='folders written by materializer.py, their materialized_*.jsonl '
+                                                   'files or text files with one query per line')
+    parser.add_argument('--output', default='answers.jsonl', help='JSON lines file to write the answers to')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--loader', choices=['stream', 'owlready'], default='stream')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_index(args.ontology, args.loader, os.path.dirname(os.path.abspath(args.output)))
+    records = list(read_queries(args.queries))
+    print(f'Indexed {len(index)} axioms and read {len(records)} queries in {time.perf_counter() - start:.1f} s')
+
+    start = time.perf_counter()
+    statuses = dict()
+    for number, answer, error in run_queries(index, (record['query'] for record in records), args.workers):
+        if error is not None:
+            records[number]['error'] = error
+            status = 'failed'
+        else:
+            records[number]['answer'] = answer
+            status = 'answered' if answer and answer != [[0]] else 'not answered'
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f'Ran {len(records)} queries in {time.perf_counter() - start:.1f} s')
+    for status, count in sorted(statuses.items()):
+        print(f'{status}: {count} / {len(records)}')
+
+    with open(args.output, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+if __name__ == '__main__':
+    main()
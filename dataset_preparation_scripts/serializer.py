@@ -1,27 +1,246 @@
+import glob
+import gzip
+import io
 import os
 import json
-import hashlib
+import shutil
+from typing import Iterator, List, Optional, Tuple
+from compact_store import CompactStore, CompactStoreWriter
+import profiling
+
+output_formats = ['json', 'jsonl', 'parquet', 'compact']
+compressions = ['gzip', 'zstd']
+
+
+def open_compressed(path: str, mode: str, compression: Optional[str] = None):
+    ''' Open a text file, transparently (de)compressing it with gzip or zstd. '''
+    if compression is None:
+        return open(path, mode, encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression requires the `zstandard` package: pip install zstandard')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    raise ValueError(f'Unknown compression: {compression}, use one of {compressions}')
+
+
+def compression_suffix(compression: Optional[str]) -> str:
+    return {None: '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+
+
+class JsonFilesWriter:
+    ''' One pretty-printed JSON document per query (the original BigCQ layout). '''
+    def __init__(self, out_folder: str):
+        self.out_folder = out_folder
+
+    def write(self, idx: int, query: str, cqs: List[str]):
+        Serializer.write_query_file(self.out_folder, idx, query, cqs)
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    ''' Compact JSON Lines, one query per line, optionally compressed and split into shards
+    holding at most `shard_size` bytes of (uncompressed) data each. '''
+    def __init__(self, out_folder: str, compression: Optional[str] = None, shard_size: Optional[int] = None):
+        self.out_folder = out_folder
+        self.compression = compression
+        self.shard_size = shard_size
+        self.shard_idx = 0
+        self.shard_bytes = 0
+        self.file = None
+
+    def shard_path(self) -> str:
+        name = 'query_to_cqs' if self.shard_size is None else f'query_to_cqs_{self.shard_idx:05d}'
+        return os.path.join(self.out_folder, name + '.jsonl' + compression_suffix(self.compression))
+
+    def write(self, idx: int, query: str, cqs: List[str]):
+        line = json.dumps({"id": idx, "query": query, "cqs": cqs}, separators=(',', ':')) + '\n'
+        if self.file is not None and self.shard_size is not None and \
+                self.shard_bytes + len(line.encode('utf-8')) > self.shard_size:
+            self.file.close()
+            self.file = None
+            self.shard_idx += 1
+        if self.file is None:
+            self.file = open_compressed(self.shard_path(), 'w', self.compression)
+            self.shard_bytes = 0
+        self.file.write(line)
+        self.shard_bytes += len(line.encode('utf-8'))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ParquetWriter:
+    ''' Columnar Parquet file (id, query, cqs) written in row groups; strings are dictionary encoded. '''
+    def __init__(self, out_folder: str, compression: Optional[str] = None, row_group_size: int = 64):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('the parquet format requires the `pyarrow` package: pip install pyarrow')
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([('id', pyarrow.int64()), ('query', pyarrow.string()),
+                                      ('cqs', pyarrow.list_(pyarrow.string()))])
+        self.path = os.path.join(out_folder, 'query_to_cqs.parquet')
+        self.compression = compression or 'none'
+        self.writer = None  # the file is created with the first row group
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write(self, idx: int, query: str, cqs: List[str]):
+        self.rows.append({'id': idx, 'query': query, 'cqs': cqs})
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            if self.writer is None:
+                self.writer = self.pyarrow.parquet.ParquetWriter(
+                    self.path, self.schema, compression=self.compression, use_dictionary=True)
+            self.writer.write_table(self.pyarrow.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def make_writer(out_folder: str, output_format: str = 'json', compression: Optional[str] = None,
+                shard_size: Optional[int] = None):
+    if output_format == 'json':
+        if compression is not None or shard_size is not None:
+            raise ValueError('the json format writes one plain file per query, use jsonl to compress or shard')
+        return JsonFilesWriter(out_folder)
+    if output_format == 'jsonl':
+        return JsonLinesWriter(out_folder, compression, shard_size)
+    if output_format == 'parquet':
+        if shard_size is not None:
+            raise ValueError('the parquet format is written as a single file made of row groups')
+        return ParquetWriter(out_folder, compression)
+    if output_format == 'compact':
+        if compression is not None or shard_size is not None:
+            raise ValueError('the compact format is a single uncompressed file, so that it can be memory-mapped')
+        return CompactStoreWriter(out_folder)
+    raise ValueError(f'Unknown output format: {output_format}, use one of {output_formats}')
+
+
+def load_mappings(out_folder: str) -> Iterator[Tuple[str, List[str]]]:
+    ''' Read (query, cqs) pairs written by `Serializer` in any of the supported formats, in file order. '''
+    json_files = glob.glob(os.path.join(out_folder, 'query_to_cqs_*.json'))
+    if json_files:
+        for path in sorted(json_files, key=lambda p: int(p[p.rindex('_') + 1:-len('.json')])):
+            with open(path) as f:
+                mapping = json.load(f)
+            yield mapping['query'], mapping['cqs']
+        return
+
+    compact_path = os.path.join(out_folder, 'query_to_cqs.bigcq')
+    if os.path.exists(compact_path):
+        with CompactStore(compact_path) as store:
+            yield from store.mappings()
+        return
+
+    parquet_path = os.path.join(out_folder, 'query_to_cqs.parquet')
+    if os.path.exists(parquet_path):
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(parquet_path)
+        for row_group in range(parquet_file.num_row_groups):
+            for row in parquet_file.read_row_group(row_group).to_pylist():
+                yield row['query'], row['cqs']
+        return
+
+    for path in sorted(glob.glob(os.path.join(out_folder, 'query_to_cqs*.jsonl*'))):
+        compression = {'.gz': 'gzip', '.zst': 'zstd'}.get(os.path.splitext(path)[1])
+        with open_compressed(path, 'r', compression) as f:
+            for line in f:
+                mapping = json.loads(line)
+                yield mapping['query'], mapping['cqs']
 
 
 class Serializer:
-    def __init__(self, result, out_folder='./BigCQ_mapping/'):
+    ''' Writes the mapping from SPARQL-OWL queries to CQs.
+
+    Records are consumed one by one with `add`; CQs of every query are spooled to disk until
+    `close` writes the final output, so memory use does not grow with the number of records.
+    The output format is one JSON file per query (default), JSON Lines (optionally compressed
+    and sharded by size), Parquet or a memory-mappable compact store, see `make_writer`.
+    An optional `near_duplicates.NearDuplicatePruner` removes near-duplicate CQs before they are written.
+    '''
+    def __init__(self, out_folder='./BigCQ_mapping/', output_format='json', compression=None, shard_size=None,
+                 pruner=None):
         self.out_folder = out_folder
-        self.data = result
-        os.mkdir(out_folder)
-
-    def serialize_result(self):
-        json_out = dict()
-        for _, cqs, queries in self.data:
-            for key in queries:
-                if queries[key]:
-                    query = queries[key]
-                    if query not in json_out:
-                        json_out[query] = []
-                    json_out[query] += cqs[key]
-
-        for idx, query in enumerate(json_out):
-            with open(os.path.join(self.out_folder, f'query_to_cqs_{idx + 1}.json'), 'w') as f:
-                f.write(json.dumps(
-                    {"query": query, "cqs": json_out[query]},
-                    indent=4, sort_keys=True)
-                )
+        self.pruner = pruner
+        self.spool_folder = os.path.join(out_folder, '.spool')
+        self.query_ids = dict()  # query -> index of its output file
+        os.makedirs(out_folder, exist_ok=True)
+        self.writer = make_writer(out_folder, output_format, compression, shard_size)
+        # files left by a previous build would mix with the new ones
+        for path in glob.glob(os.path.join(out_folder, 'query_to_cqs*')):
+            os.remove(path)
+        shutil.rmtree(self.spool_folder, ignore_errors=True)
+        os.mkdir(self.spool_folder)
+
+    def add(self, record):
+        _, cqs, queries = record
+        for key in queries:
+            if queries[key]:
+                query = queries[key]
+                if query not in self.query_ids:
+                    self.query_ids[query] = len(self.query_ids) + 1
+                with open(self.spool_path(self.query_ids[query]), 'a') as f:
+                    for cq in cqs[key]:
+                        f.write(json.dumps(cq) + '\n')
+                profiling.count('serializer.spool_writes')
+
+    def close(self):
+        if self.pruner is not None and self.pruner.scope == 'global':
+            with profiling.stage('serializer.index_near_duplicates'):
+                for query, idx in self.query_ids.items():
+                    self.pruner.index(query, self.read_spool(idx))
+        for query, idx in self.query_ids.items():
+            cqs = self.read_spool(idx)
+            if self.pruner is not None:
+                with profiling.stage('serializer.prune_near_duplicates'):
+                    cqs = self.pruner.prune(query, cqs)
+            self.writer.write(idx, query, cqs)
+        self.writer.close()
+        if profiling.enabled():
+            profiling.count('serializer.spool_bytes', sum(map(os.path.getsize, glob.glob(self.spool_path('*')))))
+            profiling.count('serializer.bytes_written', sum(map(os.path.getsize, glob.glob(
+                os.path.join(self.out_folder, 'query_to_cqs*')))))
+        shutil.rmtree(self.spool_folder)
+
+    @staticmethod
+    def query_file_path(out_folder, idx):
+        return os.path.join(out_folder, f'query_to_cqs_{idx}.json')
+
+    @staticmethod
+    def write_query_file(out_folder, idx, query, cqs):
+        with open(Serializer.query_file_path(out_folder, idx), 'w') as f:
+            f.write(json.dumps(
+                {"query": query, "cqs": cqs},
+                indent=4, sort_keys=True)
+            )
+
+    def serialize_result(self, result):
+        for record in result:
+            self.add(record)
+        self.close()
+
+    def read_spool(self, idx) -> List[str]:
+        with open(self.spool_path(idx)) as f:
+            return [json.loads(line) for line in f]
+
+    def spool_path(self, idx):
+        return os.path.join(self.spool_folder, f'{idx}.jsonl')
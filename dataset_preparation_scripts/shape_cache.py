@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from importlib import metadata
+from typing import Any, Dict, Iterable, Optional
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+class ShapeCache:
+    ''' Persistent cache of `Analyzer.process` results stored in a local SQLite file.
+
+    Entries are addressed by a hash of the verbalization, of the spaCy and model versions and of
+    the analyzer code, so upgrading or editing any of them never serves stale shapes. When the cache holds more than
+    `max_entries` shapes, the least recently used ones are evicted.
+    '''
+    def __init__(self, path: str = './.analyzer_cache.sqlite', max_entries: int = 100000,
+                 model: str = 'en_core_web_sm', timeout: float = 60.0):
+        self.path = path
+        self.max_entries = max_entries
+        analyzer_hash = file_hash(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'verbalization_analyzer.py'))
+        self.version_tag = f'spacy={package_version("spacy")};{model}={package_version(model)};analyzer={analyzer_hash}'
+        # keys read since the last write, their `last_used` is refreshed in bulk
+        self.touched = set()
+        # several worker processes may share one cache file
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS shapes ('
+            'key TEXT PRIMARY KEY, shape TEXT NOT NULL, last_used REAL NOT NULL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS shapes_last_used ON shapes(last_used)')
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f'{self.version_tag}\n{text}'.encode('utf-8')).hexdigest()
+
+    def get(self, text: str) -> Optional[Dict[str, Any]]:
+        key = self.key(text)
+        row = self.connection.execute('SELECT shape FROM shapes WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.touched.add(key)
+        return self.decode(row[0])
+
+    def put(self, text: str, analyzed_shape: Dict[str, Any]):
+        self.put_many([(text, analyzed_shape)])
+
+    def put_many(self, items: Iterable):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO shapes (key, shape, last_used) VALUES (?, ?, ?)',
+                [(self.key(text), self.encode(shape), now) for text, shape in items])
+            self.flush_touched(now)
+            self.evict()
+
+    def flush_touched(self, now: float):
+        self.connection.executemany('UPDATE shapes SET last_used = ? WHERE key = ?',
+                                    [(now, key) for key in self.touched])
+        self.touched.clear()
+
+    def evict(self):
+        ''' Drop the least recently used entries exceeding `max_entries`. '''
+        size = self.connection.execute('SELECT COUNT(*) FROM shapes').fetchone()[0]
+        if size > self.max_entries:
+            self.connection.execute(
+                'DELETE FROM shapes WHERE key IN '
+                '(SELECT key FROM shapes ORDER BY last_used ASC LIMIT ?)',
+                (size - self.max_entries,))
+
+    def invalidate(self):
+        ''' Remove all cached shapes. '''
+        with self.connection:
+            self.connection.execute('DELETE FROM shapes')
+        self.connection.execute('VACUUM')
+
+    def close(self):
+        with self.connection:
+            self.flush_touched(time.time())
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM shapes').fetchone()[0]
+
+    @staticmethod
+    def encode(analyzed_shape: Dict[str, Any]) -> str:
+        shape = dict(analyzed_shape)
+        shape['domain_elems'] = sorted(shape['domain_elems'])
+        shape['range_elems'] = sorted(shape['range_elems'])
+        return json.dumps(shape)
+
+    @staticmethod
+    def decode(encoded: str) -> Dict[str, Any]:
+        shape = json.loads(encoded)
+        shape['domain_elems'] = set(shape['domain_elems'])
+        shape['range_elems'] = set(shape['range_elems'])
+        return shape
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the Analyzer shape cache.')
+    parser.add_argument('--path', default='./.analyzer_cache.sqlite')
+    parser.add_argument('--invalidate', action='store_true', help='remove all cached shapes')
+    args = parser.parse_args()
+
+    cache = ShapeCache(args.path)
+    if args.invalidate:
+        cache.invalidate()
+    print(f'{len(cache)} cached shapes in {args.path}')
+    cache.close()
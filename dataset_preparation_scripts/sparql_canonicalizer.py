@@ -0,0 +1,589 @@
+import argparse
+import csv
+import hashlib
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Parser of the SPARQL subset used by SPARQL-OWL query templates: ASK and SELECT (variables, * or COUNT)
+# queries over basic graph patterns written in Turtle syntax (blank node property lists [ ], collections ( ),
+# property paths), nested groups, UNION, OPTIONAL and FILTER (NOT) EXISTS. Anything else raises ValueError.
+
+default_prefixes = {
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'owl': 'http://www.w3.org/2002/07/owl#',
+    'xsd': 'http://www.w3.org/2001/XMLSchema#',
+}
+rdf_type = default_prefixes['rdf'] + 'type'
+placeholder_pattern = re.compile(r'^(c|op|dp|i|dt)[0-9]+$', re.IGNORECASE)
+local_name_pattern = re.compile(r'^[A-Za-z_][\w-]*$')
+
+token_pattern = re.compile(r'''
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<var>[?$]\w+)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<number>[+-]?(?:[0-9]+(?:\.[0-9]+)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+  | (?P<pname>(?:[A-Za-z][\w.-]*)?:(?:[\w-](?:[\w.-]*[\w-])?)?)
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<lang>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+  | (?P<punct>\^\^|[{}\[\]().;,*/|^+?])
+''', re.VERBOSE)
+
+
+class Iri(NamedTuple):
+    value: str
+
+
+class Var(NamedTuple):
+    name: str
+
+
+class Literal(NamedTuple):
+    value: str
+    datatype: Optional[str] = None  # IRI of the datatype
+    language: Optional[str] = None
+
+
+class BNode(NamedTuple):
+    properties: Tuple[Tuple['Term', 'Term'], ...]  # (predicate, object) pairs, () for []
+
+
+class Collection(NamedTuple):
+    items: Tuple['Term', ...]
+
+
+class Path(NamedTuple):
+    operator: str  # '/', '|', '^', '*', '+' or '?'
+    arguments: Tuple['Term', ...]
+
+
+Term = Union[Iri, Var, Literal, BNode, Collection, Path]
+
+
+class Triple(NamedTuple):
+    subject: Term
+    predicate: Term
+    object: Term
+
+
+class Group(NamedTuple):
+    triples: List[Triple]
+    nodes: List[BNode]  # blank nodes in subject position, with all of their properties
+    filters: List[Tuple[bool, 'Group']]  # (negated, pattern) of FILTER (NOT) EXISTS
+    optionals: List['Group']
+    unions: List[List['Group']]
+
+
+class Count(NamedTuple):
+    var: Optional[Var]  # None for COUNT(*)
+    alias: Var
+    distinct: bool = False
+
+
+class Query(NamedTuple):
+    form: str  # 'ASK' or 'SELECT'
+    distinct: bool
+    projection: Optional[List[Union[Var, Count]]]  # None for SELECT *
+    where: Group
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    ''' (kind, text) tokens of a query, whitespace and comments are dropped. '''
+    tokens = []
+    position = 0
+    while position < len(text):
+        matched = token_pattern.match(text, position)
+        if matched is None:
+            raise ValueError(f'unexpected character {text[position]!r} at position {position}')
+        if matched.lastgroup != 'space':
+            tokens.append((matched.lastgroup, matched.group()))
+        position = matched.end()
+    return tokens
+
+
+class Parser:
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.prefixes = dict(default_prefixes)
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ('end', '')
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        if token[0] == 'end':
+            raise ValueError('unexpected end of query')
+        self.position += 1
+        return token
+
+    def is_keyword(self, keyword: str) -> bool:
+        kind, text = self.peek()
+        return kind == 'word' and text.upper() == keyword
+
+    def accept(self, value: str) -> bool:
+        kind, text = self.peek()
+        if (kind == 'word' and text.upper() == value) or (kind == 'punct' and text == value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise ValueError(f'expected {value!r} but found {self.peek()[1]!r}')
+
+    def parse_query(self) -> Query:
+        while self.accept('PREFIX'):
+            kind, name = self.next()
+            if kind != 'pname' or not name.endswith(':'):
+                raise ValueError(f'invalid prefix name {name!r}')
+            kind, iri = self.next()
+            if kind != 'iri':
+                raise ValueError(f'invalid prefix IRI {iri!r}')
+            self.prefixes[name[:-1]] = iri[1:-1]
+
+        distinct = False
+        projection = []
+        if self.accept('ASK'):
+            form = 'ASK'
+        elif self.accept('SELECT'):
+            form = 'SELECT'
+            distinct = self.accept('DISTINCT')
+            if self.accept('*'):
+                projection = None
+            else:
+                while self.peek()[0] == 'var' or self.peek() == ('punct', '('):
+                    projection.append(self.parse_projection())
+                if not projection:
+                    raise ValueError(f'expected projection but found {self.peek()[1]!r}')
+        else:
+            raise ValueError(f'only ASK and SELECT queries are supported, found {self.peek()[1]!r}')
+
+        self.accept('WHERE')
+        where = self.parse_group()
+        if self.peek()[0] != 'end':
+            raise ValueError(f'unsupported solution modifier {self.peek()[1]!r}')
+        return Query(form, distinct, projection, where)
+
+    def parse_projection(self) -> Union[Var, Count]:
+        if self.peek()[0] == 'var':
+            return Var(self.next()[1][1:])
+        self.expect('(')
+        self.expect('COUNT')
+        self.expect('(')
+        distinct = self.accept('DISTINCT')
+        var = None if self.accept('*') else self.parse_var()
+        self.expect(')')
+        self.expect('AS')
+        alias = self.parse_var()
+        self.expect(')')
+        return Count(var, alias, distinct)
+
+    def parse_var(self) -> Var:
+        kind, text = self.next()
+        if kind != 'var':
+            raise ValueError(f'expected variable but found {text!r}')
+        return Var(text[1:])
+
+    def parse_group(self) -> Group:
+        self.expect('{')
+        group = Group([], [], [], [], [])
+        while not self.accept('}'):
+            if self.peek() == ('punct', '{'):
+                alternatives = [self.parse_group()]
+                while self.accept('UNION'):
+                    alternatives.append(self.parse_group())
+                if len(alternatives) == 1:
+                    nested = alternatives[0]
+                    group.triples.extend(nested.triples)
+                    group.nodes.extend(nested.nodes)
+                    group.filters.extend(nested.filters)
+                    group.optionals.extend(nested.optionals)
+                    group.unions.extend(nested.unions)
+                else:
+                    group.unions.append(alternatives)
+                self.accept('.')
+            elif self.accept('FILTER'):
+                negated = self.accept('NOT')
+                if not self.accept('EXISTS'):
+                    raise ValueError('only FILTER EXISTS and FILTER NOT EXISTS are supported')
+                group.filters.append((negated, self.parse_group()))
+                self.accept('.')
+            elif self.accept('OPTIONAL'):
+                group.optionals.append(self.parse_group())
+                self.accept('.')
+            else:
+                self.parse_triples(group)
+                if not self.accept('.') and self.peek() != ('punct', '}') and self.peek() != ('punct', '{') \
+                        and not self.is_keyword('FILTER') and not self.is_keyword('OPTIONAL'):
+                    raise ValueError(f'expected "." but found {self.peek()[1]!r}')
+        return group
+
+    def parse_triples(self, group: Group):
+        subject = self.parse_node()
+        if isinstance(subject, BNode):
+            # `[ p o ] q r` and `[] p o ; q r` describe the same node as `[ p o ; q r ]`
+            properties = subject.properties
+            if not properties or self.peek() not in [('punct', '.'), ('punct', '}')]:
+                properties += tuple(self.parse_property_list())
+            group.nodes.append(BNode(properties))
+            return
+        for predicate, object in self.parse_property_list():
+            group.triples.append(Triple(subject, predicate, object))
+
+    def parse_property_list(self) -> List[Tuple[Term, Term]]:
+        properties = []
+        while True:
+            predicate = self.parse_verb()
+            properties.append((predicate, self.parse_node()))
+            while self.accept(','):
+                properties.append((predicate, self.parse_node()))
+            if not self.accept(';'):
+                return properties
+            while self.accept(';'):
+                pass
+            if self.peek() in [('punct', '.'), ('punct', ']'), ('punct', '}')]:
+                return properties
+
+    def parse_verb(self) -> Term:
+        if self.peek()[0] == 'var':
+            return self.parse_var()
+        return self.parse_path()
+
+    def parse_path(self) -> Term:
+        alternatives = [self.parse_path_sequence()]
+        while self.accept('|'):
+            alternatives.append(self.parse_path_sequence())
+        return alternatives[0] if len(alternatives) == 1 else Path('|', tuple(alternatives))
+
+    def parse_path_sequence(self) -> Term:
+        steps = [self.parse_path_step()]
+        while self.accept('/'):
+            steps.append(self.parse_path_step())
+        return steps[0] if len(steps) == 1 else Path('/', tuple(steps))
+
+    def parse_path_step(self) -> Term:
+        inverse = self.accept('^')
+        if self.accept('('):
+            step = self.parse_path()
+            self.expect(')')
+        elif self.accept('A'):
+            step = Iri(rdf_type)
+        else:
+            step = self.parse_term()
+            if not isinstance(step, Iri):
+                raise ValueError(f'expected property but found {step}')
+        for modifier in ['*', '+', '?']:
+            if self.accept(modifier):
+                step = Path(modifier, (step,))
+                break
+        return Path('^', (step,)) if inverse else step
+
+    def parse_node(self) -> Term:
+        if self.accept('['):
+            if self.accept(']'):
+                return BNode(())
+            properties = self.parse_property_list()
+            self.expect(']')
+            return BNode(tuple(properties))
+        if self.accept('('):
+            items = []
+            while not self.accept(')'):
+                items.append(self.parse_node())
+            return Collection(tuple(items))
+        return self.parse_term()
+
+    def parse_term(self) -> Term:
+        kind, text = self.next()
+        if kind == 'var':
+            return Var(text[1:])
+        if kind == 'iri':
+            value = text[1:-1]
+            return Iri(value.lower() if placeholder_pattern.match(value) else value)
+        if kind == 'pname':
+            prefix, _, local = text.partition(':')
+            if prefix not in self.prefixes:
+                raise ValueError(f'undefined prefix {prefix!r}')
+            return Iri(self.prefixes[prefix] + local)
+        if kind == 'number':
+            datatype = 'double' if 'e' in text.lower() else 'decimal' if '.' in text else 'integer'
+            return Literal(text, default_prefixes['xsd'] + datatype)
+        if kind == 'string':
+            value = text[1:-1]
+            if self.accept('^^'):
+                datatype = self.parse_term()
+                if not isinstance(datatype, Iri):
+                    raise ValueError(f'invalid datatype {datatype}')
+                return Literal(value, datatype.value)
+            if self.peek()[0] == 'lang':
+                return Literal(value, None, self.next()[1][1:].lower())
+            return Literal(value)
+        raise ValueError(f'unexpected token {text!r}')
+
+
+def parse_query(text: str) -> Query:
+    ''' Parse a SPARQL-OWL query, raises ValueError for syntax outside of the supported subset. '''
+    return Parser(text).parse_query()
+
+
+def render_iri(value: str) -> str:
+    for prefix, namespace in default_prefixes.items():
+        if value.startswith(namespace) and local_name_pattern.match(value[len(namespace):]):
+            return f'{prefix}:{value[len(namespace):]}'
+    return f'<{value}>'
+
+
+def render_sorted(children, render_child, names: Dict[str, str]) -> List[str]:
+    ''' Texts of unordered children, sorted and without duplicates. '''
+    return sorted({render_child(child, names) for child in children})
+
+
+def render_property(pair: Tuple[Term, Term], names: Dict[str, str]) -> str:
+    return render(pair[0], names) + ' ' + render(pair[1], names)
+
+
+def render_filter(item: Tuple[bool, Group], names: Dict[str, str]) -> str:
+    return ('FILTER NOT EXISTS ' if item[0] else 'FILTER EXISTS ') + render(item[1], names)
+
+
+def render_optional(group: Group, names: Dict[str, str]) -> str:
+    return 'OPTIONAL ' + render(group, names)
+
+
+def render_union(alternatives: List[Group], names: Dict[str, str]) -> str:
+    return ' UNION '.join(render_sorted(alternatives, render, names))
+
+
+def render(node, names: Dict[str, str]) -> str:
+    ''' Canonical text of a parsed query or any of its parts, with variables written with their names in `names`.
+
+    Unordered parts (triples of a group, properties of a blank node, UNION alternatives, ...) are sorted
+    by their text and duplicates are dropped.
+    '''
+    if isinstance(node, Var):
+        return '?' + names[node.name]
+    if isinstance(node, Iri):
+        if '<' + node.value + '>' in names:  # a renamed placeholder
+            return '<' + names['<' + node.value + '>'] + '>'
+        return render_iri(node.value)
+    if isinstance(node, Literal):
+        text = '"' + node.value + '"'
+        if node.datatype is not None:
+            return text + '^^' + render_iri(node.datatype)
+        return text + ('@' + node.language if node.language else '')
+    if isinstance(node, BNode):
+        if not node.properties:
+            return '[]'
+        return '[ ' + ' ; '.join(render_sorted(node.properties, render_property, names)) + ' ]'
+    if isinstance(node, Collection):
+        return '( ' + ' '.join(render(item, names) for item in node.items) + ' )'
+    if isinstance(node, Path):
+        if node.operator == '^':
+            return '^' + render(node.arguments[0], names)
+        if node.operator in '*+?':
+            return render(node.arguments[0], names) + node.operator
+        if node.operator == '|':
+            return '(' + '|'.join(render_sorted(node.arguments, render, names)) + ')'
+        return '(' + '/'.join(render(argument, names) for argument in node.arguments) + ')'
+    if isinstance(node, Triple):
+        return ' '.join(render(term, names) for term in node) + ' .'
+    if isinstance(node, Group):
+        parts = render_sorted(node.triples, render, names)
+        parts += [text + ' .' for text in render_sorted(node.nodes, render, names)]
+        parts += render_sorted(node.filters, render_filter, names)
+        parts += render_sorted(node.optionals, render_optional, names)
+        parts += render_sorted(node.unions, render_union, names)
+        return '{ ' + ' '.join(parts) + ' }'
+    if isinstance(node, Count):
+        var = '*' if node.var is None else render(node.var, names)
+        return f'(COUNT({"DISTINCT " if node.distinct else ""}{var}) AS {render(node.alias, names)})'
+    if isinstance(node, Query):
+        head = node.form + (' DISTINCT' if node.distinct else '')
+        if node.form == 'SELECT':
+            head += ' ' + ('*' if node.projection is None else
+                           ' '.join(render(item, names) for item in node.projection))
+        return head + ' WHERE ' + render(node.where, names)
+    raise TypeError(f'cannot render {node!r}')
+
+
+def canonicalize(query: Union[str, Query], rename_placeholders: bool = True) -> str:
+    ''' Canonical text of a query: prefixes, `a` and whitespace are normalized, unordered parts are sorted
+    and variables are renamed to ?v1, ?v2, ... (projected variables first, in projection order). With
+    `rename_placeholders`, placeholders are renamed too, by their role: <c1>, <c2>, ..., <op1>, ... '''
+    if isinstance(query, str):
+        query = parse_query(query)
+
+    names = dict()
+    for item in query.projection or []:
+        for var in ([item] if isinstance(item, Var) else [item.var, item.alias]):
+            if var is not None and var.name not in names:
+                names[var.name] = f'v{len(names) + 1}'
+    return render(query, variable_names(query, names, rename_placeholders))
+
+
+def variables(node, placeholders: bool = False) -> Iterator[str]:
+    ''' Names of all variables of a query or its part and, with `placeholders`, its placeholders as <c1>, ... '''
+    if isinstance(node, Var):
+        yield node.name
+    elif isinstance(node, Iri):
+        if placeholders and placeholder_pattern.match(node.value):
+            yield '<' + node.value + '>'
+    elif isinstance(node, (tuple, list)):
+        for child in node:
+            yield from variables(child, placeholders)
+
+
+def kind_of(name: str) -> str:
+    ''' Kind of a placeholder (c, op, dp, i or dt) named by `variables`, v for variables. '''
+    return placeholder_pattern.match(name[1:-1]).group(1).lower() if name.startswith('<') else 'v'
+
+
+def parts_of(node) -> List[Tuple[Callable, Any]]:
+    ''' (render function, part) of the unordered parts of the top group of a query or its part. '''
+    if isinstance(node, Query):
+        node = node.where
+    if not isinstance(node, Group):
+        return [(render, node)]
+    return ([(render, triple) for triple in node.triples] + [(render, bnode) for bnode in node.nodes] +
+            [(render_filter, item) for item in node.filters] + [(render_optional, group) for group in node.optionals] +
+            [(render_union, alternatives) for alternatives in node.unions])
+
+
+def rank(signatures: Dict[str, Any]) -> Dict[str, int]:
+    ''' Replace signatures of variables by their positions among the sorted distinct signatures. '''
+    ranks = {signature: idx for idx, signature in enumerate(sorted(set(signatures.values())))}
+    return {name: ranks[signature] for name, signature in signatures.items()}
+
+
+def refine_colours(parts: List[Tuple[Callable, Any]], occurrences: Dict[str, List[int]], names: Dict[str, str],
+                   colours: Dict[str, int]) -> Dict[str, int]:
+    ''' Colour refinement: variables are split by their colour together with the texts of the parts they occur
+    in, written with colours of other variables and the variable itself as ?*, until no colour is split. '''
+    while True:
+        labels = dict(names, **{name: f'c{colour}' for name, colour in colours.items()})
+        signatures = dict()
+        for name, colour in colours.items():
+            marked = dict(labels, **{name: '*'})
+            signatures[name] = (colour, tuple(sorted(parts[idx][0](parts[idx][1], marked)
+                                                     for idx in occurrences[name])))
+        refined = rank(signatures)
+        if len(set(refined.values())) == len(set(colours.values())):
+            return refined
+        colours = refined
+
+
+def variable_names(node, names: Optional[Dict[str, str]] = None, placeholders: bool = False) -> Dict[str, str]:
+    ''' Extend `names` to all variables of a query or its part, naming them ?v1, ?v2, ... so that its text is
+    the same however its variables are named and its parts ordered. With `placeholders`, placeholders are named
+    alike within their kind (<c1>, <c2>, ..., <op1>, ...), so that their numbers do not matter either.
+
+    Variables are told apart by colour refinement, starting from one colour per kind. Variables it can not tell
+    apart (e.g. of two alike triples) are individualized one after another and the names giving the smallest text
+    are kept. '''
+    names = dict(names or {})
+    parts = parts_of(node)
+    occurrences = dict()  # variable without a name -> indices of parts it occurs in
+    for idx, (_, part) in enumerate(parts):
+        for name in variables(part, placeholders):
+            if name not in names:
+                occurrences.setdefault(name, [])
+                if idx not in occurrences[name]:
+                    occurrences[name].append(idx)
+
+    def search(colours: Dict[str, int]) -> Tuple[str, Dict[str, str]]:
+        colours = refine_colours(parts, occurrences, names, colours)
+        members = dict()
+        for name, colour in colours.items():
+            members.setdefault(colour, []).append(name)
+        tied = [colour_members for _, colour_members in sorted(members.items()) if len(colour_members) > 1]
+        if not tied:
+            named = dict(names)
+            numbers = {'v': len(names)}  # the given names are of variables
+            for name in sorted(colours, key=colours.get):
+                numbers[kind_of(name)] = numbers.get(kind_of(name), 0) + 1
+                named[name] = f'{kind_of(name)}{numbers[kind_of(name)]}'
+            return render(node, named), named
+        return min((search(rank({other: (colour, other != name) for other, colour in colours.items()}))
+                    for name in tied[0]), key=lambda result: result[0])
+
+    if not occurrences:
+        return names
+    return search(rank({name: kind_of(name) for name in occurrences}))[1]
+
+
+def structural_hash(query: Union[str, Query], rename_placeholders: bool = True) -> str:
+    ''' Hash of the canonical text; equivalent templates written differently (also with their placeholders
+    numbered differently, unless `rename_placeholders` is off) have the same hash. '''
+    return hashlib.sha256(canonicalize(query, rename_placeholders).encode('utf-8')).hexdigest()
+
+
+class QueryIndex:
+    ''' Looks SPARQL-OWL queries up by structural hash. '''
+    def __init__(self, queries: Iterable[str] = (), rename_placeholders: bool = True):
+        self.queries = dict()  # hash -> queries with that hash, in insertion order
+        self.rename_placeholders = rename_placeholders
+        for query in queries:
+            self.add(query)
+
+    def add(self, query: str) -> str:
+        key = structural_hash(query, self.rename_placeholders)
+        equivalent = self.queries.setdefault(key, [])
+        if query not in equivalent:
+            equivalent.append(query)
+        return key
+
+    def find(self, query: str) -> List[str]:
+        ''' Indexed queries equivalent to `query`. '''
+        return self.queries.get(structural_hash(query, self.rename_placeholders), [])
+
+    def __contains__(self, query: str) -> bool:
+        return bool(self.find(query))
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check which SPARQL-OWL queries are equivalent to BigCQ templates.')
+    parser.add_argument('queries', help='CSV file with one query in the first column of every row')
+    parser.add_argument('--templates', default='../BigCQ_dataset/sparqlowl_templates_only.txt',
+                        help='file with one SPARQL-OWL template per line')
+    parser.add_argument('--report', default=None, help='CSV file to write the status of every query to')
+    parser.add_argument('--keep-placeholder-numbers', action='store_true',
+                        help='compare placeholders (<c1>, <op1>, ...) literally instead of by their role')
+    args = parser.parse_args()
+
+    rename_placeholders = not args.keep_placeholder_numbers
+    index = QueryIndex(rename_placeholders=rename_placeholders)
+    with open(args.templates) as f:
+        templates = [line.strip() for line in f if line.strip()]
+    for template in templates:
+        index.add(template)
+    print(f'Templates: {len(templates)}, structurally distinct: {len(index)}')
+
+    with open(args.queries, newline='') as f:
+        queries = [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+    statuses = dict()
+    rows = []
+    for query in queries:
+        try:
+            equivalent = index.find(query)
+            status = 'supported' if equivalent else 'not supported'
+            rows.append([query, status, canonicalize(query, rename_placeholders), ' | '.join(equivalent)])
+        except ValueError as e:
+            status = 'unparsable'
+            rows.append([query, status, str(e), ''])
+        statuses[status] = statuses.get(status, 0) + 1
+    for status, count in sorted(statuses.items()):
+        print(f'{status}: {count} / {len(queries)}')
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['query', 'status', 'canonical form or error', 'equivalent templates'])
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,99 +1,182 @@
+import hashlib
+import json
+import math
+from array import array
+from typing import Any, Dict, Optional
+
+mask64 = 2 ** 64 - 1
+
+
+def hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def mix64(first: int, second: int) -> int:
+    ''' Hash of a pair of 64-bit hashes (the splitmix64 finalizer of their combination). '''
+    value = (first ^ (second * 0x9E3779B97F4A7C15)) & mask64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & mask64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & mask64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    ''' Approximate number of distinct 64-bit hashes in 2 ** precision bytes
+    (with a standard error of about 1.04 / sqrt(2 ** precision), 0.8% for the default precision). '''
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(2 ** precision)
+
+    def add(self, hashed: int):
+        self.update((hashed,))
+
+    def update(self, hashes):
+        registers = self.registers
+        rest_bits = 64 - self.precision
+        rest_mask = (1 << rest_bits) - 1
+        for hashed in hashes:
+            # the rank is the position of the first 1 bit among the bits not used to select the register
+            rank = rest_bits - (hashed & rest_mask).bit_length() + 1
+            idx = hashed >> rest_bits
+            if rank > registers[idx]:
+                registers[idx] = rank
+
+    def __len__(self) -> int:
+        m = len(self.registers)
+        zeros = self.registers.count(0)
+        if zeros == m:
+            return 0
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in self.registers)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting is more accurate for small cardinalities
+        return round(estimate)
+
+
 class Summarizer:
-    def __init__(self, verbalization_cqs_queries_triples):
-        self.data = verbalization_cqs_queries_triples
-
-    def calc_unique_verbalizations(self, data):
-        verbalizations = [d[0].lower() for d in data]
-        return len(set(verbalizations))
-
-    def calc_number_of_unique_cqs(self, data):
-        total_cqs = []
-        for _, cqs, _ in self.data:
-            for category in cqs:
-                for cq in cqs[category]:
-                    total_cqs.append(cq.lower())
-
-        return len(set(total_cqs))
-
-    def calc_number_of_unique_queries(self, data):
-        total_queries = []
-        for _, _, queries in self.data:
-            for category in queries:
-                if queries[category]:
-                    total_queries.append(queries[category].lower())
-
-        return len(set(total_queries))
-
-    def average_queries_per_cq(self, data):
-        queries_per_cq = dict()
-
-        for _, cqs, queries in self.data:
-            for category in queries:  # ASK, SELECT_CAD, etc
-                for cq in cqs[category]:
-                    cq = cq.lower()
-                    if cq not in queries_per_cq:
-                        queries_per_cq[cq] = set()
-
-                    if queries[category]:
-                        queries_per_cq[cq].add(queries[category])
-
-        return 1.0 * sum([len(v) for k, v in queries_per_cq.items()]) / len(queries_per_cq)
-
-    def average_cqs_per_query(self, data):
-        cqs_per_query = dict()
-
-        for _, cqs, queries in self.data:
-            for category in queries:  # ASK, SELECT_CAD, etc
-                query = queries[category]
-                if query:
-                    if query not in cqs_per_query:
-                        cqs_per_query[query] = set()
-
-                    for cq in cqs[category]:
-                        cq = cq.lower()
-                        cqs_per_query[query].add(cq)
-
-        return 1.0 * sum([len(v) for k, v in cqs_per_query.items()]) / len(cqs_per_query)
-
-    def calc_number_of_unique_cqs_per_category(self, data):
-        total_cqs = dict()
-        for _, cqs, _ in self.data:
-            for category in cqs:
-                if category not in total_cqs:
-                    total_cqs[category] = set()
-                for cq in cqs[category]:
-                    total_cqs[category].add(cq.lower())
-
-        return {k: len(v) for k, v in total_cqs.items()}
-
-    def calc_number_of_unique_queries_per_category(self, data):
-        total_queries = dict()
-        for _, _, queries in self.data:
-            for category in queries:
-                if category not in total_queries:
-                    total_queries[category] = set()
-                if queries[category]:
-                    total_queries[category].add(queries[category])
-
-        return {k: len(v) for k, v in total_queries.items()}
-
-    def make_summary(self):
-        print(f"Number of unique verbalizations: {self.calc_unique_verbalizations(self.data)}")
-        print(f"Number of unique cqs: {self.calc_number_of_unique_cqs(self.data)}")
-        print(f"Number of unique queries: {self.calc_number_of_unique_queries(self.data)}")
-        print(f"Average queries per CQ: {self.average_queries_per_cq(self.data)}")
-        print(f"Average CQs per query: {self.average_cqs_per_query(self.data)}")
-        print(f"Number of unique CQs per question type: {self.calc_number_of_unique_cqs_per_category(self.data)}")
-        print(f"Number of unique queries per question type: {self.calc_number_of_unique_queries_per_category(self.data)}")
+    ''' Collects statistics of generated (verbalization, cqs, queries) records in a single pass.
+
+    Records can be passed to the constructor or consumed one by one with `add`, while they are generated.
+    Strings are replaced by integer ids and CQ-query links are kept as a single set of id pairs; the ids of CQs and
+    queries are also kept in the order they occur, for `print_cqs` and `print_queries`. With `approximate`,
+    distinct strings and links are counted by HyperLogLog sketches of fixed size instead, so memory does not grow
+    with the data; every count (and the averages derived from them) is then an estimate.
+    '''
+    def __init__(self, verbalization_cqs_queries_triples=(), approximate: bool = False, precision: int = 14):
+        self.approximate = approximate
+        self.precision = precision
+        self.ids = dict()  # string -> id, only when counting exactly
+        self.verbalizations = self.distinct()
+        self.cqs = self.distinct()
+        self.queries = self.distinct()  # lowercased
+        self.linked_cqs = self.distinct()  # CQs of question types with a query (or None)
+        self.linked_queries = self.distinct()  # not lowercased
+        self.links = self.distinct()  # (CQ, query) pairs
+        self.cq_occurrences = array('I')  # ids of lowercased CQs, only when counting exactly
+        self.query_occurrences = array('I')  # ids of queries, only when counting exactly
+        self.cqs_per_category = dict()
+        self.queries_per_category = dict()
+
+        for record in verbalization_cqs_queries_triples:
+            self.add(record)
+
+    def distinct(self):
+        return HyperLogLog(self.precision) if self.approximate else set()
+
+    def key(self, text: str) -> int:
+        if self.approximate:
+            return hash64(text)
+        return self.ids.setdefault(text, len(self.ids))
+
+    def link(self, cq: int, query: int) -> int:
+        return mix64(cq, query) if self.approximate else cq << 32 | query
+
+    def add(self, record):
+        verbalization, cqs, queries = record
+        self.verbalizations.add(self.key(verbalization.lower()))
+
+        keys = dict()
+        for category, category_cqs in cqs.items():
+            if category not in self.cqs_per_category:
+                self.cqs_per_category[category] = self.distinct()
+            keys[category] = category_keys = [self.key(cq.lower()) for cq in category_cqs]
+            self.cqs.update(category_keys)
+            if not self.approximate:
+                self.cq_occurrences.extend(category_keys)
+            self.cqs_per_category[category].update(category_keys)
+
+        for category, query in queries.items():  # ASK, SELECT_CAD, etc
+            if category not in self.queries_per_category:
+                self.queries_per_category[category] = self.distinct()
+            category_keys = keys[category]
+            self.linked_cqs.update(category_keys)
+            if query:
+                self.queries.add(self.key(query.lower()))
+                query_key = self.key(query)
+                if not self.approximate:
+                    self.query_occurrences.append(query_key)
+                self.queries_per_category[category].add(query_key)
+                self.linked_queries.add(query_key)
+                self.links.update([self.link(cq_key, query_key) for cq_key in category_keys])
+
+    def calc_unique_verbalizations(self):
+        return len(self.verbalizations)
+
+    def calc_number_of_unique_cqs(self):
+        return len(self.cqs)
+
+    def calc_number_of_unique_queries(self):
+        return len(self.queries)
+
+    def average_queries_per_cq(self):
+        return 1.0 * len(self.links) / len(self.linked_cqs) if len(self.linked_cqs) else 0.0
+
+    def average_cqs_per_query(self):
+        return 1.0 * len(self.links) / len(self.linked_queries) if len(self.linked_queries) else 0.0
+
+    def calc_number_of_unique_cqs_per_category(self):
+        return {k: len(v) for k, v in self.cqs_per_category.items()}
+
+    def calc_number_of_unique_queries_per_category(self):
+        return {k: len(v) for k, v in self.queries_per_category.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {'approximate': self.approximate,
+                'unique_verbalizations': self.calc_unique_verbalizations(),
+                'unique_cqs': self.calc_number_of_unique_cqs(),
+                'unique_queries': self.calc_number_of_unique_queries(),
+                'average_queries_per_cq': self.average_queries_per_cq(),
+                'average_cqs_per_query': self.average_cqs_per_query(),
+                'unique_cqs_per_question_type': self.calc_number_of_unique_cqs_per_category(),
+                'unique_queries_per_question_type': self.calc_number_of_unique_queries_per_category()}
+
+    def make_summary(self, json_path: Optional[str] = None):
+        ''' Print the summary and, given `json_path`, also write it there as JSON. '''
+        summary = self.summary()
+        if self.approximate:
+            print("Approximate summary (HyperLogLog estimates):")
+        print(f"Number of unique verbalizations: {summary['unique_verbalizations']}")
+        print(f"Number of unique cqs: {summary['unique_cqs']}")
+        print(f"Number of unique queries: {summary['unique_queries']}")
+        print(f"Average queries per CQ: {summary['average_queries_per_cq']}")
+        print(f"Average CQs per query: {summary['average_cqs_per_query']}")
+        print(f"Number of unique CQs per question type: {summary['unique_cqs_per_question_type']}")
+        print(f"Number of unique queries per question type: {summary['unique_queries_per_question_type']}")
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(summary, f, indent=4)
+
+    def strings(self, keys):
+        ''' Strings with the given ids, in the order of the ids. '''
+        if self.approximate:
+            raise ValueError('an approximate summary does not keep CQs and queries')
+        texts = list(self.ids)  # ids are given in insertion order
+        return [texts[key] for key in keys]
 
     def print_cqs(self):
-        for _, cqs, _ in self.data:
-            for c in cqs:
-                for cq in cqs[c]:
-                    print(cq.lower())
+        ''' Every CQ of every record (lowercased), in the order they were added. '''
+        for cq in self.strings(self.cq_occurrences):
+            print(cq)
 
     def print_queries(self):
-        for _, _, queries in self.data:
-            for c in queries:
-                if queries[c]:
-                    print(queries[c])
+        ''' Every query of every record, in the order they were added. '''
+        for query in self.strings(self.query_occurrences):
+            print(query)
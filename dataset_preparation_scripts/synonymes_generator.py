@@ -1,52 +1,101 @@
+import bisect
+import itertools
+import random
 import re
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class CompiledPattern:
+    ''' A CQ pattern split once into literal fragments and synset slots.
+
+    Every occurrence of the same synset is replaced with the same synonym,
+    e.g. "[IS] c1 [IS] c2" yields "is c1 is c2" and "are c1 are c2" only.
+    '''
+    synset_pattern = re.compile(r'\[[^\[\]]*\]')
+
+    def __init__(self, cq_pattern: str, synonymes: Dict[str, List[str]]):
+        self.cq_pattern = cq_pattern
+        # fragments[i] is either a literal string or an index of a slot
+        self.fragments = []
+        self.slots = []  # list of synonyms available in each slot
+        slot_ids = dict()
+
+        position = 0
+        for match in self.synset_pattern.finditer(cq_pattern):
+            synset = match.group()
+            if synset not in synonymes:
+                continue  # not a synset, left as is
+            if synset not in slot_ids:
+                slot_ids[synset] = len(self.slots)
+                self.slots.append(list(dict.fromkeys(synonymes[synset])))
+            self.fragments.append(cq_pattern[position:match.start()])
+            self.fragments.append(slot_ids[synset])
+            position = match.end()
+        self.fragments.append(cq_pattern[position:])
+
+    def count(self) -> int:
+        total = 1
+        for synonyms in self.slots:
+            total *= len(synonyms)
+        return total
+
+    def fill(self, choice: Tuple[str, ...]) -> str:
+        return ''.join(fragment if isinstance(fragment, str) else choice[fragment]
+                       for fragment in self.fragments)
+
+    def __iter__(self) -> Iterator[str]:
+        for choice in itertools.product(*self.slots):
+            yield self.fill(choice)
+
+    def __getitem__(self, index: int) -> str:
+        ''' Return the `index`-th expansion without generating the preceding ones (mixed-radix decoding). '''
+        choice = [None] * len(self.slots)
+        for slot in reversed(range(len(self.slots))):
+            index, digit = divmod(index, len(self.slots[slot]))
+            choice[slot] = self.slots[slot][digit]
+        return self.fill(tuple(choice))
 
 
 class SynonymesGenerator:
     def __init__(self, patterns_to_use, synonymes):
         self.cq_patterns_to_use = patterns_to_use
         self.synonymes = synonymes
-
-    @staticmethod
-    def _contains_synset(cq: str) -> bool:
-        """ Checks if phrases which should be replaced with synonymes are still
-        in the CQ. All such phrases are enclosed in [] and should be keys
-        coming from `synonymes` map """
-        return re.search(r'\[.*\]', cq) is not None
-
-    def _expand_synset(self, synset: str, cq: str) -> List[str]:
-        """ Given a synset to be replaced with all synonymes, generate n cqs with all possible
-        synset expansions.
-        Eg. synset: [is] -> is, are
-        transforms cq: [is] there X to [is there X, are there X] """
-        expanded_variants = set()
-        if re.search(synset, cq) is None:
-            # given synset does not occur in a CQ
-            return [cq]  # nothing to expand
-        else:
-            for synonym in self.synonymes[synset]:
-                expanded_variants.add(re.sub(re.escape(synset), synonym, cq))
-        return expanded_variants
+        self.compiled_patterns = [CompiledPattern(cq_pattern, synonymes) for cq_pattern in patterns_to_use]
 
     def expand_cq_pattern(self, cq_pattern: str) -> List[str]:
         """ For a given cq pattern utilizing synsets (enclosed with []),
         generate all possible materializations. """
-        expanded_variants = [cq_pattern]
-        for synset in self.synonymes:
-            # for each predefined [synset]
-            for idx in range(len(expanded_variants)):
-                # apply materialization to every from the current cq materializations
-                expanded_variants[idx] = self._expand_synset(synset, expanded_variants[idx])
-                # each single cq pattern becomes a list, thus flattening is required.
-            expanded_variants = [p for sublist in expanded_variants for p in sublist]  #flatten
+        return list(CompiledPattern(cq_pattern, self.synonymes))
+
+    def iter_expansions(self) -> Iterator[str]:
+        """ Lazily generate materializations of all patterns, pattern after pattern. """
+        for compiled_pattern in self.compiled_patterns:
+            yield from compiled_pattern
 
-        return expanded_variants
+    def count_expansions(self) -> int:
+        """ Number of materializations of all patterns, computed without generating them. """
+        return sum(compiled_pattern.count() for compiled_pattern in self.compiled_patterns)
 
     def get_all_expansions(self) -> List[str]:
-        all_variants = []
-        for cq_pattern in self.cq_patterns_to_use:
-            all_variants += self.expand_cq_pattern(cq_pattern)
-        return all_variants
+        return list(self.iter_expansions())
+
+    def sample(self, k: int, rng: Optional[random.Random] = None) -> List[str]:
+        """ Draw `k` distinct materializations uniformly at random without generating all of them.
+
+        Args:
+            k: number of materializations to draw, at most `count_expansions()`
+            rng: source of randomness, the `random` module is used by default
+        """
+        rng = rng if rng is not None else random
+        counts = [compiled_pattern.count() for compiled_pattern in self.compiled_patterns]
+        offsets = list(itertools.accumulate(counts))
+
+        samples = []
+        for index in rng.sample(range(offsets[-1] if offsets else 0), k):
+            pattern_idx = bisect.bisect_right(offsets, index)
+            start = offsets[pattern_idx] - counts[pattern_idx]
+            samples.append(self.compiled_patterns[pattern_idx][index - start])
+        return samples
 
     def get_random_expansions(self, limit: int) -> List[str]:
-        return random.sample(self.get_all_expansions(), limit)
+        return self.sample(limit)
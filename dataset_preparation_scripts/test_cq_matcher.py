@@ -0,0 +1,12 @@
+from cq_matcher import CQMatcher
+
+
+def test_placeholders_do_not_absorb_words_of_the_template():
+    matcher = CQMatcher([('SELECT ?x WHERE { ?x <op1> <c3> }', ['which c2 does op1 c3?']),
+                         ('SELECT ?x WHERE { <c2> <op1> ?x }', ['what does c2 op1?'])])
+    assert [match.bindings for match in matcher.match('Which spicy pizzas does the chef cook?')] == []
+    assert [match.bindings for match in matcher.match('What does a spicy pizza have?')] == []
+    assert [match.bindings for match in matcher.match('What does pizza has topping?')] == \
+        [{'c2': 'pizza', 'op1': 'has topping'}]
+    unbounded = CQMatcher([('SELECT ?x WHERE { ?x <op1> <c3> }', ['which c2 does op1 c3?'])], bounded_slots=False)
+    assert unbounded.match('Which spicy pizzas does the chef cook?')[0].bindings['op1'] == 'the'
@@ -0,0 +1,21 @@
+from near_duplicates import NearDuplicatePruner, candidate_probability, lsh_bands
+
+
+def test_global_scope_compares_cqs_of_the_same_question_form():
+    mapping = [('ASK WHERE { ?x <p> ?y }', ['is every c1 a kind of c2?']),
+               ('SELECT ?x WHERE { ?x <p> ?y }', ['Is every c1 a kind of c2?']),
+               ('SELECT ?x WHERE { ?x <q> ?y }', ['what c1 can do with at least 1 things?']),
+               ('SELECT ?x WHERE { ?x <r> ?y }', ['What c1 can do with at least 2 things?',
+                                                  'What c1 can do with at least 1 things'])]
+    pruner = NearDuplicatePruner('global')
+    for query, cqs in mapping:
+        pruner.index(query, cqs)
+    kept = [pruner.prune(query, cqs) for query, cqs in mapping]
+    assert kept == [cqs for _, cqs in mapping[:3]] + [['What c1 can do with at least 2 things?']]
+
+
+def test_cqs_at_the_threshold_are_very_likely_compared():
+    for threshold in [0.5, 0.8, 0.9]:
+        bands, rows = lsh_bands(64, threshold)
+        assert bands * rows == 64
+        assert candidate_probability(threshold, bands, rows) >= 0.99
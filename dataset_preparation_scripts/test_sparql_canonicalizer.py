@@ -0,0 +1,32 @@
+from sparql_canonicalizer import canonicalize, structural_hash
+
+
+def test_variables_of_alike_triples_are_named():
+    query = canonicalize('SELECT * WHERE { ?a <p> ?b . ?c <p> ?d }')
+    assert '?_' not in query
+    assert query.count('<p>') == 2  # both triples are kept
+
+
+def test_repeated_variable_is_distinguished():
+    assert structural_hash('SELECT * WHERE { ?a <p> ?b . ?c <p> ?d }') != \
+        structural_hash('SELECT * WHERE { ?a <p> ?b . ?c <p> ?c }')
+
+
+def test_order_of_triples_does_not_matter():
+    assert canonicalize('ASK { ?x <p> ?y . ?y <q> ?z . ?w <q> ?x }') == \
+        canonicalize('ASK { ?w <q> ?x . ?y <q> ?z . ?x <p> ?y }')
+
+
+def test_variable_names_do_not_matter():
+    assert canonicalize('ASK { ?x <p> [ <q> ?y ; <q> ?z ] . ?z <r> ?x }') == \
+        canonicalize('ASK { ?b <r> ?a . ?a <p> [ <q> ?b ; <q> ?c ] }')
+
+
+def test_placeholders_are_renamed_by_role():
+    query = 'SELECT ?x WHERE { ?x <op1> <c2> . <c2> rdfs:subClassOf <c1> . ?x <dp1> <dt1> }'
+    renumbered = 'SELECT ?x WHERE { <c1> rdfs:subClassOf <c3> . ?x <op2> <c1> . ?x <dp3> <dt2> }'
+    assert structural_hash(query) == structural_hash(renumbered)
+    assert structural_hash(query, rename_placeholders=False) != structural_hash(renumbered, rename_placeholders=False)
+    # placeholders of different kinds are never exchanged
+    assert structural_hash('ASK { <c1> <op1> <c2> }') != structural_hash('ASK { <c1> <c2> <op1> }')
+    assert structural_hash('ASK { <c1> rdfs:subClassOf <c2> }') != structural_hash('ASK { <c1> rdfs:subClassOf <c1> }')
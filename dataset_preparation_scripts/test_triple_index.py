@@ -0,0 +1,11 @@
+from triple_index import parse_turtle, turtle_tokens
+
+
+def test_literals_longer_than_the_lookahead_span_chunks(tmp_path):
+    path = tmp_path / 'long_labels.ttl'
+    labels = [str(idx) + 'x' * 70000 for idx in range(20)]
+    path.write_text('@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .\n' +
+                    ''.join(f'<http://example.org/c{idx}> rdfs:label "{label}" .\n' for idx, label in enumerate(labels)))
+    strings = [text for kind, text in turtle_tokens(str(path), chunk_size=1 << 16) if kind == 'string']
+    assert strings == [f'"{label}"' for label in labels]
+    assert [object for _, _, object in parse_turtle(str(path))] == [f'"{label}"' for label in labels]
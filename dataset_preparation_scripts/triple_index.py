@@ -0,0 +1,564 @@
+import argparse
+import bisect
+import gzip
+import mmap
+import os
+import re
+import resource
+import struct
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from array import array
+from typing import IO, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin
+from compact_store import string_table, to_little_endian, write_sections
+
+# Streaming ingestion of RDF (N-Triples, Turtle, RDF/XML) into a dictionary-encoded triple index.
+# Terms are kept in N-Triples syntax: <iri>, _:label, "lexical form" with an optional @language or ^^<datatype>.
+#
+# File layout (little endian): header (magic, format version, number of terms, number of triples), offsets
+# of the sections listed in `sections`, each aligned to 8 bytes. Terms are stored in id order with ids sorted
+# by term, for lookups in both directions; triples are stored three times, sorted by (subject, predicate,
+# object), (predicate, object, subject) and (object, subject, predicate), one array of ids per position.
+magic = b'BIGCQTI\x00'
+version = 1
+header = struct.Struct('<8sIIQ')
+orderings = {'spo': (0, 1, 2), 'pos': (1, 2, 0), 'osp': (2, 0, 1)}
+# the ordering whose leading positions are the bound positions of a pattern
+ordering_of = {(True, True, False): 'spo', (True, False, False): 'spo', (False, True, True): 'pos',
+               (False, True, False): 'pos', (True, False, True): 'osp', (False, False, True): 'osp'}
+sections = ['term_offsets', 'term_blob', 'sorted_term_ids'] + \
+           [f'{name}_{position}' for name in orderings for position in range(3)]
+section_table = struct.Struct('<' + 'Q' * len(sections))
+
+rdf = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+xsd = 'http://www.w3.org/2001/XMLSchema#'
+xml_namespace = '{http://www.w3.org/XML/1998/namespace}'
+# only schema (T-Box) triples and labels are indexed, annotations and data about individuals are skipped
+schema_namespaces = (rdf, 'http://www.w3.org/2000/01/rdf-schema#', 'http://www.w3.org/2002/07/owl#')
+label_predicates = ['http://www.w3.org/2004/02/skos/core#prefLabel', 'http://www.w3.org/2000/01/rdf-schema#label']
+annotation_predicates = {'<http://www.w3.org/2000/01/rdf-schema#comment>', '<http://www.w3.org/2000/01/rdf-schema#seeAlso>',
+                         '<http://www.w3.org/2000/01/rdf-schema#isDefinedBy>', '<http://www.w3.org/2002/07/owl#versionInfo>'}
+
+escapes = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+escape_pattern = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+
+
+def unescape(text: str) -> str:
+    def replace(matched) -> str:
+        code = matched.group(1) or matched.group(2)
+        return chr(int(code, 16)) if code else escapes.get(matched.group(3), matched.group(3))
+    return escape_pattern.sub(replace, text) if '\\' in text else text
+
+
+def literal_term(lexical: str, datatype: Optional[str] = None, language: Optional[str] = None) -> str:
+    ''' N-Triples form of a literal, the same literal always has the same form. '''
+    text = '"' + lexical.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r') + '"'
+    if language:
+        return text + '@' + language.lower()
+    if datatype and datatype != xsd + 'string':
+        return text + '^^<' + datatype + '>'
+    return text
+
+
+literal_pattern = re.compile(r'^"((?:[^"\\]|\\.)*)"(?:\^\^<([^>]*)>|@([A-Za-z0-9-]+))?$', re.DOTALL)
+
+
+def parse_literal(term: str) -> Tuple[str, Optional[str], Optional[str]]:
+    ''' (lexical form, datatype, language) of a literal in N-Triples form. '''
+    matched = literal_pattern.match(term)
+    if matched is None:
+        raise ValueError(f'not a literal: {term}')
+    return unescape(matched.group(1)), matched.group(2), matched.group(3)
+
+
+nt_term = r'(<[^>]*>|_:[^\s.]+(?:\.[^\s.]+)*|"(?:[^"\\]|\\.)*"(?:\^\^<[^>]*>|@[A-Za-z]+(?:-[A-Za-z0-9]+)*)?)'
+nt_line_pattern = re.compile(rf'^\s*{nt_term}\s+(<[^>]*>)\s+{nt_term}\s*\.\s*(?:#.*)?$')
+
+
+def open_rdf(path: str, binary: bool = False) -> IO:
+    ''' Open an RDF file, decompressing it if it ends with .gz. '''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb') if binary else gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'rb') if binary else open(path, encoding='utf-8')
+
+
+def parse_ntriples(path: str) -> Iterator[Tuple[str, str, str]]:
+    with open_rdf(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            matched = nt_line_pattern.match(line)
+            if matched is None:
+                raise ValueError(f'{path}:{line_number}: invalid N-Triples statement')
+            subject, predicate, object = matched.groups()
+            if object.startswith('"'):
+                object = literal_term(*parse_literal(object))
+            yield subject, predicate, object
+
+
+turtle_token_pattern = re.compile(r'''
+    (?:\s|\#[^\n]*)*
+    (?:
+      (?P<iri><[^<>"{}|^`\\\s]*>)
+    | (?P<string>"{3}(?:[^"\\]|\\.|"(?!""))*"{3}|'{3}(?:[^'\\]|\\.|'(?!''))*'{3}|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    | (?P<bnode>_:[\w-]+(?:\.[\w-]+)*)
+    | (?P<number>[+-]?(?:[0-9]+(?:\.[0-9]+)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+    | (?P<pname>(?:[A-Za-z][\w.-]*)?:(?:(?:[\w:-]|%[0-9A-Fa-f]{2}|\\.)(?:(?:[\w.:-]|%[0-9A-Fa-f]{2}|\\.)*(?:[\w:-]|%[0-9A-Fa-f]{2}|\\.))?)?)
+    | (?P<word>[A-Za-z_]\w*)
+    | (?P<lang>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+    | (?P<punct>\^\^|[\[\]().;,])
+    | (?P<end>\Z)
+    )
+''', re.VERBOSE)
+absolute_iri_pattern = re.compile(r'^[A-Za-z][\w+.-]*:')
+
+
+def turtle_tokens(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, str]]:
+    ''' Tokens of a Turtle file, read in chunks. Tokens are taken only while they end at least 4 KB before the end
+    of the buffer, or with the whole rest of the file in it, so that they can not continue in the next chunk;
+    longer tokens (e.g. long literals) are read from more chunks. '''
+    with open_rdf(path) as f:
+        buffer = ''
+        position = 0
+        at_end = False
+        while True:
+            chunk = f.read(chunk_size)
+            at_end = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            limit = len(buffer) if at_end else len(buffer) - 4096
+            while position < limit or at_end:
+                matched = turtle_token_pattern.match(buffer, position)
+                if not at_end and (matched is None or matched.end() > limit):
+                    break  # a token which may continue in the next chunk
+                if matched is None:
+                    raise ValueError(f'{path}: unexpected text {buffer[position:position + 40]!r}')
+                kind = matched.lastgroup
+                if kind == 'end':
+                    if at_end:
+                        return
+                    break
+                text = matched.group(kind)
+                if kind == 'string' and not at_end and text[:3] not in ('"""', "'''") and \
+                        buffer.startswith(('"""', "'''"), matched.start(kind)):
+                    break  # a long string continuing in the next chunk, matched as an empty string
+                position = matched.end()
+                yield kind, text
+
+
+class TurtleParser:
+    ''' Streaming Turtle parser, triples of a statement are yielded as soon as the statement is parsed. '''
+    def __init__(self, path: str):
+        self.path = path
+        self.tokens = turtle_tokens(path)
+        self.token = next(self.tokens, ('end', ''))
+        self.prefixes = dict()
+        self.base = 'file://' + os.path.abspath(path)
+        self.blank_nodes = 0
+
+    def next(self) -> Tuple[str, str]:
+        token = self.token
+        if token[0] == 'end':
+            raise ValueError(f'{self.path}: unexpected end of file')
+        self.token = next(self.tokens, ('end', ''))
+        return token
+
+    def accept(self, value: str) -> bool:
+        if self.token[1] == value and self.token[0] in ('punct', 'lang', 'word'):
+            self.next()
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise ValueError(f'{self.path}: expected {value!r} but found {self.token[1]!r}')
+
+    def new_blank_node(self) -> str:
+        self.blank_nodes += 1
+        return f'_:g{self.blank_nodes}'
+
+    def triples(self) -> Iterator[Tuple[str, str, str]]:
+        while self.token[0] != 'end':
+            if self.token in [('lang', '@prefix'), ('lang', '@base')] or \
+                    self.token[0] == 'word' and self.token[1].upper() in ('PREFIX', 'BASE'):
+                self.directive()
+                continue
+            triples = []
+            subject = self.node(triples, is_subject=True)
+            if not (subject.startswith('_:g') and self.token == ('punct', '.')):
+                self.predicate_objects(subject, triples)
+            self.expect('.')
+            yield from triples
+
+    def directive(self):
+        keyword = self.next()[1]
+        sparql_style = not keyword.startswith('@')
+        if keyword.lower().endswith('prefix'):
+            kind, name = self.next()
+            if kind != 'pname' or not name.endswith(':'):
+                raise ValueError(f'{self.path}: invalid prefix name {name!r}')
+            self.prefixes[name[:-1]] = self.iri()[1:-1]
+        else:
+            self.base = self.iri()[1:-1]
+        if not sparql_style:
+            self.expect('.')
+
+    def iri(self) -> str:
+        kind, text = self.next()
+        if kind == 'pname':
+            prefix, _, local = text.partition(':')
+            if prefix not in self.prefixes:
+                raise ValueError(f'{self.path}: undefined prefix {prefix!r}')
+            return '<' + self.prefixes[prefix] + (re.sub(r'\\(.)', r'\1', local) if '\\' in local else local) + '>'
+        if kind == 'iri':
+            iri = unescape(text[1:-1])
+            return '<' + (iri if absolute_iri_pattern.match(iri) else urljoin(self.base, iri)) + '>'
+        if kind == 'word' and text == 'a':
+            return '<' + rdf + 'type>'
+        raise ValueError(f'{self.path}: expected IRI but found {text!r}')
+
+    def predicate_objects(self, subject: str, triples: List[Tuple[str, str, str]]):
+        while True:
+            predicate = self.iri()
+            triples.append((subject, predicate, self.node(triples)))
+            while self.accept(','):
+                triples.append((subject, predicate, self.node(triples)))
+            if not self.accept(';'):
+                return
+            while self.accept(';'):
+                pass
+            if self.token in [('punct', '.'), ('punct', ']')]:
+                return
+
+    def node(self, triples: List[Tuple[str, str, str]], is_subject: bool = False) -> str:
+        kind, text = self.token
+        if kind == 'punct' and text == '[':
+            self.next()
+            node = self.new_blank_node()
+            if not self.accept(']'):
+                self.predicate_objects(node, triples)
+                self.expect(']')
+            return node
+        if kind == 'punct' and text == '(':
+            self.next()
+            items = []
+            while not self.accept(')'):
+                items.append(self.node(triples))
+            head = '<' + rdf + 'nil>'
+            for item in reversed(items):
+                node = self.new_blank_node()
+                triples.append((node, '<' + rdf + 'first>', item))
+                triples.append((node, '<' + rdf + 'rest>', head))
+                head = node
+            return head
+        if kind == 'bnode':
+            self.next()
+            return '_:b' + text[2:]
+        if kind == 'string' and not is_subject:
+            self.next()
+            quotes = 3 if text[:3] in ('"""', "'''") else 1
+            lexical = unescape(text[quotes:-quotes])
+            if self.accept('^^'):
+                return literal_term(lexical, self.iri()[1:-1])
+            if self.token[0] == 'lang':
+                return literal_term(lexical, None, self.next()[1][1:])
+            return literal_term(lexical)
+        if kind == 'number' and not is_subject:
+            self.next()
+            datatype = 'double' if 'e' in text.lower() else 'decimal' if '.' in text else 'integer'
+            return literal_term(text, xsd + datatype)
+        if kind == 'word' and text in ('true', 'false') and not is_subject:
+            self.next()
+            return literal_term(text, xsd + 'boolean')
+        return self.iri()
+
+
+def parse_turtle(path: str) -> Iterator[Tuple[str, str, str]]:
+    return TurtleParser(path).triples()
+
+
+class RdfXmlParser:
+    ''' Streaming RDF/XML parser: every top level node element is converted to triples when its end tag is read
+    and then dropped, so memory use does not depend on the size of the document. '''
+    def __init__(self, path: str):
+        self.path = path
+        self.base = 'file://' + os.path.abspath(path)
+        self.blank_nodes = 0
+        self.triples = []
+
+    def new_blank_node(self) -> str:
+        self.blank_nodes += 1
+        return f'_:g{self.blank_nodes}'
+
+    def resolve(self, reference: str) -> str:
+        return '<' + urljoin(self.base, reference) + '>'
+
+    @staticmethod
+    def tag_iri(tag: str) -> str:
+        namespace, _, local = tag[1:].partition('}')
+        return '<' + namespace + local + '>'
+
+    def parse(self) -> Iterator[Tuple[str, str, str]]:
+        depth = 0
+        root = None
+        with open_rdf(self.path, binary=True) as f:
+            for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        root = element
+                        self.base = element.get(xml_namespace + 'base', self.base)
+                    continue
+                depth -= 1
+                if depth == 1 and root.tag == '{' + rdf + '}RDF' or depth == 0 and root.tag != '{' + rdf + '}RDF':
+                    self.node_element(element)
+                    yield from self.triples
+                    self.triples = []
+                    if depth == 1:
+                        root.remove(element)
+
+    def node_element(self, element) -> str:
+        if element.get('{' + rdf + '}about') is not None:
+            subject = self.resolve(element.get('{' + rdf + '}about'))
+        elif element.get('{' + rdf + '}ID') is not None:
+            subject = self.resolve('#' + element.get('{' + rdf + '}ID'))
+        elif element.get('{' + rdf + '}nodeID') is not None:
+            subject = '_:b' + element.get('{' + rdf + '}nodeID')
+        else:
+            subject = self.new_blank_node()
+
+        if element.tag != '{' + rdf + '}Description':
+            self.triples.append((subject, '<' + rdf + 'type>', self.tag_iri(element.tag)))
+        for name, value in element.attrib.items():
+            if name == '{' + rdf + '}type':
+                self.triples.append((subject, '<' + rdf + 'type>', self.resolve(value)))
+            elif not name.startswith(('{' + rdf + '}', xml_namespace)) and name.startswith('{'):
+                self.triples.append((subject, self.tag_iri(name), literal_term(value)))
+        for child in element:
+            self.property_element(subject, child)
+        return subject
+
+    def property_element(self, subject: str, element):
+        predicate = self.tag_iri(element.tag)
+        parse_type = element.get('{' + rdf + '}parseType')
+        if parse_type == 'Resource':
+            object = self.new_blank_node()
+            for child in element:
+                self.property_element(object, child)
+        elif parse_type == 'Collection':
+            object = '<' + rdf + 'nil>'
+            for item in reversed([self.node_element(child) for child in element]):
+                node = self.new_blank_node()
+                self.triples.append((node, '<' + rdf + 'first>', item))
+                self.triples.append((node, '<' + rdf + 'rest>', object))
+                object = node
+        elif parse_type == 'Literal':
+            lexical = (element.text or '') + ''.join(ElementTree.tostring(child, 'unicode') for child in element)
+            object = literal_term(lexical, rdf + 'XMLLiteral')
+        elif element.get('{' + rdf + '}resource') is not None:
+            object = self.resolve(element.get('{' + rdf + '}resource'))
+        elif element.get('{' + rdf + '}nodeID') is not None:
+            object = '_:b' + element.get('{' + rdf + '}nodeID')
+        elif len(element):
+            object = self.node_element(element[0])
+        else:
+            datatype = element.get('{' + rdf + '}datatype')
+            object = literal_term(element.text or '', datatype and self.resolve(datatype)[1:-1],
+                                  element.get(xml_namespace + 'lang'))
+        self.triples.append((subject, predicate, object))
+
+
+def parse_rdfxml(path: str) -> Iterator[Tuple[str, str, str]]:
+    return RdfXmlParser(path).parse()
+
+
+parsers = {'ntriples': parse_ntriples, 'turtle': parse_turtle, 'rdfxml': parse_rdfxml}
+extensions = {'.nt': 'ntriples', '.ttl': 'turtle', '.rdf': 'rdfxml', '.owl': 'rdfxml', '.xml': 'rdfxml'}
+
+
+def guess_format(path: str) -> str:
+    extension = os.path.splitext(path[:-3] if path.endswith('.gz') else path)[1].lower()
+    if extension not in extensions:
+        raise ValueError(f'unknown RDF format of {path}, use one of {sorted(extensions)}')
+    return extensions[extension]
+
+
+def is_schema_triple(predicate: str) -> bool:
+    if predicate in annotation_predicates:
+        return False
+    return predicate[1:].startswith(schema_namespaces) or predicate[1:-1] in label_predicates
+
+
+def sort_triples(first: array, second: array, third: array, num_terms: int) -> Tuple[array, array, array]:
+    ''' Columns of distinct triples sorted by their first, second and third ids. Triples are counting sorted by
+    their first id into an array of positions, and only the triples sharing a first id are sorted as integers, so
+    memory use stays at a few bytes per triple. '''
+    starts = array('I', bytes(4 * (num_terms + 1)))
+    for term_id in first:
+        starts[term_id + 1] += 1
+    for term_id in range(num_terms):
+        starts[term_id + 1] += starts[term_id]
+    order = array('I', bytes(4 * len(first)))
+    free = array('I', starts)
+    for idx, term_id in enumerate(first):
+        order[free[term_id]] = idx
+        free[term_id] += 1
+    del free
+
+    columns = (array('I'), array('I'), array('I'))
+    for term_id in range(num_terms):
+        # the second and third ids of a triple packed into a single integer
+        for key in sorted({second[idx] << 32 | third[idx] for idx in order[starts[term_id]:starts[term_id + 1]]}):
+            columns[0].append(term_id)
+            columns[1].append(key >> 32)
+            columns[2].append(key & 0xFFFFFFFF)
+    return columns
+
+
+class TripleIndexBuilder:
+    ''' Dictionary-encodes triples as they are added and writes them as a triple index. '''
+    def __init__(self):
+        self.term_ids = dict()
+        self.columns = (array('I'), array('I'), array('I'))
+
+    def add(self, subject: str, predicate: str, object: str):
+        for column, term in zip(self.columns, (subject, predicate, object)):
+            column.append(self.term_ids.setdefault(term, len(self.term_ids)))
+
+    def write(self, path: str):
+        terms = list(self.term_ids)
+        term_offsets, term_blob = string_table(terms)
+        sorted_term_ids = array('I', sorted(range(len(terms)), key=lambda term_id: terms[term_id].encode('utf-8')))
+        del terms
+        contents = [to_little_endian(term_offsets), term_blob, to_little_endian(sorted_term_ids)]
+
+        for first, second, third in orderings.values():
+            contents += map(to_little_endian, sort_triples(self.columns[first], self.columns[second],
+                                                           self.columns[third], len(self.term_ids)))
+        write_sections(path, header.pack(magic, version, len(self.term_ids), len(contents[-1]) // 4),
+                       section_table, contents)
+
+
+def build_triple_index(path: str, index_path: str, rdf_format: Optional[str] = None) -> int:
+    ''' Stream schema triples of an RDF file into a triple index file, return the number of triples read. '''
+    builder = TripleIndexBuilder()
+    triples = 0
+    for subject, predicate, object in parsers[rdf_format or guess_format(path)](path):
+        triples += 1
+        if is_schema_triple(predicate):
+            builder.add(subject, predicate, object)
+    builder.write(index_path)
+    return triples
+
+
+class TripleIndex:
+    ''' Read-only, memory-mapped view of a triple index written by `build_triple_index`. '''
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        file_magic, file_version, self.num_terms, self.num_triples = header.unpack_from(self.buffer, 0)
+        if file_magic != magic or file_version != version:
+            raise ValueError(f'{path} is not a BigCQ triple index (version {version})')
+        if sys.byteorder == 'big':
+            raise ValueError('triple indexes can be memory-mapped only on little endian machines')
+
+        offsets = dict(zip(sections, section_table.unpack_from(self.buffer, header.size)))
+        self.term_offsets = self.array(offsets['term_offsets'], self.num_terms + 1, 'Q')
+        self.term_blob = self.buffer[offsets['term_blob']:]
+        self.sorted_term_ids = self.array(offsets['sorted_term_ids'], self.num_terms, 'I')
+        self.orderings = {name: tuple(self.array(offsets[f'{name}_{position}'], self.num_triples, 'I')
+                                      for position in range(3)) for name in orderings}
+
+    def array(self, offset: int, length: int, typecode: str) -> memoryview:
+        return self.buffer[offset:offset + length * array(typecode).itemsize].cast(typecode)
+
+    def term(self, term_id: int) -> str:
+        return bytes(self.term_blob[self.term_offsets[term_id]:self.term_offsets[term_id + 1]]).decode('utf-8')
+
+    def find_term(self, term: str) -> Optional[int]:
+        key = term.encode('utf-8')
+        position = bisect.bisect_left(_SortedTerms(self), key)
+        if position < self.num_terms:
+            term_id = self.sorted_term_ids[position]
+            if bytes(self.term_blob[self.term_offsets[term_id]:self.term_offsets[term_id + 1]]) == key:
+                return term_id
+        return None
+
+    def range_of(self, pattern: Tuple[Optional[int], Optional[int], Optional[int]]) -> Tuple[str, int, int]:
+        ''' The ordering whose leading positions are bound in the pattern and the range of its triples matching
+        them, found by binary search. '''
+        name = ordering_of.get(tuple(term_id is not None for term_id in pattern), 'spo')
+        start, end = 0, self.num_triples
+        for column, position in zip(self.orderings[name], orderings[name]):
+            if pattern[position] is None:
+                break
+            start = bisect.bisect_left(column, pattern[position], start, end)
+            end = bisect.bisect_right(column, pattern[position], start, end)
+        return name, start, end
+
+    def count(self, subject: Optional[int] = None, predicate: Optional[int] = None,
+              object: Optional[int] = None) -> int:
+        ''' Number of triples matching the given ids (exact unless all three are given). '''
+        _, start, end = self.range_of((subject, predicate, object))
+        return end - start
+
+    def triples(self, subject: Optional[int] = None, predicate: Optional[int] = None,
+                object: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+        ''' (subject, predicate, object) ids of triples matching the given ids. '''
+        pattern = (subject, predicate, object)
+        name, start, end = self.range_of(pattern)
+        columns = dict(zip(orderings[name], (column[start:end] for column in self.orderings[name])))
+        triples = zip(columns[0], columns[1], columns[2])
+        if None not in pattern:  # only the subject and the predicate were searched for
+            return (triple for triple in triples if triple[2] == object)
+        return triples
+
+    def close(self):
+        views = [self.term_offsets, self.term_blob, self.sorted_term_ids] + \
+                [column for columns in self.orderings.values() for column in columns] + [self.buffer]
+        for view in views:
+            view.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _SortedTerms:
+    ''' Sequence view over terms in sorted order, used to binary search them without decoding them. '''
+    def __init__(self, index: TripleIndex):
+        self.index = index
+
+    def __len__(self) -> int:
+        return self.index.num_terms
+
+    def __getitem__(self, position: int) -> bytes:
+        term_id = self.index.sorted_term_ids[position]
+        return bytes(self.index.term_blob[self.index.term_offsets[term_id]:self.index.term_offsets[term_id + 1]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index schema triples of an RDF file for materializer.py.')
+    parser.add_argument('input', help='N-Triples (.nt), Turtle (.ttl) or RDF/XML (.rdf, .owl, .xml) file, '
+                                      'optionally gzipped (.gz)')
+    parser.add_argument('--output', default=None, help='index file (default: input file with .bigcqti extension)')
+    parser.add_argument('--format', choices=sorted(parsers), default=None, help='default: guessed from the extension')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    output = args.output or os.path.splitext(args.input)[0] + '.bigcqti'
+    triples = build_triple_index(args.input, output, args.format)
+    with TripleIndex(output) as index:
+        print(f'Read {triples} triples, indexed {index.num_triples} schema triples over {index.num_terms} terms '
+              f'in {time.perf_counter() - start:.1f} s')
+    print(f'Peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
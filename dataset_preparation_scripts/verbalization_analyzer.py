@@ -1,32 +1,160 @@
-import spacy
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import re
-
-# Load English tokenizer, tagger, parser and NER
-nlp = spacy.load("en_core_web_sm")
+import profiling
+from shape_cache import ShapeCache
+
+# analyze_shape relies only on the dependency parse and token offsets,
+# so the remaining components are switched off when parsing
+unused_pipes = ['tagger', 'attribute_ruler', 'lemmatizer', 'ner']
+# English tokenizer, tagger, parser and NER, loaded on the first parse (see `get_nlp`)
+nlp = None
+
+
+def get_nlp():
+    ''' The spaCy pipeline, loaded when it is first needed: shapes found in the cache are never parsed,
+    and importing this module does not import spaCy. '''
+    global nlp
+    if nlp is None:
+        try:
+            import spacy
+        except ImportError:
+            raise ImportError('parsing verbalizations requires the `spacy` package and its `en_core_web_sm` model: '
+                              'pip install spacy && python -m spacy download en_core_web_sm')
+        with profiling.stage('analyzer.load_model'):
+            nlp = spacy.load("en_core_web_sm")
+    return nlp
 
 
 class Analyzer:
-    def __init__(self):
+    def __init__(self, cache: Optional[ShapeCache] = None):
+        self.cache = cache
         self.placeholders = {'c', 'op', 'i', 'dp', 'dt'}
+        self.placeholder_pattern = re.compile(r'\b(c|op|dp|dt|i)([0-9]+)\b')
+        # analyzed shapes of canonical verbalizations (see `canonicalize`)
+        self.canonical_shapes = dict()
         # these random verbs are used to materialize properties,
         # so that correct dependency trees can be constructed
         self.some_verbs = ['uses', 'knows', 'thinks', 'helps', 'proves',
                            'shows', 'makes', 'confirms', 'contains', 'converts']
 
     def process(self, text):
+        canonical_text, canonical2original = self.canonicalize(text)
+        analyzed_shape = self.lookup(canonical_text)
+        if analyzed_shape is None:
+            with profiling.stage('analyzer.parse', shape=canonical_text):
+                materialized_axiom, idx2verb, is_equivalence = self.prepare(canonical_text)
+                materialized_verbs_doc = get_nlp()(materialized_axiom, disable=unused_pipes)
+                analyzed_shape = self.analyze_shape(materialized_verbs_doc, idx2verb,
+                                                    materialized_axiom, is_equivalence)
+            self.canonical_shapes[canonical_text] = analyzed_shape
+            if self.cache is not None:
+                self.cache.put(canonical_text, analyzed_shape)
+        return self.restore_placeholders(analyzed_shape, canonical2original)
+
+    def process_many(self, texts: Iterable[str], batch_size: int = 256,
+                     n_process: int = 1) -> List[Dict[str, Any]]:
+        ''' Analyze many verbalizations at once, parsing them in batches with nlp.pipe.
+
+        Args:
+            texts: verbalizations of axiom shapes
+            batch_size: number of documents buffered per batch
+            n_process: number of processes used by spaCy to parse the batches
+
+        Returns:
+            analyzed shapes in the same order as the input verbalizations.
+        '''
+        with profiling.stage('analyzer.lookup'):
+            canonical = [self.canonicalize(text) for text in texts]
+            # every distinct canonical shape is parsed at most once
+            missing = [canonical_text for canonical_text in dict.fromkeys(c for c, _ in canonical)
+                       if self.lookup(canonical_text) is None]
+        profiling.count('analyzer.texts', len(canonical))
+        profiling.count('analyzer.parsed_shapes', len(missing))
+
+        if missing:
+            prepared = [self.prepare(canonical_text) for canonical_text in missing]
+            docs = iter(get_nlp().pipe((materialized_axiom for materialized_axiom, _, _ in prepared),
+                                       batch_size=batch_size, n_process=n_process,
+                                       disable=unused_pipes))
+            for canonical_text, (materialized_axiom, idx2verb, is_equivalence) in zip(missing, prepared):
+                # nlp.pipe parses lazily in batches, the first shape of every batch is charged with parsing the batch
+                with profiling.stage('analyzer.parse', shape=canonical_text):
+                    self.canonical_shapes[canonical_text] = \
+                        self.analyze_shape(next(docs), idx2verb, materialized_axiom, is_equivalence)
+
+            if self.cache is not None:
+                self.cache.put_many((canonical_text, self.canonical_shapes[canonical_text])
+                                    for canonical_text in missing)
+        return [self.restore_placeholders(self.canonical_shapes[canonical_text], canonical2original)
+                for canonical_text, canonical2original in canonical]
+
+    def lookup(self, canonical_text: str) -> Optional[Dict[str, Any]]:
+        ''' Find an already analyzed canonical shape, first in memory, then in the persistent cache. '''
+        analyzed_shape = self.canonical_shapes.get(canonical_text)
+        if analyzed_shape is None and self.cache is not None:
+            analyzed_shape = self.cache.get(canonical_text)
+            if analyzed_shape is not None:
+                self.canonical_shapes[canonical_text] = analyzed_shape
+        return analyzed_shape
+
+    def canonicalize(self, text: str) -> Tuple[str, Dict[str, str]]:
+        ''' Rename placeholders in the order of their first occurrence, so that isomorphic axiom shapes
+            share one canonical text, e.g. both "Every c1 op1 c2" and "Every c2 op3 c4" become "Every c1 op1 c2".
+            The number of digits of every id is kept, as some of the regular expressions used
+            downstream only recognize single-digit placeholders.
+
+        Args:
+            text: a verbalization of the axiom shape
+
+        Returns:
+            canonical text and a mapping from canonical ids to the original ones.
+        '''
+        original2canonical = dict()
+        counters = dict()
+
+        def rename(match):
+            original = match.group()
+            if original not in original2canonical:
+                kind, number = match.group(1), match.group(2)
+                key = (kind, len(number))
+                counters[key] = counters.get(key, 10 ** (len(number) - 1) - 1) + 1
+                original2canonical[original] = f'{kind}{counters[key]}'
+            return original2canonical[original]
+
+        canonical_text = self.placeholder_pattern.sub(rename, text)
+        return canonical_text, {canonical: original for original, canonical in original2canonical.items()}
+
+    def restore_placeholders(self, analyzed_shape: Dict[str, Any],
+                             canonical2original: Dict[str, str]) -> Dict[str, Any]:
+        ''' Map an analyzed canonical shape back to the placeholder ids of the original verbalization. '''
+        def rename(text):
+            return self.placeholder_pattern.sub(lambda match: canonical2original.get(match.group(), match.group()), text)
+
+        restored = dict(analyzed_shape)
+        restored['root_verb'] = rename(analyzed_shape['root_verb'])
+        restored['VERB'] = canonical2original.get(analyzed_shape['VERB'], analyzed_shape['VERB'])
+        restored['CAD'] = rename(analyzed_shape['CAD'])
+        restored['CAR'] = rename(analyzed_shape['CAR'])
+        restored['domain_elems'] = {canonical2original.get(elem, elem) for elem in analyzed_shape['domain_elems']}
+        restored['range_elems'] = {canonical2original.get(elem, elem) for elem in analyzed_shape['range_elems']}
+        return restored
+
+    def prepare(self, text):
+        ''' Turn a verbalization into the text that is fed to the parser.
+
+        Returns:
+            materialized axiom, mapping from property ids to verbs and a flag telling if the axiom is an equivalence.
+        '''
         # ACE materializes equivalences into 2 liners
         is_equivalence = True if len(text.split("\n")) > 1 else False
         text = text.split("\n")[0]
 
         materialized_axiom, idx2verb = self.materialize_properties(text)
-        materialized_verbs_doc = nlp(materialized_axiom)
-        return self.analyze_shape(materialized_verbs_doc, idx2verb,
-                                  materialized_axiom, is_equivalence)
+        return materialized_axiom, idx2verb, is_equivalence
 
 
     def materialize_properties(self, text):
-        properties_types = {elem for elem in self.placeholders if elem.endswith('p')}
+        properties_types = sorted(elem for elem in self.placeholders if elem.endswith('p'))
         idx2verb = dict()
 
         for property_type in properties_types:
@@ -79,7 +207,7 @@ class Analyzer:
         class_axiom_range = re.sub(r'\ba ', '', class_axiom_range) # reject "a" before class id
 
         return {
-            'root_verb': root_verb,
+            'root_verb': root_verb.text,
             'complex_domain': is_complex_domain,
             'complex_range': is_complex_range,
             'domain_elems': domain_elems,